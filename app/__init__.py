@@ -4,8 +4,11 @@ from flask_jwt_extended import JWTManager
 from flask_cors import CORS
 from flask_migrate import Migrate
 from flask_sqlalchemy import SQLAlchemy
+from werkzeug.middleware.proxy_fix import ProxyFix
 from config import config
-from app.utils.jwt_handlers import register_jwt_error_handlers
+from app.utils.jwt_handlers import (
+    register_jwt_error_handlers, register_role_claim_loader, register_token_blocklist_loader
+)
 
 # 创建扩展实例
 db = SQLAlchemy()
@@ -27,6 +30,10 @@ def create_app(config_name='default'):
     app.config.from_object(config[config_name])
     config[config_name].init_app(app)
     
+    # 部署在反向代理之后时取真实客户端 IP
+    if app.config['PROXY_FIX_X_FOR']:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_FIX_X_FOR'])
+    
     # 初始化扩展
     CORS(app, 
          resources={r"/api/*": {"origins": "*"}},
@@ -41,6 +48,40 @@ def create_app(config_name='default'):
     # 注册 JWT 错误处理器
     register_jwt_error_handlers(jwt)
     
+    # 注册 token 撤销检查
+    from app.services.token_service import token_blocklist
+    register_token_blocklist_loader(jwt, token_blocklist)
+    register_role_claim_loader(jwt)
+    
+    # 初始化日志
+    from app.utils.log import init_logging
+    init_logging(app)
+    app.logger.info('Box startup')
+    
+    # 注册 Server-Timing 计时
+    from app.utils.timing import init_server_timing
+    init_server_timing(app)
+    
+    # 登记请求线程，供采样分析器使用
+    from app.utils.profiler import init_profiler
+    init_profiler(app)
+    
+    # 注册按接口的内存分配统计
+    from app.utils.memory import init_memory_profiler
+    init_memory_profiler(app)
+    
+    # 设备列表片段缓存
+    from app.services.device_service import device_fragments
+    device_fragments.install(app)
+    
+    # 注册限流检查
+    from app.utils.ratelimit import init_rate_limiter
+    init_rate_limiter(app)
+    
+    # 注册接口隔离舱
+    from app.utils.bulkhead import init_bulkheads
+    init_bulkheads(app)
+    
     # 注册蓝图
     from .api import api_bp
     from app.api.auth import auth_bp
@@ -54,4 +95,8 @@ def create_app(config_name='default'):
     from .commands import register_commands
     register_commands(app)
     
+    # 注册响应压缩（最后注册，在其他 after_request 钩子之前执行）
+    from app.utils.compression import init_compression
+    init_compression(app)
+    
     return app
@@ -5,8 +5,18 @@ api_bp = Blueprint('api', __name__)
 from .auth import auth_bp
 from .device import device_bp
 from .dashboard import dashboard_bp
+from .group import group_bp
+from .authz import authz_bp
+from .job import job_bp
+from .debug import debug_bp
+from .batch import batch_bp
 
 # 注册子蓝图，不需要添加/api前缀，因为这个前缀已经在app/__init__.py中添加了
 api_bp.register_blueprint(auth_bp)
 api_bp.register_blueprint(device_bp)
 api_bp.register_blueprint(dashboard_bp)
+api_bp.register_blueprint(group_bp)
+api_bp.register_blueprint(authz_bp)
+api_bp.register_blueprint(job_bp)
+api_bp.register_blueprint(debug_bp)
+api_bp.register_blueprint(batch_bp)
@@ -1,14 +1,21 @@
 from flask import Blueprint, request, current_app
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
+from flask_jwt_extended import create_access_token, decode_token, get_jwt, get_jwt_identity, jwt_required
 from flask_cors import cross_origin
 from app.models.user import User
-from app.models.base import db
 from app.utils.response import Response
 from app.services.auth_service import AuthService
+from app.services.entity_cache import entity_cache
+from app.services.token_service import TokenService
+from app.utils.ndjson import parse_ndjson
+from app.utils.wire import get_body
+from app.utils.bulkhead import bulkhead
+from app.utils.ratelimit import rate_limit
 
 auth_bp = Blueprint('auth', __name__, url_prefix='/auth')
 
 @auth_bp.route('/register', methods=['POST'])
+@bulkhead('auth')
+@rate_limit('auth_register')
 @cross_origin()
 def register():
     """
@@ -36,6 +43,8 @@ def register():
         return Response.error('注册失败，请稍后重试', 500)
 
 @auth_bp.route('/login', methods=['POST'])
+@bulkhead('auth')
+@rate_limit('auth_login')
 @cross_origin()
 def login():
     """
@@ -63,39 +72,137 @@ def login():
         current_app.logger.error(f"Login error: {str(e)}")
         return Response.error('登录失败，请稍后重试', 500)
 
+@auth_bp.route('/logout', methods=['POST'])
+@jwt_required()
+def logout():
+    """
+    退出登录，撤销当前 token
+    :return:
+    """
+    try:
+        jwt_payload = get_jwt()
+        TokenService.revoke(
+            jwt_payload['jti'],
+            TokenService.expires_at(jwt_payload),
+            int(get_jwt_identity())
+        )
+        return Response.success(None, '已退出登录')
+    except Exception as e:
+        current_app.logger.error(f"Logout error: {str(e)}")
+        return Response.error('退出登录失败，请稍后重试', 500)
+
+@auth_bp.route('/tokens/revoke', methods=['POST'])
+@jwt_required()
+def revoke_token():
+    """
+    撤销指定 token（如已泄露的 token）
+
+    请求体提供 token 原文或 jti
+    :return:
+    """
+    try:
+        current_user = entity_cache.get(User, get_jwt_identity())
+        if not current_user or current_user.role != 'admin':
+            return Response.forbidden()
+        
+        data = request.get_json()
+        if not data or not (data.get('token') or data.get('jti')):
+            return Response.validation_error('缺少 token 或 jti')
+        
+        if data.get('token'):
+            try:
+                jwt_payload = decode_token(data['token'], allow_expired=True)
+            except Exception:
+                return Response.validation_error('无效的 Token')
+            revoked = TokenService.revoke(
+                jwt_payload['jti'],
+                TokenService.expires_at(jwt_payload),
+                int(jwt_payload['sub'])
+            )
+        else:
+            revoked = TokenService.revoke(data['jti'])
+        
+        if not revoked:
+            return Response.error('Token 已被撤销')
+        return Response.success(None, 'Token 已撤销')
+    except Exception as e:
+        current_app.logger.error(f"Revoke token error: {str(e)}")
+        return Response.error('撤销 Token 失败，请稍后重试', 500)
+
 @auth_bp.route('/users', methods=['GET'])
+@bulkhead('listing')
 @jwt_required()
 @cross_origin()
 def get_users():
     """
     获取用户列表
+    
+    支持 after 键集分页和 q 用户名/邮箱前缀搜索
     :return:
     """
     try:
         user_id = get_jwt_identity()
-        print(f"JWT identity: {user_id}, type: {type(user_id)}")
-        
         with current_app.app_context():
-            current_user = db.session.get(User, int(user_id))
-            print(f"Current user: {current_user}, role: {current_user.role if current_user else None}")
+            current_user = entity_cache.get(User, int(user_id))
             
             if not current_user or current_user.role != 'admin':
                 return Response.forbidden()
             
-            page = request.args.get('page', 1, type=int)
-            per_page = request.args.get('per_page', 10, type=int)
-            users, total = AuthService.get_users(page, per_page)
+            page = max(request.args.get('page', 1, type=int), 1)
+            per_page = min(max(request.args.get('per_page', 10, type=int), 1),
+                           current_app.config['USERS_MAX_PER_PAGE'])
+            users, total, next_after = AuthService.get_users(
+                page,
+                per_page,
+                after=request.args.get('after', type=int),
+                prefix=request.args.get('q', '').strip() or None
+            )
             
             return Response.success({
                 'items': [user.to_dict() for user in users],
                 'total': total,
                 'page': page,
-                'per_page': per_page
+                'per_page': per_page,
+                'next_after': next_after
             })
     except Exception as e:
         current_app.logger.error(f"Get users error: {str(e)}")
         return Response.error('获取用户列表失败，请稍后重试', 500)
 
+@auth_bp.route('/users/bulk', methods=['POST'])
+@bulkhead('bulk')
+@jwt_required()
+def bulk_create_users():
+    """
+    批量创建用户
+
+    请求体为 JSON/MessagePack/CBOR 数组（或 {"users": [...]}），也可以 application/x-ndjson 格式逐行流式上传
+    :return:
+    """
+    try:
+        current_user = entity_cache.get(User, get_jwt_identity())
+        if not current_user or current_user.role != 'admin':
+            return Response.forbidden()
+        
+        if request.mimetype == 'application/x-ndjson':
+            records = parse_ndjson(request.stream)
+        else:
+            data = get_body()
+            records = data.get('users') if isinstance(data, dict) else data
+            if not isinstance(records, list):
+                return Response.validation_error('缺少用户列表')
+        
+        items = list(AuthService.bulk_register(records))
+        created = sum(1 for item in items if item['status'] == 'created')
+        return Response.success({
+            'items': items,
+            'created': created,
+            'failed': len(items) - created
+        }, f'成功创建 {created} 个用户')
+    except Exception as e:
+        current_app.logger.error(f"Bulk create users error: {str(e)}")
+        return Response.error('批量创建用户失败，请稍后重试', 500)
+
 @auth_bp.route('/users/<int:user_id>', methods=['PUT'])
 @jwt_required()
 @cross_origin()
@@ -107,11 +214,8 @@ def update_user(user_id):
     """
     try:
         user_id_str = get_jwt_identity()
-        print(f"JWT identity: {user_id_str}, type: {type(user_id_str)}")
-        
         with current_app.app_context():
-            current_user = db.session.get(User, int(user_id_str))
-            print(f"Current user: {current_user}, role: {current_user.role if current_user else None}")
+            current_user = entity_cache.get(User, int(user_id_str))
             
             if not current_user or current_user.role != 'admin':
                 return Response.forbidden()
@@ -138,7 +242,7 @@ def get_profile():
     """
     try:
         user_id = get_jwt_identity()
-        user = db.session.get(User, int(user_id))
+        user = entity_cache.get(User, int(user_id))
         
         if not user:
             return Response.error('用户不存在', 404)
@@ -0,0 +1,48 @@
+"""权限检查相关接口"""
+from flask import Blueprint, request, current_app
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from app.models.user import User
+from app.utils.response import Response
+from app.utils.bulkhead import bulkhead
+from app.utils.wire import get_body
+from app.services.authz_service import AuthzService
+from app.services.entity_cache import entity_cache
+
+authz_bp = Blueprint('authz', __name__, url_prefix='/authz')
+
+
+@authz_bp.route('/check', methods=['POST'])
+@bulkhead('bulk')
+@jwt_required()
+def check():
+    """
+    批量检查用户对设备的权限
+    :return:
+    """
+    current_user = entity_cache.get(User, get_jwt_identity())
+    if not current_user or current_user.role != 'admin':
+        return Response.forbidden()
+    
+    data = get_body()
+    if not data or not isinstance(data.get('checks'), list):
+        return Response.validation_error('缺少检查项')
+    
+    max_items = current_app.config['AUTHZ_CHECK_MAX_ITEMS']
+    if len(data['checks']) > max_items:
+        return Response.validation_error(f'单次最多检查 {max_items} 项')
+    
+    try:
+        checks = AuthzService.parse_checks(data['checks'])
+    except ValueError as e:
+        return Response.validation_error(str(e))
+    
+    bits = AuthzService.check(checks)
+    result = {
+        'count': len(checks),
+        'allowed': sum(bin(byte).count('1') for byte in bits)
+    }
+    if request.args.get('format') == 'array':
+        result['results'] = [(bits[i >> 3] >> (i & 7)) & 1 for i in range(len(checks))]
+    else:
+        result['bitset'] = AuthzService.encode_bits(bits)
+    return Response.success(result)
@@ -0,0 +1,121 @@
+"""批量请求接口"""
+from flask import Blueprint, current_app, g, request
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from werkzeug.test import EnvironBuilder
+from app.models.user import User
+from app.models.base import db
+from app.utils import wire
+from app.utils.bulkhead import bulkhead
+from app.utils.ratelimit import rate_limit
+from app.utils.response import Response
+from app.utils.wire import get_body
+from app.services.entity_cache import entity_cache
+
+batch_bp = Blueprint('batch', __name__, url_prefix='/batch')
+
+BATCH_METHODS = {'GET', 'POST', 'PUT', 'DELETE'}
+
+# 子请求 environ 中的标记，按编码后的路径等方式绕过 _validate 的嵌套请求在 batch 中拒绝
+ENVIRON_KEY = 'box.batch'
+
+
+def _validate(item) -> str:
+    """检查子请求格式，返回错误信息，格式正确时返回空字符串"""
+    if not isinstance(item, dict) or not isinstance(item.get('path'), str):
+        return '子请求缺少 path'
+    if not item['path'].startswith('/') or item['path'].split('?')[0].rstrip('/') == '/batch':
+        return f"不支持的子请求路径: {item['path']}"
+    if str(item.get('method', 'GET')).upper() not in BATCH_METHODS:
+        return f"不支持的子请求方法: {item.get('method')}"
+    return ''
+
+
+def _dispatch(item: dict, index: int) -> dict:
+    """在当前 worker 内执行一个子请求，返回状态码和响应体
+
+    GET 子请求在外层请求的应用上下文中执行，共享数据库会话：外层已加载的当前用户等对象直接从会话中取得，
+    各子请求读到同一个事务快照。其他方法使用独立的应用上下文和会话，失败时未提交的修改不会被之后的子请求提交。
+    """
+    app = current_app._get_current_object()
+    method = str(item.get('method', 'GET')).upper()
+    path, _, query = item['path'].partition('?')
+    headers = {
+        'Authorization': request.headers['Authorization'],
+        'Accept': wire.JSON,
+        'X-Request-ID': f"{getattr(g, 'request_id', '')[:56]}.{index}",
+    }
+    builder = EnvironBuilder(
+        path='/api' + path, method=method, query_string=query, headers=headers,
+        json=item['body'] if 'body' in item else None,
+        environ_base={'REMOTE_ADDR': request.remote_addr}
+    )
+    try:
+        environ = builder.get_environ()
+    finally:
+        builder.close()
+    environ[ENVIRON_KEY] = True
+
+    shared = method == 'GET'
+    # 子请求的钩子会改写 g 中的请求 ID、token 等，执行后恢复外层请求的值
+    saved = g.__dict__.copy()
+    try:
+        if shared:
+            status, body = _run(app, environ)
+        else:
+            with app.app_context():
+                status, body = _run(app, environ)
+            # 结束外层会话的只读事务，之后的 GET 子请求能读到刚提交的修改
+            db.session.rollback()
+    finally:
+        g.__dict__.clear()
+        g.__dict__.update(saved)
+
+    result = {'status': status, 'body': body}
+    if 'id' in item:
+        result['id'] = item['id']
+    return result
+
+
+def _run(app, environ):
+    with app.request_context(environ):
+        try:
+            response = app.full_dispatch_request()
+        except Exception as e:
+            current_app.logger.error(f"Batch sub-request error: {str(e)}")
+            response = app.make_response(Response.error('子请求执行失败', 500))
+        body = response.get_json(silent=True)
+        if body is None:
+            body = response.get_data(as_text=True)
+        return response.status_code, body
+
+
+@batch_bp.route('', methods=['POST'])
+@bulkhead('batch')
+@rate_limit('batch')
+@jwt_required()
+def batch():
+    """
+    依次执行多个子请求，一次返回全部结果
+
+    子请求使用外层请求的 token，按顺序执行，某个子请求失败不影响其他子请求
+    :return:
+    """
+    if request.environ.get(ENVIRON_KEY):
+        return Response.validation_error('不支持嵌套的批量请求')
+    current_user = entity_cache.get(User, get_jwt_identity())
+    if not current_user:
+        return Response.not_found('用户不存在')
+
+    data = get_body()
+    items = data.get('requests') if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        return Response.validation_error('缺少子请求列表')
+    max_items = current_app.config['BATCH_MAX_REQUESTS']
+    if len(items) > max_items:
+        return Response.validation_error(f'单次最多 {max_items} 个子请求')
+    for item in items:
+        error = _validate(item)
+        if error:
+            return Response.validation_error(error)
+
+    return Response.success({'responses': [_dispatch(item, index) for index, item in enumerate(items)]})
@@ -2,9 +2,12 @@
 from flask import Blueprint
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from sqlalchemy import func
-from app.models.device import Device, DeviceUserAssociation
+from app.models.device import Device
 from app.models.user import User
 from app.utils.response import Response
+from app.services.device_service import DeviceService
+from app.services.entity_cache import entity_cache
+from app.utils.singleflight import single_flight
 
 dashboard_bp = Blueprint('dashboard', __name__, url_prefix='/dashboard')
 
@@ -19,47 +22,33 @@ def get_statistics():
     try:
         # 获取当前用户
         current_user_id = get_jwt_identity()
-        current_user = User.query.get(current_user_id)
+        current_user = entity_cache.get(User, current_user_id)
         
-        if current_user.role == 'admin':
-            # 管理员可以看到所有设备
-            device_count = Device.query.count()
-        else:
-            # 普通用户只能看到有权限的设备
-            device_count = Device.query.join(
-                DeviceUserAssociation,
-                Device.id == DeviceUserAssociation.device_id
-            ).filter(
-                DeviceUserAssociation.user_id == current_user_id
-            ).distinct().count()
+        is_admin = current_user.role == 'admin'
         
-        # 获取设备状态统计
-        if current_user.role == 'admin':
-           status_stats = dict(
-                Device.query.with_entities(
-                    Device.status,
-                    func.count(Device.id)
-                ).group_by(Device.status).all()
-            ) 
-        else:
+        def compute():
+            # 管理员可以看到所有设备，普通用户只能看到直接或通过分组被授权的设备
+            query = DeviceService.scoped_query(current_user.id, is_admin)
+            device_count = query.order_by(None).count()
+            
+            # 获取设备状态统计
             status_stats = dict(
-                Device.query.join(
-                    DeviceUserAssociation,
-                    Device.id == DeviceUserAssociation.device_id
-                ).filter(
-                    DeviceUserAssociation.user_id == current_user_id
-                ).with_entities(
+                query.with_entities(
                     Device.status,
                     func.count(Device.id)
                 ).group_by(Device.status).all()
             )
-        
-        return Response.success({
-            'deviceCount': device_count,
-            'statusStats': {
-                'online': status_stats.get('online', 0),
-                'offline': status_stats.get('offline', 0)
+            
+            return {
+                'deviceCount': device_count,
+                'statusStats': {
+                    'online': status_stats.get('online', 0),
+                    'offline': status_stats.get('offline', 0)
+                }
             }
-        })
+        
+        # 同时打开仪表盘的请求共享一次统计查询，普通用户按各自的授权范围区分
+        scope = 'admin' if is_admin else f'user:{current_user.id}'
+        return Response.success(single_flight.do(f'dashboard:statistics:{scope}', compute))
     except Exception as e:
         return Response.error(str(e), 500)
@@ -0,0 +1,80 @@
+"""运行时诊断接口"""
+import threading
+from flask import Blueprint, current_app, request
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from app.models.user import User
+from app.utils import metrics, profiler
+from app.utils.memory import memory_stats
+from app.utils.response import Response
+from app.services.entity_cache import entity_cache
+
+debug_bp = Blueprint('debug', __name__, url_prefix='/_debug')
+
+
+@debug_bp.route('/profile', methods=['POST'])
+@jwt_required()
+def profile():
+    """
+    对当前 worker 进程采样 seconds 秒，返回折叠栈文本
+
+    每个调用栈以接口名为根帧；请求在采样期间一直占用当前线程
+    :return:
+    """
+    current_user = entity_cache.get(User, get_jwt_identity())
+    if not current_user or current_user.role != 'admin':
+        return Response.forbidden()
+
+    seconds = request.args.get('seconds', 10, type=float)
+    max_seconds = current_app.config['PROFILER_MAX_SECONDS']
+    if not 0 < seconds <= max_seconds:
+        return Response.validation_error(f'seconds 必须在 0 到 {max_seconds} 之间')
+    if not profiler.try_acquire():
+        return Response.error('已有采样正在进行，请稍后重试', 409)
+
+    try:
+        sampler = profiler.SamplingProfiler(
+            current_app.config['PROFILER_INTERVAL'],
+            current_app.config['PROFILER_MAX_OVERHEAD'],
+            current_app.config['PROFILER_MAX_DEPTH']
+        )
+        sampler.run(seconds, exclude_thread=threading.get_ident())
+    finally:
+        profiler.release()
+
+    response = current_app.response_class(sampler.collapsed(), mimetype='text/plain')
+    response.headers['X-Profile-Samples'] = str(sampler.samples)
+    response.headers['X-Profile-Overhead'] = f'{sampler.sampling_time / max(sampler.elapsed, 1e-9):.4f}'
+    return response
+
+
+@debug_bp.route('/memory', methods=['GET'])
+@jwt_required()
+def memory():
+    """
+    按接口汇总的内存分配统计
+
+    需开启 MEMORY_PROFILING_ENABLED；reset=1 时返回后清空统计
+    :return:
+    """
+    current_user = entity_cache.get(User, get_jwt_identity())
+    if not current_user or current_user.role != 'admin':
+        return Response.forbidden()
+
+    summary = memory_stats.summary()
+    if request.args.get('reset') == '1':
+        memory_stats.clear()
+    return Response.success(summary)
+
+
+@debug_bp.route('/metrics', methods=['GET'])
+@jwt_required()
+def get_metrics():
+    """
+    Prometheus 文本格式的运行指标
+    :return:
+    """
+    current_user = entity_cache.get(User, get_jwt_identity())
+    if not current_user or current_user.role != 'admin':
+        return Response.forbidden()
+
+    return current_app.response_class(metrics.render(), mimetype='text/plain; version=0.0.4')
@@ -1,10 +1,21 @@
-from flask import Blueprint, request
+from flask import Blueprint, request, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app.models.user import User
 from app.models.device import Device, DeviceUserAssociation
 from app.models.base import db
 from app.utils.response import Response
-from app.services.device_service import DeviceService
+from app.services.device_service import DeviceService, DuplicateDeviceError, device_fragments
+from app.services.entity_cache import entity_cache
+from app.services.search_service import SearchService
+from app.services.purge_service import PurgeService
+from app.services.job_service import JobService
+from app.services.change_service import ChangeService, CursorError, CursorExpired
+from app.models.device import DevicePurge
+from app.utils.device_filter import FilterError, parse_filter, terms_from_args
+from app.utils.bulkhead import bulkhead
+from app.utils.ratelimit import rate_limit
+from app.utils.singleflight import single_flight
+from app.utils.wire import get_body, negotiate
 
 device_bp = Blueprint('device', __name__, url_prefix='/devices')
 
@@ -16,31 +27,208 @@ def create_device():
     创建设备
     :return:
     """
-    current_user = db.session.get(User, get_jwt_identity())
+    current_user = entity_cache.get(User, get_jwt_identity())
     if not current_user or current_user.role != 'admin':
         return Response.forbidden()
     
     data = request.get_json()
-    if not data or not all(k in data for k in ('name', 'ip_address', 'mac_address')):
+    if not isinstance(data, dict) or not all(k in data for k in ('name', 'ip_address', 'mac_address')):
         return Response.validation_error('缺少必要字段')
     
-    device = DeviceService.create_device(data)
+    try:
+        device = DeviceService.create_device(data)
+    except DuplicateDeviceError as e:
+        return Response.error(str(e))
+    except ValueError as e:
+        return Response.validation_error(str(e))
     return Response.success(device.to_dict(), '设备创建成功')
 
 
 @device_bp.route('', methods=['GET'])
+@bulkhead('listing')
+@rate_limit('device_query')
 @jwt_required()
 def get_devices():
     """
     获取设备列表
+    
+    支持 filter 过滤表达式，以及 name/status/tags[] 查询参数
     :return:
     """
-    current_user = db.session.get(User, get_jwt_identity())
+    current_user = entity_cache.get(User, get_jwt_identity())
     if not current_user:
         return Response.not_found('用户不存在')
     
-    devices = DeviceService.get_devices(current_user.id, current_user.role == 'admin')
-    return Response.success([device.to_dict() for device in devices])
+    def compute():
+        terms = parse_filter(request.args.get('filter', '')) + terms_from_args(request.args)
+        devices = DeviceService.get_devices(current_user.id, current_user.role == 'admin', terms)
+        return {
+            'items': device_fragments.render(devices),
+            'total': len(devices)
+        }
+    
+    try:
+        if current_user.role == 'admin':
+            # 管理员的全量列表开销最大，相同查询参数和响应格式的并发请求共享一次查询与序列化
+            args = sorted(request.args.items(multi=True))
+            data = single_flight.do(f'devices:admin:{negotiate()}:{args}', compute)
+        else:
+            data = compute()
+    except FilterError as e:
+        return Response.validation_error(str(e))
+    
+    return Response.success(data)
+
+
+@device_bp.route('/search', methods=['GET'])
+@bulkhead('listing')
+@rate_limit('device_query')
+@jwt_required()
+def search_devices():
+    """
+    按名称、描述、MAC、IP 片段搜索设备
+    :return:
+    """
+    current_user = entity_cache.get(User, get_jwt_identity())
+    if not current_user:
+        return Response.not_found('用户不存在')
+    
+    keyword = request.args.get('q', '').strip()
+    limit = min(request.args.get('limit', 20, type=int), current_app.config['SEARCH_MAX_LIMIT'])
+    try:
+        results = SearchService.search(keyword, current_user.id, current_user.role == 'admin', max(limit, 1))
+    except ValueError as e:
+        return Response.validation_error(str(e))
+    
+    items = []
+    for device, score in results:
+        item = device.to_dict()
+        item['score'] = score
+        items.append(item)
+    return Response.success({'items': items, 'total': len(items)})
+
+
+@device_bp.route('/subnets', methods=['GET'])
+@bulkhead('listing')
+@jwt_required()
+def get_subnet_summary():
+    """
+    按网段统计设备数量
+    :return:
+    """
+    current_user = entity_cache.get(User, get_jwt_identity())
+    if not current_user:
+        return Response.not_found('用户不存在')
+    
+    try:
+        items = DeviceService.subnet_summary(
+            current_user.id,
+            current_user.role == 'admin',
+            prefixlen=request.args.get('prefix', 24, type=int),
+            version=6 if request.args.get('version') == '6' else 4
+        )
+    except ValueError as e:
+        return Response.validation_error(str(e))
+    return Response.success({'items': items, 'total': len(items)})
+
+
+@device_bp.route('/changes', methods=['GET'])
+@bulkhead('listing')
+@jwt_required()
+def get_device_changes():
+    """
+    增量获取设备与授权变更
+
+    不带 since 时只返回当前位置的游标
+    :return:
+    """
+    current_user = entity_cache.get(User, get_jwt_identity())
+    if not current_user or current_user.role != 'admin':
+        return Response.forbidden()
+    
+    cursor = request.args.get('since')
+    if not cursor:
+        return Response.success({'items': [], 'cursor': ChangeService.head_cursor(), 'has_more': False})
+    
+    max_limit = current_app.config['CHANGE_FEED_MAX_LIMIT']
+    limit = min(max(request.args.get('limit', max_limit, type=int), 1), max_limit)
+    try:
+        items, cursor, has_more = ChangeService.list_changes(cursor, limit)
+    except CursorError as e:
+        return Response.validation_error(str(e))
+    except CursorExpired as e:
+        return Response.error(str(e), 410)
+    
+    return Response.success({'items': items, 'cursor': cursor, 'has_more': has_more})
+
+
+@device_bp.route('/by-mac/<mac>', methods=['GET'])
+@jwt_required()
+def get_device_by_mac(mac):
+    """
+    按 MAC 地址查找设备
+    :param mac:
+    :return:
+    """
+    current_user = entity_cache.get(User, get_jwt_identity())
+    if not current_user:
+        return Response.not_found('用户不存在')
+    
+    try:
+        device = DeviceService.get_device_by_mac(mac, current_user.id, current_user.role == 'admin')
+    except ValueError as e:
+        return Response.validation_error(str(e))
+    if not device:
+        return Response.not_found('设备不存在')
+    
+    return Response.success(device.to_dict())
+
+
+@device_bp.route('/by-mac', methods=['POST'])
+@bulkhead('bulk')
+@jwt_required()
+def resolve_macs():
+    """
+    批量将 MAC 地址解析为设备 ID
+    :return:
+    """
+    current_user = entity_cache.get(User, get_jwt_identity())
+    if not current_user:
+        return Response.not_found('用户不存在')
+    
+    data = get_body()
+    if not isinstance(data, dict) or not isinstance(data.get('macs'), list):
+        return Response.validation_error('缺少MAC地址列表')
+    if not all(isinstance(mac, str) for mac in data['macs']):
+        return Response.validation_error('MAC地址必须是字符串')
+    
+    if len(data['macs']) > current_app.config['MAC_LOOKUP_MAX_ITEMS']:
+        return Response.validation_error(f"单次最多查询 {current_app.config['MAC_LOOKUP_MAX_ITEMS']} 个MAC地址")
+    
+    items = DeviceService.resolve_macs(data['macs'], current_user.id, current_user.role == 'admin')
+    return Response.success({
+        'items': items,
+        'found': sum(1 for device_id in items.values() if device_id is not None)
+    })
+
+
+@device_bp.route('/<int:device_id>', methods=['GET'])
+@jwt_required()
+def get_device(device_id):
+    """
+    获取设备详情
+    :param device_id:
+    :return:
+    """
+    current_user = entity_cache.get(User, get_jwt_identity())
+    if not current_user:
+        return Response.not_found('用户不存在')
+    
+    device = DeviceService.get_device(device_id, current_user.id, current_user.role == 'admin')
+    if not device:
+        return Response.not_found('设备不存在')
+    
+    return Response.success(device.to_dict())
 
 
 @device_bp.route('/<int:device_id>', methods=['PUT'])
@@ -51,15 +239,20 @@ def update_device(device_id):
     :param device_id:
     :return:
     """
-    current_user = db.session.get(User, get_jwt_identity())
+    current_user = entity_cache.get(User, get_jwt_identity())
     if not current_user or current_user.role != 'admin':
         return Response.forbidden()
     
     data = request.get_json()
-    if not data:
+    if not data or not isinstance(data, dict):
         return Response.validation_error('没有提供更新数据')
     
-    device = DeviceService.update_device(device_id, data)
+    try:
+        device = DeviceService.update_device(device_id, data)
+    except DuplicateDeviceError as e:
+        return Response.error(str(e))
+    except ValueError as e:
+        return Response.validation_error(str(e))
     if not device:
         return Response.not_found('设备不存在')
     
@@ -74,7 +267,7 @@ def authorize_device(device_id):
     :param device_id:
     :return:
     """
-    current_user = db.session.get(User, get_jwt_identity())
+    current_user = entity_cache.get(User, get_jwt_identity())
     if not current_user or current_user.role != 'admin':
         return Response.forbidden()
     
@@ -95,30 +288,151 @@ def authorize_device(device_id):
 
 
 @device_bp.route('/batch_authorize', methods=['POST'])
+@bulkhead('bulk')
 @jwt_required()
 def batch_authorize_by_tags():
     """
     根据标签批量授权设备
     :return:
     """
-    current_user = db.session.get(User, get_jwt_identity())
+    current_user = entity_cache.get(User, get_jwt_identity())
     if not current_user or current_user.role != 'admin':
         return Response.forbidden()
     
-    data = request.get_json()
-    if not data or not all(k in data for k in ('tags', 'user_id')):
+    data = get_body()
+    if not data or 'user_id' not in data:
         return Response.validation_error('缺少必要字段')
     
-    if not data['tags']:
-        return Response.validation_error('没有提供标签')
+    if not data.get('tags') and not data.get('cidr'):
+        return Response.validation_error('没有提供标签或网段')
+    
+    try:
+        total = DeviceService.batch_authorize_query(data.get('tags') or [], data.get('cidr')).count()
+    except ValueError as e:
+        return Response.validation_error(str(e))
     
-    associations = DeviceService.batch_authorize_by_tags(
-        tags=data['tags'],
+    # 匹配设备较多或客户端要求异步时转为后台任务
+    if total > current_app.config['BATCH_AUTHORIZE_INLINE_MAX'] or \
+            'respond-async' in request.headers.get('Prefer', ''):
+        job = JobService.enqueue('batch_authorize', {
+            'tags': data.get('tags') or [],
+            'user_id': data['user_id'],
+            'permission_type': data.get('permission_type', 'read'),
+            'cidr': data.get('cidr'),
+        }, current_user.id, total=total)
+        return Response.accepted(job.to_dict(), '批量授权任务已创建')
+    
+    count = DeviceService.batch_authorize_by_tags(
+        tags=data.get('tags') or [],
         user_id=data['user_id'],
-        permission_type=data.get('permission_type', 'read')
+        permission_type=data.get('permission_type', 'read'),
+        cidr=data.get('cidr')
     )
     
     return Response.success(
-        {'count': len(associations)},
-        f'成功授权 {len(associations)} 个设备'
+        {'count': count},
+        f'成功授权 {count} 个设备'
     )
+
+
+@device_bp.route('/<int:device_id>', methods=['DELETE'])
+@jwt_required()
+def delete_device(device_id):
+    """
+    删除设备及其授权记录
+    :param device_id:
+    :return:
+    """
+    current_user = entity_cache.get(User, get_jwt_identity())
+    if not current_user or current_user.role != 'admin':
+        return Response.forbidden()
+    
+    if not DeviceService.delete_device(device_id):
+        return Response.not_found('设备不存在')
+    
+    return Response.success(None, '设备删除成功')
+
+
+@device_bp.route('/purges', methods=['POST'])
+@bulkhead('bulk')
+@jwt_required()
+def create_purge():
+    """
+    按过滤条件批量删除设备（由后台任务分块执行）
+    :return:
+    """
+    current_user = entity_cache.get(User, get_jwt_identity())
+    if not current_user or current_user.role != 'admin':
+        return Response.forbidden()
+    
+    data = request.get_json()
+    if not data or not data.get('filter'):
+        return Response.validation_error('缺少过滤条件')
+    
+    purge, error = PurgeService.create(data['filter'], current_user.id)
+    if error:
+        return Response.validation_error(error)
+    
+    PurgeService.start(purge.id)
+    return Response.accepted(purge.to_dict(), '批量删除任务已创建')
+
+
+@device_bp.route('/purges/<int:purge_id>', methods=['GET'])
+@jwt_required()
+def get_purge(purge_id):
+    """
+    查询批量删除进度
+    :param purge_id:
+    :return:
+    """
+    current_user = entity_cache.get(User, get_jwt_identity())
+    if not current_user or current_user.role != 'admin':
+        return Response.forbidden()
+    
+    purge = db.session.get(DevicePurge, purge_id)
+    if not purge:
+        return Response.not_found('任务不存在')
+    
+    return Response.success(purge.to_dict())
+
+
+@device_bp.route('/purges/<int:purge_id>/resume', methods=['POST'])
+@jwt_required()
+def resume_purge(purge_id):
+    """
+    从游标处继续执行中断或失败的批量删除
+    :param purge_id:
+    :return:
+    """
+    current_user = entity_cache.get(User, get_jwt_identity())
+    if not current_user or current_user.role != 'admin':
+        return Response.forbidden()
+    
+    purge = db.session.get(DevicePurge, purge_id)
+    if not purge:
+        return Response.not_found('任务不存在')
+    if purge.status not in ('pending', 'running', 'failed'):
+        return Response.error('任务已结束')
+    if not PurgeService.start(purge.id):
+        return Response.error('任务正在执行')
+    
+    return Response.accepted(purge.to_dict(), '批量删除任务已继续')
+
+
+@device_bp.route('/purges/<int:purge_id>/cancel', methods=['POST'])
+@jwt_required()
+def cancel_purge(purge_id):
+    """
+    取消批量删除
+    :param purge_id:
+    :return:
+    """
+    current_user = entity_cache.get(User, get_jwt_identity())
+    if not current_user or current_user.role != 'admin':
+        return Response.forbidden()
+    
+    purge, error = PurgeService.cancel(purge_id)
+    if error:
+        return Response.error(error)
+    
+    return Response.success(purge.to_dict(), '批量删除任务已取消')
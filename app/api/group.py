@@ -0,0 +1,179 @@
+"""分组授权相关接口"""
+from flask import Blueprint, request
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from app.models.user import User
+from app.models.group import DeviceGroup, DeviceGroupMember, GroupGrant, UserGroup, UserGroupMember
+from app.models.base import db
+from app.utils.response import Response
+from app.utils.device_filter import FilterError, parse_filter
+from app.utils.wire import get_body
+from app.services.group_service import GroupService
+from app.services.entity_cache import entity_cache
+
+group_bp = Blueprint('group', __name__, url_prefix='/groups')
+
+# 分组类型 -> (分组模型, 成员模型)
+GROUP_MODELS = {
+    'devices': (DeviceGroup, DeviceGroupMember),
+    'users': (UserGroup, UserGroupMember),
+}
+
+
+@group_bp.route('/<any(devices, users):kind>', methods=['GET'])
+@jwt_required()
+def list_groups(kind):
+    """
+    获取设备组或用户组列表
+    :param kind:
+    :return:
+    """
+    current_user = entity_cache.get(User, get_jwt_identity())
+    if not current_user or current_user.role != 'admin':
+        return Response.forbidden()
+
+    items = GroupService.list_groups(*GROUP_MODELS[kind])
+    return Response.success({'items': items, 'total': len(items)})
+
+
+@group_bp.route('/<any(devices, users):kind>', methods=['POST'])
+@jwt_required()
+def create_group(kind):
+    """
+    创建设备组或用户组
+    :param kind:
+    :return:
+    """
+    current_user = entity_cache.get(User, get_jwt_identity())
+    if not current_user or current_user.role != 'admin':
+        return Response.forbidden()
+
+    data = request.get_json()
+    if not data or not data.get('name'):
+        return Response.validation_error('缺少分组名称')
+
+    group, error = GroupService.create_group(GROUP_MODELS[kind][0], data['name'], data.get('description', ''))
+    if error:
+        return Response.error(error)
+
+    return Response.success(group.to_dict(), '分组创建成功')
+
+
+@group_bp.route('/devices/<int:group_id>/members', methods=['POST', 'DELETE'])
+@jwt_required()
+def update_device_group_members(group_id):
+    """
+    添加或移除设备组成员
+
+    添加时支持 device_ids 或 filter 过滤表达式
+    :param group_id:
+    :return:
+    """
+    current_user = entity_cache.get(User, get_jwt_identity())
+    if not current_user or current_user.role != 'admin':
+        return Response.forbidden()
+
+    if not db.session.get(DeviceGroup, group_id):
+        return Response.not_found('设备组不存在')
+
+    data = get_body() or {}
+    if request.method == 'DELETE':
+        if not data.get('device_ids'):
+            return Response.validation_error('缺少设备ID')
+        count = GroupService.remove_devices(group_id, data['device_ids'])
+        return Response.success({'count': count}, f'已移除 {count} 个设备')
+
+    try:
+        count = GroupService.add_devices(
+            group_id,
+            device_ids=data.get('device_ids'),
+            terms=parse_filter(data.get('filter', ''))
+        )
+    except FilterError as e:
+        return Response.validation_error(str(e))
+    return Response.success({'count': count}, f'已添加 {count} 个设备')
+
+
+@group_bp.route('/users/<int:group_id>/members', methods=['POST', 'DELETE'])
+@jwt_required()
+def update_user_group_members(group_id):
+    """
+    添加或移除用户组成员
+    :param group_id:
+    :return:
+    """
+    current_user = entity_cache.get(User, get_jwt_identity())
+    if not current_user or current_user.role != 'admin':
+        return Response.forbidden()
+
+    if not db.session.get(UserGroup, group_id):
+        return Response.not_found('用户组不存在')
+
+    data = get_body()
+    if not data or not data.get('user_ids'):
+        return Response.validation_error('缺少用户ID')
+
+    if request.method == 'DELETE':
+        count = GroupService.remove_users(group_id, data['user_ids'])
+        return Response.success({'count': count}, f'已移除 {count} 个用户')
+
+    count = GroupService.add_users(group_id, data['user_ids'])
+    return Response.success({'count': count}, f'已添加 {count} 个用户')
+
+
+@group_bp.route('/grants', methods=['GET'])
+@jwt_required()
+def list_grants():
+    """
+    获取分组授权列表
+    :return:
+    """
+    current_user = entity_cache.get(User, get_jwt_identity())
+    if not current_user or current_user.role != 'admin':
+        return Response.forbidden()
+
+    items = [grant.to_dict() for grant in GroupGrant.query.order_by(GroupGrant.id).all()]
+    return Response.success({'items': items, 'total': len(items)})
+
+
+@group_bp.route('/grants', methods=['POST'])
+@jwt_required()
+def create_grant():
+    """
+    授权用户组访问设备组
+    :return:
+    """
+    current_user = entity_cache.get(User, get_jwt_identity())
+    if not current_user or current_user.role != 'admin':
+        return Response.forbidden()
+
+    data = request.get_json()
+    if not data or not all(k in data for k in ('user_group_id', 'device_group_id')):
+        return Response.validation_error('缺少必要字段')
+
+    grant, error = GroupService.grant(
+        user_group_id=data['user_group_id'],
+        device_group_id=data['device_group_id'],
+        permission_type=data.get('permission_type', 'read')
+    )
+    if error:
+        return Response.error(error)
+
+    return Response.success(grant.to_dict(), '分组授权成功')
+
+
+@group_bp.route('/grants/<int:grant_id>', methods=['DELETE'])
+@jwt_required()
+def revoke_grant(grant_id):
+    """
+    撤销分组授权
+    :param grant_id:
+    :return:
+    """
+    current_user = entity_cache.get(User, get_jwt_identity())
+    if not current_user or current_user.role != 'admin':
+        return Response.forbidden()
+
+    if not GroupService.revoke(grant_id):
+        return Response.not_found('授权不存在')
+
+    return Response.success(None, '分组授权已撤销')
@@ -0,0 +1,54 @@
+"""后台任务相关接口"""
+from flask import Blueprint, request
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from app.models.user import User
+from app.models.job import Job
+from app.models.base import db
+from app.utils.response import Response
+from app.services.entity_cache import entity_cache
+
+job_bp = Blueprint('job', __name__, url_prefix='/jobs')
+
+
+@job_bp.route('', methods=['GET'])
+@jwt_required()
+def list_jobs():
+    """
+    获取最近的后台任务列表
+
+    支持 status、type 查询参数
+    :return:
+    """
+    current_user = entity_cache.get(User, get_jwt_identity())
+    if not current_user or current_user.role != 'admin':
+        return Response.forbidden()
+
+    query = Job.query
+    if request.args.get('status'):
+        query = query.filter(Job.status == request.args['status'])
+    if request.args.get('type'):
+        query = query.filter(Job.type == request.args['type'])
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 200)
+    items = [job.to_dict() for job in query.order_by(Job.id.desc()).limit(limit)]
+    return Response.success({'items': items, 'total': len(items)})
+
+
+@job_bp.route('/<int:job_id>', methods=['GET'])
+@jwt_required()
+def get_job(job_id):
+    """
+    查询后台任务的进度与结果
+    :param job_id:
+    :return:
+    """
+    current_user = entity_cache.get(User, get_jwt_identity())
+    if not current_user:
+        return Response.not_found('用户不存在')
+
+    job = db.session.get(Job, job_id)
+    if not job:
+        return Response.not_found('任务不存在')
+    if current_user.role != 'admin' and job.created_by != current_user.id:
+        return Response.forbidden()
+
+    return Response.success(job.to_dict())
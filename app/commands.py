@@ -43,3 +43,106 @@ def register_commands(app):
             click.echo('创建数据库表...')
             db.create_all()
             click.echo('数据库重置完成。')
+            
+    @app.cli.command('rebuild-search-index')
+    @with_appcontext
+    def rebuild_search_index():
+        """重建设备搜索索引"""
+        from .services.search_service import SearchService
+        click.echo('重建设备搜索索引...')
+        count = SearchService.rebuild()
+        click.echo(f'已索引 {count} 个设备。')
+
+    @app.cli.command('backfill-address-index')
+    @click.option('--batch-size', default=1000, help='每批处理的设备数')
+    @with_appcontext
+    def backfill_address_index(batch_size):
+        """回填设备 IP/MAC 地址编码列"""
+        from .models.device import Device
+        updated, invalid, last_id = 0, 0, 0
+        while True:
+            devices = Device.query.filter(
+                Device.id > last_id,
+                db.or_(
+                    db.and_(Device.ip_address.isnot(None), Device.ip_packed.is_(None)),
+                    db.and_(Device.mac_address.isnot(None), Device.mac_int.is_(None))
+                )
+            ).order_by(Device.id).limit(batch_size).all()
+            if not devices:
+                break
+            for device in devices:
+                # 重新赋值触发规范化并写入编码列
+                for field in ('ip_address', 'mac_address'):
+                    try:
+                        setattr(device, field, getattr(device, field))
+                        updated += 1
+                    except ValueError as e:
+                        invalid += 1
+                        click.echo(f'设备 {device.id}: {e}')
+            try:
+                db.session.commit()
+            except db.exc.IntegrityError:
+                db.session.rollback()
+                click.echo(f'设备 {devices[0].id}-{devices[-1].id} 中存在重复的MAC地址，请先合并重复设备')
+                raise SystemExit(1)
+            last_id = devices[-1].id
+        click.echo(f'已回填 {updated} 个地址，{invalid} 个地址无效。')
+
+    @app.cli.command('resume-purges')
+    @with_appcontext
+    def resume_purges():
+        """把所有未完成的批量删除任务重新提交到后台任务队列，由 worker 从游标处继续执行"""
+        from .models.device import DevicePurge
+        from .services.purge_service import PurgeService, RESUMABLE_STATUSES
+        purges = DevicePurge.query.filter(DevicePurge.status.in_(RESUMABLE_STATUSES)).all()
+        for purge in purges:
+            if PurgeService.start(purge.id):
+                click.echo(f'已重新提交批量删除任务 {purge.id}（已删除 {purge.deleted_count} 个设备）。')
+            else:
+                click.echo(f'批量删除任务 {purge.id} 已在排队或执行中，跳过。')
+
+    @app.cli.command('prune-device-changes')
+    @click.option('--days', type=int, default=None, help='保留的天数，默认为 CHANGE_FEED_RETENTION_DAYS')
+    @with_appcontext
+    def prune_device_changes(days):
+        """清理过期的设备变更日志"""
+        from .services.change_service import ChangeService
+        count = ChangeService.prune(days or app.config['CHANGE_FEED_RETENTION_DAYS'])
+        click.echo(f'已清理 {count} 条变更记录。')
+
+    @app.cli.command('import-users')
+    @click.argument('path', type=click.File('r', encoding='utf-8-sig'))
+    @click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']), default=None,
+                  help='文件格式，默认按扩展名判断')
+    @with_appcontext
+    def import_users(path, fmt):
+        """从 CSV（username,email,password[,role] 表头）或 NDJSON 文件批量创建用户，PATH 为 - 时读取标准输入"""
+        import csv
+        from .services.auth_service import AuthService
+        from .utils.ndjson import parse_ndjson
+        fmt = fmt or ('csv' if path.name.endswith('.csv') else 'ndjson')
+        records = csv.DictReader(path) if fmt == 'csv' else parse_ndjson(path)
+        created = failed = 0
+        for result in AuthService.bulk_register(records):
+            if result['status'] == 'created':
+                created += 1
+            else:
+                failed += 1
+                click.echo(f"第 {result['index'] + 1} 条 {result['username']}: {result['error']}", err=True)
+        click.echo(f'已创建 {created} 个用户，{failed} 个失败。')
+
+    @app.cli.command('worker')
+    @click.option('--threads', default=4, help='执行任务的线程数')
+    @click.option('--once', is_flag=True, help='执行完当前可执行的任务后退出')
+    @with_appcontext
+    def worker(threads, once):
+        """启动后台任务 worker"""
+        from .services.job_service import JobService, JobWorker
+        # 导入服务模块以注册任务处理函数
+        from .services import device_service, purge_service  # noqa: F401
+        if once:
+            count = JobService.run_pending()
+            click.echo(f'已执行 {count} 个任务。')
+            return
+        click.echo(f'后台任务 worker 已启动（{threads} 个线程），按 Ctrl+C 停止...')
+        JobWorker(app, threads).run()
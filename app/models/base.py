@@ -1,9 +1,17 @@
-from datetime import datetime
+from datetime import datetime, timezone
+from sqlalchemy.dialects import mysql
 from .. import db
+from app.utils.timing import phase
+from app.utils.wire import native_types
 
 class BaseModel:
+    # 不序列化、也不写入共享实体缓存的列
+    _hidden_columns = ()
+    
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    # 精确到微秒：其他进程的 JSON 片段缓存按 updated_at 判断行是否变化，MySQL 默认的秒级精度下同一秒内的修改无法区分
+    updated_at = db.Column(db.DateTime().with_variant(mysql.DATETIME(fsp=6), 'mysql'),
+                           default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
     
     def save(self):
         db.session.add(self)
@@ -13,12 +21,18 @@ class BaseModel:
         db.session.delete(self)
         db.session.commit()
         
+    @phase('serialize')
     def to_dict(self):
         """基础序列化方法"""
         result = {}
+        # 二进制格式直接编码日期时间
+        native = native_types()
         for col in self.__table__.columns:
+            if col.name in self._hidden_columns:
+                continue
             value = getattr(self, col.name)
             if isinstance(value, datetime):
-                value = value.isoformat()
+                # 数据库中的时间均为 UTC
+                value = value.replace(tzinfo=timezone.utc) if native else value.isoformat()
             result[col.name] = value
         return result
@@ -1,20 +1,51 @@
 """设备模型模块"""
+from datetime import datetime
+from sqlalchemy.dialects import mysql
+from sqlalchemy.orm import validates
 from .base import db, BaseModel
+from app.utils.timing import phase
+from app.utils.ip import normalize_ip, pack_ip
+from app.utils.mac import format_mac, parse_mac
 
 class Device(db.Model, BaseModel):
     __tablename__ = 'devices'
     
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(80), nullable=False)
-    ip_address = db.Column(db.String(15))
+    name = db.Column(db.String(80), nullable=False, index=True)
+    ip_address = db.Column(db.String(45))
+    # ip_address 的 16 字节编码（IPv4 为映射地址），用于按网段范围查询
+    ip_packed = db.Column(db.VARBINARY(16), index=True)
     mac_address = db.Column(db.String(17))
-    status = db.Column(db.String(20), default='offline')
+    # mac_address 的 48 位整数编码，唯一索引保证同一 MAC 不会以不同写法重复创建
+    mac_int = db.Column(db.BigInteger, unique=True, index=True)
+    status = db.Column(db.String(20), default='offline', index=True)
     description = db.Column(db.String(200))
     tags = db.Column(db.String(200))
     
+    @validates('ip_address')
+    def validate_ip_address(self, key, value):
+        """规范化 IP 地址并同步编码列"""
+        if not value:
+            self.ip_packed = None
+            return value
+        self.ip_packed = pack_ip(value)
+        return normalize_ip(value)
+    
+    @validates('mac_address')
+    def validate_mac_address(self, key, value):
+        """规范化 MAC 地址为 aa:bb:cc:dd:ee:ff 并同步编码列"""
+        if not value:
+            self.mac_int = None
+            return value
+        self.mac_int = parse_mac(value)
+        return format_mac(self.mac_int)
+    
+    @phase('serialize')
     def to_dict(self):
         """重写序列化方法，处理tags字段"""
         result = super().to_dict()
+        result.pop('ip_packed', None)
+        result.pop('mac_int', None)
         if result['tags']:
             result['tags'] = [tag.strip() for tag in result['tags'].split(',')]
         else:
@@ -23,11 +54,52 @@ class Device(db.Model, BaseModel):
 
 class DeviceUserAssociation(db.Model, BaseModel):
     __tablename__ = 'device_user_associations'
+    __table_args__ = (
+        # 普通用户的设备可见范围按 user_id 查询 device_id，复合索引可直接覆盖
+        db.Index('ix_device_user_associations_user_device', 'user_id', 'device_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
-    device_id = db.Column(db.Integer, db.ForeignKey('devices.id'), nullable=False)
+    device_id = db.Column(db.Integer, db.ForeignKey('devices.id'), nullable=False, index=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     permission_type = db.Column(db.String(20), nullable=False)  # read, write
     
     device = db.relationship('Device', backref=db.backref('user_associations', lazy=True))
     user = db.relationship('User', backref=db.backref('device_associations', lazy=True))
+
+class DeviceTrigram(db.Model):
+    """设备搜索的三元组倒排索引，由 SearchService 增量维护"""
+    __tablename__ = 'device_trigrams'
+    
+    # MySQL 默认排序规则大小写/重音不敏感，会让不同三元组主键冲突，这里使用二进制排序规则
+    trigram = db.Column(db.String(3).with_variant(mysql.VARCHAR(3, collation='utf8mb4_bin'), 'mysql'),
+                        primary_key=True)
+    device_id = db.Column(db.Integer, db.ForeignKey('devices.id', ondelete='CASCADE'),
+                          primary_key=True, index=True)
+
+class DevicePurge(db.Model, BaseModel):
+    """按过滤条件批量删除设备的任务，游标与删除在同一事务中提交，崩溃后可从游标处继续"""
+    __tablename__ = 'device_purges'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    filter = db.Column(db.String(500), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending', index=True)  # pending, running, completed, failed, cancelled
+    cursor = db.Column(db.Integer, nullable=False, default=0)  # 已处理的最大设备 ID
+    total = db.Column(db.Integer)  # 创建时估计的待删除设备数
+    deleted_count = db.Column(db.Integer, nullable=False, default=0)
+    association_count = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.String(500))
+    created_by = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='SET NULL'))
+    job_id = db.Column(db.Integer, db.ForeignKey('jobs.id', ondelete='SET NULL'))  # 最近一次执行的后台任务
+
+class DeviceChange(db.Model):
+    """设备与授权变更日志，与变更在同一事务中写入，自增 ID 即变更序号"""
+    __tablename__ = 'device_changes'
+    
+    # SQLite 只有 INTEGER 主键才会自增
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)
+    entity = db.Column(db.String(20), nullable=False)  # device, association
+    action = db.Column(db.String(10), nullable=False)  # upsert, delete
+    device_id = db.Column(db.Integer, nullable=False)  # 不设外键，删除后保留墓碑记录
+    user_id = db.Column(db.Integer)  # 仅授权变更
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
@@ -0,0 +1,47 @@
+"""分组授权模型模块
+
+授权关系存储在分组层面：用户组 × 设备组 只需一条授权记录，
+授权与撤销都是 O(1) 写入，新设备加入设备组后自动对已授权的用户组可见。
+"""
+from .base import db, BaseModel
+
+class DeviceGroup(db.Model, BaseModel):
+    __tablename__ = 'device_groups'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(80), unique=True, nullable=False)
+    description = db.Column(db.String(200))
+
+class DeviceGroupMember(db.Model):
+    __tablename__ = 'device_group_members'
+
+    group_id = db.Column(db.Integer, db.ForeignKey('device_groups.id', ondelete='CASCADE'), primary_key=True)
+    device_id = db.Column(db.Integer, db.ForeignKey('devices.id', ondelete='CASCADE'),
+                          primary_key=True, index=True)
+
+class UserGroup(db.Model, BaseModel):
+    __tablename__ = 'user_groups'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(80), unique=True, nullable=False)
+    description = db.Column(db.String(200))
+
+class UserGroupMember(db.Model):
+    __tablename__ = 'user_group_members'
+
+    group_id = db.Column(db.Integer, db.ForeignKey('user_groups.id', ondelete='CASCADE'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'),
+                        primary_key=True, index=True)
+
+class GroupGrant(db.Model, BaseModel):
+    __tablename__ = 'group_grants'
+    __table_args__ = (
+        db.UniqueConstraint('user_group_id', 'device_group_id', name='uq_group_grants_user_device_group'),
+        # 按设备组反查授权（设备组删除、权限检查）
+        db.Index('ix_group_grants_device_group', 'device_group_id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_group_id = db.Column(db.Integer, db.ForeignKey('user_groups.id', ondelete='CASCADE'), nullable=False)
+    device_group_id = db.Column(db.Integer, db.ForeignKey('device_groups.id', ondelete='CASCADE'), nullable=False)
+    permission_type = db.Column(db.String(20), nullable=False)  # read, write
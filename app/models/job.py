@@ -0,0 +1,37 @@
+"""后台任务模型模块
+
+任务表同时充当队列：worker 以条件更新抢占任务并持有租约，租约过期未续约的任务
+会被重新执行（至少一次语义），因此任务处理函数必须可以安全地重复执行。
+"""
+from .base import db, BaseModel
+from app.utils.timing import phase
+
+class Job(db.Model, BaseModel):
+    __tablename__ = 'jobs'
+    __table_args__ = (
+        # worker 按状态与可执行时间抢占任务
+        db.Index('ix_jobs_status_run_after', 'status', 'run_after'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    type = db.Column(db.String(50), nullable=False, index=True)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, succeeded, failed
+    payload = db.Column(db.JSON, nullable=False)
+    result = db.Column(db.JSON)
+    progress = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Integer)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    error = db.Column(db.String(500))
+    run_after = db.Column(db.DateTime, nullable=False)  # 重试退避期间不会被抢占
+    worker_id = db.Column(db.String(100))
+    lease_expires_at = db.Column(db.DateTime)
+    created_by = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='SET NULL'))
+
+    @phase('serialize')
+    def to_dict(self):
+        """重写序列化方法，隐藏 worker 租约信息"""
+        result = super().to_dict()
+        result.pop('worker_id', None)
+        result.pop('lease_expires_at', None)
+        return result
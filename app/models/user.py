@@ -1,3 +1,4 @@
+from datetime import datetime
 from werkzeug.security import generate_password_hash, check_password_hash
 from .base import db, BaseModel
 
@@ -10,17 +11,23 @@ class User(db.Model, BaseModel):
     password_hash = db.Column(db.String(255), nullable=False)
     role = db.Column(db.String(20), nullable=False, default='user')  # admin, user
     
+    _hidden_columns = ('password_hash',)
+    
     def set_password(self, password):
         self.password_hash = generate_password_hash(password)
         
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
         
-    def to_dict(self):
-        """重写序列化方法，排除密码哈希"""
-        result = super().to_dict()
-        result.pop('password_hash', None)
-        return result
-        
     def __repr__(self):
         return f'<User {self.username}>'
+
+class RevokedToken(db.Model):
+    """已撤销的 JWT，过期后清理；自增 ID 用于各进程增量同步"""
+    __tablename__ = 'revoked_tokens'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    jti = db.Column(db.String(36), unique=True, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'))
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
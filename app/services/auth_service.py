@@ -1,8 +1,40 @@
 """认证服务模块"""
-from typing import Optional, Tuple
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Iterable, Iterator, List, Optional, Tuple
+from flask import current_app
 from flask_jwt_extended import create_access_token
+from sqlalchemy import insert, or_
+from sqlalchemy.exc import IntegrityError
+from werkzeug.security import generate_password_hash
 from app.models.user import User
 from app.models.base import db
+from app.services.entity_cache import entity_cache
+from app.utils.count_cache import CountCache
+
+# 用户总数缓存，用户新增或修改后标记过期并在后台刷新
+user_count_cache = CountCache()
+
+USER_ROLES = ('admin', 'user')
+
+# 批量创建用户时计算密码哈希的进程池，首次使用时创建
+_hash_pool = None
+_hash_pool_lock = threading.Lock()
+
+
+def hash_passwords(passwords: List[str]) -> List[str]:
+    """在进程池中并行计算密码哈希，数量较少时直接在当前进程计算"""
+    workers = current_app.config['USER_BULK_HASH_WORKERS'] or os.cpu_count() or 1
+    if workers == 1 or len(passwords) < 2 * workers:
+        return [generate_password_hash(password) for password in passwords]
+    global _hash_pool
+    with _hash_pool_lock:
+        if _hash_pool is None:
+            # 使用 spawn 启动子进程，避免在多线程的服务进程中 fork
+            _hash_pool = ProcessPoolExecutor(max_workers=workers, mp_context=get_context('spawn'))
+    return list(_hash_pool.map(generate_password_hash, passwords, chunksize=max(len(passwords) // (workers * 4), 1)))
 
 class AuthService:
     """认证服务类"""
@@ -32,8 +64,129 @@ class AuthService:
         user = User(username=username, email=email, role=role)
         user.set_password(password)
         user.save()
+        user_count_cache.mark_stale()
         return user, None
     
+    @staticmethod
+    def bulk_register(records: Iterable[dict]) -> Iterator[dict]:
+        """批量创建用户，逐条产出结果
+        
+        记录按 USER_BULK_BATCH_SIZE 分批处理：每批用一次查询检查用户名和邮箱冲突，
+        在进程池中并行计算密码哈希，再以一条批量 INSERT 写入并提交。
+        
+        Args:
+            records: 用户记录，包含 username、email、password，可选 role
+            
+        Returns:
+            Iterator[dict]: 每条记录的结果 {'index', 'username', 'status': created/failed, 'id' 或 'error'}
+        """
+        batch_size = current_app.config['USER_BULK_BATCH_SIZE']
+        seen_usernames, seen_emails = set(), set()
+        batch = []
+        try:
+            for index, record in enumerate(records):
+                batch.append((index, record))
+                if len(batch) >= batch_size:
+                    yield from AuthService._register_batch(batch, seen_usernames, seen_emails)
+                    batch = []
+            if batch:
+                yield from AuthService._register_batch(batch, seen_usernames, seen_emails)
+        finally:
+            user_count_cache.mark_stale()
+    
+    @staticmethod
+    def _register_batch(batch: List[Tuple[int, dict]], seen_usernames: set, seen_emails: set) -> List[dict]:
+        results = {}
+        valid = []
+        for index, record in batch:
+            if not isinstance(record, dict):
+                error = '无效的记录'
+            elif not all(record.get(k) for k in ('username', 'email', 'password')):
+                error = '缺少必要字段'
+            elif not all(isinstance(record[k], str) for k in ('username', 'email', 'password')):
+                error = '字段类型无效'
+            elif record.get('role', 'user') not in USER_ROLES:
+                error = '无效的角色'
+            elif record['username'] in seen_usernames:
+                error = '用户名重复'
+            elif record['email'] in seen_emails:
+                error = '邮箱重复'
+            else:
+                seen_usernames.add(record['username'])
+                seen_emails.add(record['email'])
+                valid.append((index, record))
+                continue
+            results[index] = AuthService._failed(index, record, error)
+        
+        if valid:
+            taken = db.session.execute(db.select(User.username, User.email).where(or_(
+                User.username.in_([record['username'] for _, record in valid]),
+                User.email.in_([record['email'] for _, record in valid])
+            ))).all()
+            taken_usernames = {username for username, _ in taken}
+            taken_emails = {email for _, email in taken}
+            pending = []
+            for index, record in valid:
+                if record['username'] in taken_usernames:
+                    results[index] = AuthService._failed(index, record, '用户名已存在')
+                elif record['email'] in taken_emails:
+                    results[index] = AuthService._failed(index, record, '邮箱已存在')
+                else:
+                    pending.append((index, record))
+            
+            hashes = hash_passwords([record['password'] for _, record in pending])
+            rows = [
+                {
+                    'username': record['username'],
+                    'email': record['email'],
+                    'role': record.get('role', 'user'),
+                    'password_hash': password_hash,
+                }
+                for (_, record), password_hash in zip(pending, hashes)
+            ]
+            inserted = AuthService._insert_users(rows)
+            ids = dict(db.session.execute(
+                db.select(User.username, User.id).where(User.username.in_([row['username'] for row in rows]))
+            ).all()) if rows else {}
+            for (index, record), ok in zip(pending, inserted):
+                if ok:
+                    results[index] = {'index': index, 'username': record['username'], 'status': 'created',
+                                      'id': ids.get(record['username'])}
+                else:
+                    results[index] = AuthService._failed(index, record, '用户名或邮箱已存在')
+        
+        return [results[index] for index, _ in batch]
+    
+    @staticmethod
+    def _insert_users(rows: List[dict]) -> List[bool]:
+        """批量插入并提交；唯一约束冲突时（如大小写不敏感的排序规则）逐条重试以定位冲突记录"""
+        if not rows:
+            return []
+        try:
+            db.session.execute(insert(User), rows)
+            db.session.commit()
+            return [True] * len(rows)
+        except IntegrityError:
+            db.session.rollback()
+        
+        inserted = []
+        for row in rows:
+            try:
+                with db.session.begin_nested():
+                    db.session.execute(insert(User), [row])
+                inserted.append(True)
+            except IntegrityError:
+                inserted.append(False)
+        db.session.commit()
+        return inserted
+    
+    @staticmethod
+    def _failed(index: int, record, error: str) -> dict:
+        username = record.get('username') if isinstance(record, dict) else None
+        if not isinstance(username, str):
+            username = None
+        return {'index': index, 'username': username, 'status': 'failed', 'error': error}
+    
     @staticmethod
     def login(username: str, password: str) -> Tuple[Optional[str], Optional[str]]:
         """用户登录
@@ -58,18 +211,48 @@ class AuthService:
         return token, None
     
     @staticmethod
-    def get_users(page: int = 1, per_page: int = 10) -> Tuple[list, int]:
+    def get_users(page: int = 1, per_page: int = 10, after: Optional[int] = None,
+                  prefix: Optional[str] = None) -> Tuple[list, int, Optional[int]]:
         """获取用户列表
         
+        按用户 ID 键集分页：传入 after（上一页最后一个用户 ID）时直接从索引位置读取；
+        未传 after 时按 page 计算偏移，仅用于兼容旧客户端，深分页较慢。
+        总数来自后台刷新的计数缓存，最多滞后 USER_COUNT_CACHE_TTL 秒。
+        
         Args:
             page: 页码，默认为 1
             per_page: 每页数量，默认为 10
+            after: 上一页最后一个用户 ID
+            prefix: 用户名或邮箱前缀
             
         Returns:
-            Tuple[list, int]: (用户列表, 总用户数)
+            Tuple[list, int, Optional[int]]: (用户列表, 总用户数, 下一页的 after，没有更多时为 None)
         """
-        pagination = User.query.paginate(page=page, per_page=per_page)
-        return pagination.items, pagination.total
+        query = AuthService._user_query(prefix)
+        if after is not None:
+            query = query.filter(User.id > after)
+        elif page > 1:
+            query = query.offset((page - 1) * per_page)
+        users = query.order_by(User.id).limit(per_page + 1).all()
+        next_after = users[per_page - 1].id if len(users) > per_page else None
+        
+        total = user_count_cache.get(
+            ('users', prefix or ''),
+            lambda: AuthService._user_query(prefix).count(),
+            current_app.config['USER_COUNT_CACHE_TTL']
+        )
+        return users[:per_page], total, next_after
+    
+    @staticmethod
+    def _user_query(prefix: Optional[str] = None):
+        """用户查询，prefix 按用户名或邮箱前缀匹配（可使用唯一索引的范围扫描）"""
+        query = User.query
+        if prefix:
+            query = query.filter(or_(
+                User.username.startswith(prefix, autoescape=True),
+                User.email.startswith(prefix, autoescape=True)
+            ))
+        return query
     
     @staticmethod
     def update_user(user_id: int, data: dict) -> Tuple[Optional[User], Optional[str]]:
@@ -83,7 +266,7 @@ class AuthService:
             Tuple[Optional[User], Optional[str]]: (用户对象, 错误信息)
             如果更新成功，错误信息为 None
         """
-        user = db.session.get(User, user_id)
+        user = entity_cache.get(User, user_id)
         if not user:
             return None, '用户不存在'
             
@@ -112,4 +295,6 @@ class AuthService:
             user.set_password(data['password'])
             
         db.session.commit()
+        if 'username' in data or 'email' in data:
+            user_count_cache.mark_stale()
         return user, None
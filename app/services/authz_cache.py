@@ -0,0 +1,204 @@
+"""设备授权范围缓存模块
+
+每个用户被授权的设备 ID 以压缩位图保存在进程内的有界 LRU 中：首次访问时从数据库加载，
+授权操作在本进程内原地更新，其他进程新增的授权最长在 AUTHZ_CACHE_TTL 秒后生效。
+
+撤销授权（分组成员或分组授权移除、设备删除）时递增同一台机器上各 worker 共享的代数计数器，
+其他 worker 下次读取时发现代数变化即清空缓存，撤销立即生效；其他服务器上的撤销仍最长延迟 AUTHZ_CACHE_TTL 秒。
+"""
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+from flask import current_app
+from app.models.device import DeviceUserAssociation
+from app.models.group import DeviceGroupMember, GroupGrant, UserGroupMember
+from app.models.base import db
+from app.utils.bitmap import RoaringBitmap
+from app.utils.shm import SharedCounter
+
+
+def default_shm_path() -> str:
+    """默认的共享代数文件路径"""
+    directory = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return os.path.join(directory, 'box-authz')
+
+
+class UserScope:
+    """单个用户的授权范围"""
+
+    __slots__ = ('read', 'write', 'loaded_at')
+
+    def __init__(self, read: RoaringBitmap, write: RoaringBitmap):
+        self.read = read
+        self.write = write
+        self.loaded_at = time.monotonic()
+
+    def allows(self, device_id: int, permission_type: str = 'read') -> bool:
+        """检查设备是否在授权范围内（write 权限包含 read）"""
+        return device_id in (self.write if permission_type == 'write' else self.read)
+
+
+class AuthzCache:
+    """用户授权范围的 LRU 缓存"""
+
+    def __init__(self):
+        self._entries: 'OrderedDict[int, UserScope]' = OrderedDict()
+        self._lock = threading.Lock()
+        # 每次失效或原地更新都会递增，防止并发加载把旧数据写回缓存
+        self._generation = 0
+        # 各 worker 共享的撤销代数，以及本进程缓存对应的代数
+        self._shared = None
+        self._shared_lock = threading.Lock()
+        self._shared_seen = None
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: int) -> UserScope:
+        """获取用户的授权范围，未命中或过期时从数据库加载"""
+        return self.get_many([user_id])[user_id]
+
+    def get_many(self, user_ids: Iterable[int]) -> Dict[int, UserScope]:
+        """批量获取用户的授权范围，未命中的用户在一次查询中加载"""
+        ttl = current_app.config['AUTHZ_CACHE_TTL']
+        now = time.monotonic()
+        shared_generation = self._get_shared().value()
+        result, missing = {}, []
+        with self._lock:
+            if shared_generation != self._shared_seen:
+                # 其他 worker 撤销过授权
+                self._entries.clear()
+                self._generation += 1
+                self._shared_seen = shared_generation
+            for user_id in set(user_ids):
+                scope = self._entries.get(user_id)
+                if scope is not None and now - scope.loaded_at < ttl:
+                    self._entries.move_to_end(user_id)
+                    result[user_id] = scope
+                    self.hits += 1
+                else:
+                    missing.append(user_id)
+                    self.misses += 1
+            generation = self._generation
+
+        if missing:
+            loaded = self._load(missing)
+            result.update(loaded)
+            with self._lock:
+                if generation == self._generation:
+                    self._entries.update(loaded)
+                    self._evict()
+        return result
+
+    def grant(self, user_id: int, device_ids: Iterable[int], permission_type: str = 'read') -> None:
+        """授权后原地更新缓存中的用户授权范围"""
+        device_ids = list(device_ids)
+        with self._lock:
+            self._generation += 1
+            scope = self._entries.get(user_id)
+            if scope is None:
+                return
+            granted = RoaringBitmap(device_ids)
+            if permission_type != 'write' and len(scope.write & granted):
+                # 写权限可能降级，也可能来自分组授权，无法原地判断，直接失效
+                del self._entries[user_id]
+                return
+            # 写时复制，读者不会看到修改到一半的位图
+            scope.read = scope.read | granted
+            if permission_type == 'write':
+                scope.write = scope.write | granted
+
+    def invalidate(self, user_ids: Optional[Iterable[int]] = None) -> None:
+        """使指定用户（默认全部）的缓存失效，其他 worker 清空缓存"""
+        self._bump_shared()
+        with self._lock:
+            self._generation += 1
+            if user_ids is None:
+                self._entries.clear()
+                return
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+
+    def discard_devices(self, device_ids: Iterable[int]) -> None:
+        """设备删除后从所有缓存的授权范围中移除"""
+        removed = RoaringBitmap(device_ids)
+        self._bump_shared()
+        with self._lock:
+            self._generation += 1
+            for scope in self._entries.values():
+                if len(scope.read & removed):
+                    scope.read = self._difference(scope.read, removed)
+                    scope.write = self._difference(scope.write, removed)
+
+    def stats(self) -> dict:
+        """缓存统计信息"""
+        with self._lock:
+            return {
+                'users': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'memory_bytes': sum(
+                    scope.read.memory_usage() + scope.write.memory_usage()
+                    for scope in self._entries.values()
+                ),
+            }
+
+    def _bump_shared(self) -> None:
+        """递增共享代数；期间没有其他 worker 撤销时本进程的缓存仍然有效"""
+        shared_generation = self._get_shared().increment()
+        with self._lock:
+            if self._shared_seen == shared_generation - 1:
+                self._shared_seen = shared_generation
+
+    def _get_shared(self) -> SharedCounter:
+        # worker fork 之后再打开映射
+        with self._shared_lock:
+            if self._shared is None:
+                self._shared = SharedCounter(current_app.config['AUTHZ_CACHE_SHM_PATH'] or default_shm_path())
+            return self._shared
+
+    @staticmethod
+    def _difference(bitmap: RoaringBitmap, removed: RoaringBitmap) -> RoaringBitmap:
+        result = bitmap.copy()
+        for device_id in removed:
+            result.discard(device_id)
+        return result
+
+    def _evict(self) -> None:
+        max_users = current_app.config['AUTHZ_CACHE_MAX_USERS']
+        while len(self._entries) > max_users:
+            self._entries.popitem(last=False)
+
+    @staticmethod
+    def _load(user_ids: List[int]) -> Dict[int, UserScope]:
+        """一次查询加载多个用户的直接授权与分组授权"""
+        direct = db.select(
+            DeviceUserAssociation.user_id,
+            DeviceUserAssociation.device_id,
+            DeviceUserAssociation.permission_type
+        ).where(DeviceUserAssociation.user_id.in_(user_ids))
+        grouped = db.select(
+            UserGroupMember.user_id,
+            DeviceGroupMember.device_id,
+            GroupGrant.permission_type
+        ).join(
+            GroupGrant, GroupGrant.user_group_id == UserGroupMember.group_id
+        ).join(
+            DeviceGroupMember, DeviceGroupMember.group_id == GroupGrant.device_group_id
+        ).where(UserGroupMember.user_id.in_(user_ids))
+
+        read = {user_id: [] for user_id in user_ids}
+        write = {user_id: [] for user_id in user_ids}
+        for user_id, device_id, permission_type in db.session.execute(db.union_all(direct, grouped)):
+            read[user_id].append(device_id)
+            if permission_type == 'write':
+                write[user_id].append(device_id)
+        return {
+            user_id: UserScope(RoaringBitmap(read[user_id]), RoaringBitmap(write[user_id]))
+            for user_id in user_ids
+        }
+
+
+authz_cache = AuthzCache()
@@ -0,0 +1,85 @@
+"""批量权限检查服务模块"""
+import base64
+from typing import List, Sequence, Tuple
+from app.models.device import Device
+from app.models.user import User
+from app.models.base import db
+from app.services.authz_cache import authz_cache
+from app.utils.bitmap import RoaringBitmap
+
+PERMISSION_TYPES = ('read', 'write')
+# 单条 IN 查询中的最大参数数量
+ID_CHUNK_SIZE = 5000
+
+
+class AuthzService:
+    """批量权限检查服务类"""
+    
+    @staticmethod
+    def parse_checks(items: list) -> List[Tuple[int, int, str]]:
+        """解析检查项，支持 [user_id, device_id, permission] 数组或同名字段的对象
+        
+        Raises:
+            ValueError: 检查项格式无效
+        """
+        checks = []
+        for index, item in enumerate(items):
+            try:
+                if isinstance(item, dict):
+                    user_id, device_id = item['user_id'], item['device_id']
+                    permission_type = item.get('permission', 'read')
+                else:
+                    user_id, device_id, *rest = item
+                    permission_type = rest[0] if rest else 'read'
+                checks.append((int(user_id), int(device_id), permission_type))
+            except (KeyError, TypeError, ValueError):
+                raise ValueError(f'第 {index} 个检查项格式无效')
+            if permission_type not in PERMISSION_TYPES:
+                raise ValueError(f'第 {index} 个检查项的权限类型无效: {permission_type}')
+        return checks
+    
+    @staticmethod
+    def check(checks: Sequence[Tuple[int, int, str]]) -> bytearray:
+        """批量检查 (用户, 设备, 权限) 是否允许
+        
+        管理员对所有存在的设备有权限；普通用户按授权范围缓存中的位图判断，
+        缓存未命中的用户在一次查询中加载。
+        
+        Returns:
+            bytearray: 位集，第 i 个检查项允许时第 i 位（字节内低位在前）为 1
+        """
+        user_ids = list({user_id for user_id, _, _ in checks})
+        admins = set()
+        known = set()
+        for i in range(0, len(user_ids), ID_CHUNK_SIZE):
+            for user_id, role in db.session.execute(
+                db.select(User.id, User.role).where(User.id.in_(user_ids[i:i + ID_CHUNK_SIZE]))
+            ):
+                known.add(user_id)
+                if role == 'admin':
+                    admins.add(user_id)
+        
+        scopes = authz_cache.get_many(known - admins)
+        
+        existing = RoaringBitmap()
+        admin_devices = list({device_id for user_id, device_id, _ in checks if user_id in admins})
+        for i in range(0, len(admin_devices), ID_CHUNK_SIZE):
+            existing.update(db.session.scalars(
+                db.select(Device.id).where(Device.id.in_(admin_devices[i:i + ID_CHUNK_SIZE]))
+            ))
+        
+        bits = bytearray((len(checks) + 7) // 8)
+        for index, (user_id, device_id, permission_type) in enumerate(checks):
+            if user_id in admins:
+                allowed = device_id in existing
+            else:
+                scope = scopes.get(user_id)
+                allowed = scope is not None and scope.allows(device_id, permission_type)
+            if allowed:
+                bits[index >> 3] |= 1 << (index & 7)
+        return bits
+    
+    @staticmethod
+    def encode_bits(bits: bytearray) -> str:
+        """位集编码为 base64 字符串"""
+        return base64.b64encode(bytes(bits)).decode('ascii')
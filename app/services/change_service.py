@@ -0,0 +1,226 @@
+"""设备变更日志服务模块
+
+通过 ORM 增删改设备与授权时，在 after_flush 中把变更写入 device_changes（与变更同一事务）；
+绕过 ORM 的批量删除由调用方通过 ChangeService.record_deletes 记录墓碑。
+
+变更序号由数据库自增分配，但事务的提交顺序与序号顺序不一定一致：读到序号 N 时，更小的序号
+可能属于尚未提交的事务。因此游标同时记录已读到的最大序号和其下尚未出现的序号区间（空洞），
+下次读取时一并查询；空洞超过 CHANGE_FEED_GAP_SECONDS 仍未出现则视为事务已回滚而丢弃。
+游标通过查询参数传递，空洞按区间保存，最多 MAX_CURSOR_GAPS 个（游标不超过约 2KB）；超出时不丢弃空洞，
+而是按游标过期处理，由客户端重新全量同步。
+"""
+import base64
+import json
+import time
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional, Tuple
+from flask import current_app
+from sqlalchemy import event, func, or_
+from sqlalchemy.orm import Session
+from app.models.device import Device, DeviceChange, DeviceUserAssociation
+from app.models.base import db
+
+# 游标中最多保留的空洞区间数，每个区间编码后约 40 字节
+MAX_CURSOR_GAPS = 40
+# 生成当前位置的游标时检查空洞的序号范围
+HEAD_GAP_WINDOW = 1000
+
+
+class CursorError(ValueError):
+    """游标无效"""
+    pass
+
+
+class CursorExpired(Exception):
+    """游标之后的变更已被清理，需要重新全量同步"""
+    pass
+
+
+def encode_cursor(last_seq: int, gaps: List[list]) -> str:
+    """编码游标，gaps 为 [起始序号, 结束序号, 首次发现时间戳] 列表（闭区间），时间戳取整到秒"""
+    raw = json.dumps({'s': last_seq, 'g': [[lo, hi, int(seen)] for lo, hi, seen in gaps]}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[int, List[list]]:
+    """解码游标
+
+    Raises:
+        CursorError: 游标无效
+    """
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        gaps = []
+        for gap in data.get('g', []):
+            # 兼容旧版游标的单个序号 [序号, 时间戳]
+            lo, hi, seen = gap if len(gap) == 3 else (gap[0], gap[0], gap[1])
+            gaps.append([int(lo), int(hi), float(seen)])
+        return int(data['s']), gaps
+    except (ValueError, KeyError, TypeError, AttributeError):
+        raise CursorError('无效的游标')
+
+
+def _change_row(obj, action: str) -> dict:
+    if isinstance(obj, Device):
+        return {'entity': 'device', 'action': action, 'device_id': obj.id, 'user_id': None}
+    return {'entity': 'association', 'action': action, 'device_id': obj.device_id, 'user_id': obj.user_id}
+
+
+@event.listens_for(Session, 'after_flush')
+def _record_flush_changes(session, flush_context):
+    """记录本次 flush 中通过 ORM 修改的设备与授权"""
+    tracked = (Device, DeviceUserAssociation)
+    rows = [_change_row(obj, 'upsert') for obj in session.new if isinstance(obj, tracked)]
+    rows += [
+        _change_row(obj, 'upsert') for obj in session.dirty
+        if isinstance(obj, tracked) and session.is_modified(obj, include_collections=False)
+    ]
+    rows += [_change_row(obj, 'delete') for obj in session.deleted if isinstance(obj, tracked)]
+    if rows:
+        ChangeService.record(rows, session)
+
+
+class ChangeService:
+    """设备变更日志服务类"""
+
+    @staticmethod
+    def record(rows: List[dict], session: Optional[Session] = None) -> None:
+        """在当前事务中写入变更记录"""
+        now = datetime.utcnow()
+        (session or db.session).connection().execute(
+            DeviceChange.__table__.insert(),
+            [dict(row, created_at=now) for row in rows]
+        )
+
+    @staticmethod
+    def record_deletes(device_ids: List[int], associations: Iterable[Tuple[int, int]] = ()) -> None:
+        """为批量删除的设备及其授权记录墓碑"""
+        rows = [
+            {'entity': 'association', 'action': 'delete', 'device_id': device_id, 'user_id': user_id}
+            for device_id, user_id in associations
+        ]
+        rows += [
+            {'entity': 'device', 'action': 'delete', 'device_id': device_id, 'user_id': None}
+            for device_id in device_ids
+        ]
+        if rows:
+            ChangeService.record(rows)
+
+    @staticmethod
+    def head_cursor() -> str:
+        """当前最新位置的游标，最近 HEAD_GAP_WINDOW 个序号中的空洞（可能是未提交的事务）一并记入
+
+        超过 MAX_CURSOR_GAPS 个区间时只保留最新的区间：客户端随后全量拉取，之前提交的事务已包含在内。
+        """
+        last_seq = db.session.query(func.max(DeviceChange.id)).scalar() or 0
+        low = max(last_seq - HEAD_GAP_WINDOW, 0)
+        present = sorted(seq for (seq,) in db.session.query(DeviceChange.id).filter(DeviceChange.id > low))
+        now = time.time()
+        gaps = []
+        previous = low
+        for seq in present:
+            if seq > previous + 1:
+                gaps.append([previous + 1, seq - 1, now])
+            previous = seq
+        return encode_cursor(last_seq, gaps[-MAX_CURSOR_GAPS:])
+
+    @staticmethod
+    def list_changes(cursor: str, limit: int) -> Tuple[List[dict], str, bool]:
+        """读取游标之后的变更
+
+        同一设备或授权在一页中的多次变更合并为一条，内容取当前状态；
+        已不存在的设备或授权一律返回 delete。
+
+        Returns:
+            Tuple[List[dict], str, bool]: (变更列表, 下一页游标, 是否还有更多)
+
+        Raises:
+            CursorError: 游标无效
+            CursorExpired: 游标之后的变更已被清理
+        """
+        last_seq, gaps = decode_cursor(cursor)
+        now = time.time()
+        gaps = [gap for gap in gaps if now - gap[2] < current_app.config['CHANGE_FEED_GAP_SECONDS']]
+
+        oldest = db.session.query(func.min(DeviceChange.id)).scalar()
+        if oldest is not None and oldest > last_seq + 1 and last_seq > 0:
+            raise CursorExpired('游标已过期，请重新全量同步')
+
+        condition = or_(DeviceChange.id > last_seq, *[DeviceChange.id.between(lo, hi) for lo, hi, _ in gaps])
+        changes = DeviceChange.query.filter(condition).order_by(DeviceChange.id).limit(limit + 1).all()
+        has_more = len(changes) > limit
+        changes = changes[:limit]
+
+        found = sorted(change.id for change in changes)
+        gaps = ChangeService._remove_found(gaps, [seq for seq in found if seq <= last_seq])
+        previous = last_seq
+        for seq in found:
+            if seq > previous + 1:
+                gaps.append([previous + 1, seq - 1, now])
+            previous = max(previous, seq)
+        if len(gaps) > MAX_CURSOR_GAPS:
+            # 丢弃空洞可能永久漏掉之后提交的事务，宁可让客户端重新全量同步
+            raise CursorExpired('未提交的事务过多，请重新全量同步')
+        next_cursor = encode_cursor(previous, gaps)
+
+        return ChangeService._render(changes), next_cursor, has_more
+
+    @staticmethod
+    def _remove_found(gaps: List[list], found: List[int]) -> List[list]:
+        """从空洞区间中去掉已读到的序号，区间可能拆分为多段"""
+        result = []
+        for lo, hi, seen in gaps:
+            for seq in found:
+                if lo <= seq <= hi:
+                    if seq > lo:
+                        result.append([lo, seq - 1, seen])
+                    lo = seq + 1
+            if lo <= hi:
+                result.append([lo, hi, seen])
+        return result
+
+    @staticmethod
+    def _render(changes: List[DeviceChange]) -> List[dict]:
+        latest = {}
+        for change in changes:
+            key = (change.entity, change.device_id, change.user_id)
+            latest.pop(key, None)
+            latest[key] = change
+
+        device_ids = {device_id for entity, device_id, _ in latest if entity == 'device'}
+        devices = {device.id: device for device in Device.query.filter(Device.id.in_(device_ids))} \
+            if device_ids else {}
+        pairs = {(device_id, user_id) for entity, device_id, user_id in latest if entity == 'association'}
+        associations = {}
+        if pairs:
+            for assoc in DeviceUserAssociation.query.filter(
+                DeviceUserAssociation.device_id.in_({device_id for device_id, _ in pairs}),
+                DeviceUserAssociation.user_id.in_({user_id for _, user_id in pairs})
+            ):
+                associations[(assoc.device_id, assoc.user_id)] = assoc
+
+        items = []
+        for (entity, device_id, user_id), change in latest.items():
+            if entity == 'device':
+                current = devices.get(device_id)
+                data = current.to_dict() if current else None
+            else:
+                current = associations.get((device_id, user_id))
+                data = {'permission_type': current.permission_type} if current else None
+            items.append({
+                'seq': change.id,
+                'entity': entity,
+                'action': 'upsert' if current else 'delete',
+                'device_id': device_id,
+                'user_id': user_id,
+                'data': data,
+            })
+        return items
+
+    @staticmethod
+    def prune(days: int) -> int:
+        """删除早于指定天数的变更记录，返回删除的条数"""
+        cutoff = datetime.utcnow() - timedelta(days=days)
+        count = DeviceChange.query.filter(DeviceChange.created_at < cutoff).delete(synchronize_session=False)
+        db.session.commit()
+        return count
@@ -1,15 +1,44 @@
 """设备服务模块"""
-from typing import List, Optional
-from app.models.device import Device, DeviceUserAssociation
+from typing import Iterable, List, Optional
+from flask import current_app
+from sqlalchemy import func, or_
+from sqlalchemy.exc import IntegrityError
+from app.models.device import Device, DeviceTrigram, DeviceUserAssociation
+from app.models.group import DeviceGroupMember, GroupGrant, UserGroupMember
 from app.models.user import User
 from app.models.base import db
+from app.services.authz_cache import authz_cache
+from app.services.change_service import ChangeService
+from app.services.entity_cache import entity_cache
+from app.services.job_service import JobContext, job_handler
+from app.services.search_service import SEARCH_FIELDS, SearchService
+from app.utils.device_filter import FilterError, FilterTerm, compile_filter
+from app.utils.fragment_cache import FragmentCache
+from app.utils.ip import IPV4_RANGE, cidr_range, subnet_from_key, subnet_key_length
+from app.utils.mac import parse_mac
+
+# 设备列表的 JSON 片段缓存
+device_fragments = FragmentCache(Device)
+
+# 单条 IN 查询中的最大 MAC 数量，避免超出数据库的参数个数限制
+MAC_LOOKUP_CHUNK_SIZE = 5000
+
+
+class DuplicateDeviceError(ValueError):
+    """设备 MAC 地址重复"""
+
 
 class DeviceService:
     """设备服务类"""
     
     @staticmethod
     def create_device(data: dict) -> Device:
-        """创建设备"""
+        """创建设备
+        
+        Raises:
+            DuplicateDeviceError: MAC 地址已存在
+            ValueError: IP 或 MAC 地址无效
+        """
         # 将标签列表转换为逗号分隔的字符串
         tags = data.get('tags', [])
         tags_str = ','.join(tags) if tags else ''
@@ -21,45 +50,212 @@ class DeviceService:
             description=data.get('description', ''),
             tags=tags_str
         )
+        DeviceService._check_mac_unique(device)
         db.session.add(device)
+        try:
+            db.session.flush()
+        except IntegrityError:
+            # 并发创建相同 MAC 的设备时由唯一索引兜底
+            db.session.rollback()
+            raise DuplicateDeviceError('MAC地址已存在')
+        SearchService.index_device(device)
         db.session.commit()
         return device
     
     @staticmethod
-    def get_devices(user_id: int, is_admin: bool) -> List[Device]:
-        """获取设备列表"""
-        if is_admin:
-            return Device.query.all()
-        return [assoc.device for assoc in 
-                DeviceUserAssociation.query.filter_by(user_id=user_id).all()]
+    def visible_device_ids(user_id: int, permission_type: Optional[str] = None):
+        """用户被授权设备 ID 的子查询
+
+        包括直接授权（device_user_associations）与分组授权（用户组 × 设备组），
+        两条路径都通过索引连接完成。
+        
+        Args:
+            user_id: 用户 ID
+            permission_type: 为 'write' 时只返回有写权限的设备，否则返回任意权限的设备
+        """
+        direct = db.select(DeviceUserAssociation.device_id).where(
+            DeviceUserAssociation.user_id == user_id
+        )
+        grouped = db.select(DeviceGroupMember.device_id).join(
+            GroupGrant, GroupGrant.device_group_id == DeviceGroupMember.group_id
+        ).join(
+            UserGroupMember, UserGroupMember.group_id == GroupGrant.user_group_id
+        ).where(UserGroupMember.user_id == user_id)
+        if permission_type == 'write':
+            direct = direct.where(DeviceUserAssociation.permission_type == 'write')
+            grouped = grouped.where(GroupGrant.permission_type == 'write')
+        return db.union(direct, grouped)
+    
+    @staticmethod
+    def scoped_query(user_id: int, is_admin: bool):
+        """获取用户可见设备的查询
+
+        管理员可见全部设备，普通用户只能看到直接或通过分组被授权的设备。
+        授权范围较小时直接用缓存位图中的 ID 做主键查询，否则交给数据库做半连接。
+        """
+        query = Device.query
+        if not is_admin:
+            scope = authz_cache.get(user_id)
+            if len(scope.read) <= current_app.config['AUTHZ_SCOPE_INLINE_MAX']:
+                query = query.filter(Device.id.in_(list(scope.read)))
+            else:
+                query = query.filter(Device.id.in_(DeviceService.visible_device_ids(user_id)))
+        return query
+    
+    @staticmethod
+    def has_permission(user_id: int, device_id: int, permission_type: str = 'read') -> bool:
+        """检查用户对设备是否有指定权限（write 权限包含 read），基于授权范围缓存"""
+        return authz_cache.get(user_id).allows(device_id, permission_type)
+    
+    @staticmethod
+    def get_devices(user_id: int, is_admin: bool, terms: Iterable[FilterTerm] = ()) -> List[Device]:
+        """获取设备列表
+        
+        Args:
+            user_id: 当前用户 ID
+            is_admin: 是否管理员
+            terms: 过滤条件，见 app.utils.device_filter
+            
+        Raises:
+            FilterError: 过滤条件无法使用索引且扫描行数超过上限
+        """
+        query = DeviceService.scoped_query(user_id, is_admin)
+        indexed, residual = compile_filter(terms)
+        if residual and not indexed:
+            limit = current_app.config['DEVICE_FILTER_MAX_SCAN_ROWS']
+            if query.order_by(None).limit(limit + 1).count() > limit:
+                raise FilterError('tag 条件无法使用索引，请同时指定 status/name/ip/mac 条件')
+        return query.filter(*indexed, *residual).order_by(Device.id).all()
+    
+    @staticmethod
+    def get_device(device_id: int, user_id: int, is_admin: bool) -> Optional[Device]:
+        """按 ID 获取可见设备，没有读权限时视为不存在"""
+        device = entity_cache.get(Device, device_id)
+        if device is None or (not is_admin and not DeviceService.has_permission(user_id, device_id)):
+            return None
+        return device
     
     @staticmethod
     def update_device(device_id: int, data: dict) -> Optional[Device]:
-        """更新设备信息"""
-        device = db.session.get(Device, device_id)
+        """更新设备信息
+        
+        Raises:
+            DuplicateDeviceError: MAC 地址已被其他设备使用
+            ValueError: IP 或 MAC 地址无效
+        """
+        device = entity_cache.get(Device, device_id)
         if not device:
             return None
             
+        try:
+            if 'ip_address' in data:
+                device.ip_address = data['ip_address']
+            if 'mac_address' in data:
+                device.mac_address = data['mac_address']
+                DeviceService._check_mac_unique(device)
+        except ValueError:
+            db.session.rollback()
+            raise
         if 'name' in data:
             device.name = data['name']
-        if 'ip_address' in data:
-            device.ip_address = data['ip_address']
-        if 'mac_address' in data:
-            device.mac_address = data['mac_address']
         if 'description' in data:
             device.description = data['description']
         if 'tags' in data:
             device.tags = ','.join(data['tags']) if data['tags'] else ''
         
+        if any(field in data for field in SEARCH_FIELDS):
+            SearchService.index_device(device)
         db.session.commit()
         return device
     
+    @staticmethod
+    def _check_mac_unique(device: Device) -> None:
+        """检查 MAC 地址是否已被其他设备使用"""
+        if device.mac_int is None:
+            return
+        with db.session.no_autoflush:
+            query = Device.query.filter(Device.mac_int == device.mac_int)
+            if device.id is not None:
+                query = query.filter(Device.id != device.id)
+            if query.first():
+                raise DuplicateDeviceError('MAC地址已存在')
+    
+    @staticmethod
+    def get_device_by_mac(mac: str, user_id: int, is_admin: bool) -> Optional[Device]:
+        """按 MAC 地址查找可见设备
+        
+        Raises:
+            ValueError: MAC 地址无效
+        """
+        return DeviceService.scoped_query(user_id, is_admin).filter(
+            Device.mac_int == parse_mac(mac)
+        ).first()
+    
+    @staticmethod
+    def resolve_macs(macs: List[str], user_id: int, is_admin: bool) -> dict:
+        """批量将 MAC 地址解析为设备 ID
+        
+        Returns:
+            dict: 原始 MAC 字符串到设备 ID 的映射，未找到或无效的 MAC 映射为 None
+        """
+        parsed = {}
+        for mac in macs:
+            try:
+                parsed[mac] = parse_mac(mac)
+            except ValueError:
+                parsed[mac] = None
+        
+        values = list({value for value in parsed.values() if value is not None})
+        found = {}
+        query = DeviceService.scoped_query(user_id, is_admin).with_entities(Device.mac_int, Device.id)
+        for i in range(0, len(values), MAC_LOOKUP_CHUNK_SIZE):
+            found.update(query.filter(Device.mac_int.in_(values[i:i + MAC_LOOKUP_CHUNK_SIZE])).all())
+        return {mac: found.get(value) for mac, value in parsed.items()}
+    
+    @staticmethod
+    def delete_devices(device_ids: List[int]) -> int:
+        """删除设备及其授权、分组成员和搜索索引，不提交事务
+        
+        调用方负责提交事务，并在提交后调用 authz_cache.discard_devices。
+        
+        Returns:
+            int: 删除的授权记录数
+        """
+        if not device_ids:
+            return 0
+        # 批量删除不经过 ORM 事件，需要显式记录墓碑
+        ChangeService.record_deletes(device_ids, db.session.query(
+            DeviceUserAssociation.device_id, DeviceUserAssociation.user_id
+        ).filter(DeviceUserAssociation.device_id.in_(device_ids)).all())
+        associations = DeviceUserAssociation.query.filter(
+            DeviceUserAssociation.device_id.in_(device_ids)
+        ).delete(synchronize_session=False)
+        DeviceGroupMember.query.filter(
+            DeviceGroupMember.device_id.in_(device_ids)
+        ).delete(synchronize_session=False)
+        DeviceTrigram.query.filter(
+            DeviceTrigram.device_id.in_(device_ids)
+        ).delete(synchronize_session=False)
+        Device.query.filter(Device.id.in_(device_ids)).delete(synchronize_session=False)
+        device_fragments.evict(device_ids)
+        return associations
+    
+    @staticmethod
+    def delete_device(device_id: int) -> bool:
+        """删除单个设备"""
+        if not entity_cache.get(Device, device_id):
+            return False
+        DeviceService.delete_devices([device_id])
+        db.session.commit()
+        authz_cache.discard_devices([device_id])
+        return True
+    
     @staticmethod
     def authorize_device(device_id: int, user_id: int, permission_type: str = 'read') -> Optional[DeviceUserAssociation]:
         """授权设备给用户"""
         # 检查设备和用户是否存在
-        device = db.session.get(Device, device_id)
-        user = db.session.get(User, user_id)
+        device = entity_cache.get(Device, device_id)
+        user = entity_cache.get(User, user_id)
         if not device or not user:
             return None
             
@@ -78,33 +274,109 @@ class DeviceService:
         )
         db.session.add(association)
         db.session.commit()
+        authz_cache.grant(user.id, [device.id], permission_type)
         return association
     
     @staticmethod
-    def batch_authorize_by_tags(tags: List[str], user_id: int, permission_type: str = 'read') -> List[DeviceUserAssociation]:
-        """根据标签批量授权设备"""
-        devices = []
-        for tag in tags:
-            devices.extend(Device.query.filter(Device.tags.like(f'%{tag}%')).all())
-        devices = list(set(devices))  # 去重
+    def batch_authorize_query(tags: List[str], cidr: Optional[str] = None):
+        """批量授权匹配的设备查询，标签按完整标签匹配（与过滤表达式的 tag 条件相同）
+        
+        Raises:
+            ValueError: 网段或标签无效
+        """
+        query = Device.query
+        if cidr:
+            low, high = cidr_range(cidr)
+            query = query.filter(Device.ip_packed.between(low, high))
+        if tags:
+            if isinstance(tags, str) or not all(isinstance(tag, str) and tag for tag in tags):
+                raise ValueError('无效的标签')
+            _, residual = compile_filter([FilterTerm('tag', tuple(tags))])
+            query = query.filter(*residual)
+        return query
+    
+    @staticmethod
+    def batch_authorize_by_tags(tags: List[str], user_id: int, permission_type: str = 'read',
+                                cidr: Optional[str] = None, context: Optional[JobContext] = None) -> int:
+        """根据标签和/或网段批量授权设备
+        
+        多个标签之间为 OR 关系；指定网段时只授权网段内的设备。按设备 ID 键集顺序分块处理，每块一个事务；
+        在后台任务中执行时每块之后上报进度并续约。已有的授权只更新权限类型，重复执行是安全的。
+        
+        Returns:
+            int: 新增的授权数
         
-        associations = []
-        for device in devices:
-            existing = DeviceUserAssociation.query.filter_by(
-                device_id=device.id,
-                user_id=user_id
-            ).first()
+        Raises:
+            ValueError: 网段无效
+            JobLeaseLost: 任务已被其他 worker 接管
+        """
+        query = DeviceService.batch_authorize_query(tags, cidr)
+        chunk_size = current_app.config['BATCH_AUTHORIZE_CHUNK_SIZE']
+        cursor = 0
+        done = created = 0
+        while True:
+            ids = [device_id for (device_id,) in query.with_entities(Device.id).filter(
+                Device.id > cursor
+            ).order_by(Device.id).limit(chunk_size)]
+            if not ids:
+                return created
             
-            if existing:
-                existing.permission_type = permission_type
-            else:
-                assoc = DeviceUserAssociation(
-                    device_id=device.id,
-                    user_id=user_id,
-                    permission_type=permission_type
+            existing = {
+                assoc.device_id: assoc for assoc in DeviceUserAssociation.query.filter(
+                    DeviceUserAssociation.user_id == user_id,
+                    DeviceUserAssociation.device_id.in_(ids)
                 )
-                db.session.add(assoc)
-                associations.append(assoc)
-                
-        db.session.commit()
-        return associations
+            }
+            for device_id in ids:
+                if device_id in existing:
+                    existing[device_id].permission_type = permission_type
+                else:
+                    db.session.add(DeviceUserAssociation(
+                        device_id=device_id,
+                        user_id=user_id,
+                        permission_type=permission_type
+                    ))
+                    created += 1
+            db.session.commit()
+            authz_cache.grant(user_id, ids, permission_type)
+            
+            cursor = ids[-1]
+            done += len(ids)
+            if context is not None:
+                context.progress(done)
+    
+    @staticmethod
+    def subnet_summary(user_id: int, is_admin: bool, prefixlen: int = 24, version: int = 4) -> List[dict]:
+        """按网段统计设备数量，在数据库中按编码前缀分组
+        
+        Args:
+            user_id: 当前用户 ID
+            is_admin: 是否管理员
+            prefixlen: 网段前缀长度，必须是 8 的倍数
+            version: IP 版本，4 或 6
+            
+        Raises:
+            ValueError: 前缀长度无效
+        """
+        key_length = subnet_key_length(version, prefixlen)
+        key = func.substr(Device.ip_packed, 1, key_length)
+        query = DeviceService.scoped_query(user_id, is_admin)
+        if version == 4:
+            query = query.filter(Device.ip_packed.between(*IPV4_RANGE))
+        else:
+            query = query.filter(or_(Device.ip_packed < IPV4_RANGE[0], Device.ip_packed > IPV4_RANGE[1]))
+        rows = query.with_entities(key, func.count(Device.id)).group_by(key).order_by(key).all()
+        return [{'subnet': subnet_from_key(subnet, prefixlen), 'count': count} for subnet, count in rows]
+
+
+@job_handler('batch_authorize')
+def run_batch_authorize_job(payload: dict, context: JobContext) -> dict:
+    """后台任务：分块批量授权设备，重复执行时已有的授权只会更新权限类型"""
+    count = DeviceService.batch_authorize_by_tags(
+        tags=payload.get('tags') or [],
+        user_id=payload['user_id'],
+        permission_type=payload.get('permission_type', 'read'),
+        cidr=payload.get('cidr'),
+        context=context
+    )
+    return {'count': count}
@@ -0,0 +1,279 @@
+"""实体缓存模块
+
+按主键读取设备和用户时使用两级缓存：
+- 本进程的 LRU，命中后 ENTITY_CACHE_LOCAL_TTL 秒内直接使用，之后与共享层比对版本号；
+- 同一台机器上各 worker 共享的内存表（见 app.utils.shm.SharedCacheTable），保存行的列值。
+
+命中时把列值组装为持久化状态的 ORM 对象加入当前会话，不查询数据库，调用方可以像
+db.session.get 的结果一样修改后提交。不存在的 ID 缓存 ENTITY_CACHE_NEGATIVE_TTL 秒。
+
+失效：通过 ORM flush 修改的对象在 flush 后和提交后各失效一次；批量 UPDATE/DELETE/INSERT
+语句使整个模型的缓存代数加一。写入缓存时要求键最后一次失效早于读取数据库的事务开始时间，
+并发加载不会把失效之前的旧数据写回。同一进程内同一实体的未命中加载只执行一次。
+
+共享层只在单台机器内共享，多台服务器之间的修改最长 ENTITY_CACHE_TTL 秒后生效。
+共享层以 JSON 保存列值，不保存模型 _hidden_columns 中的列（如密码哈希），这些列在访问时从数据库加载。
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional
+from flask import current_app, has_app_context
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+from app.models.device import Device
+from app.models.user import User
+from app.models.base import db
+from app.utils.metrics import Metric, register_collector
+from app.utils.shm import CACHE_EMPTY, CACHE_MISSING, CACHE_VALUE, SharedCacheTable
+
+CACHED_MODELS = {model.__tablename__: model for model in (Device, User)}
+
+# 未命中加载按 (表, ID) 哈希分段加锁
+LOAD_LOCK_STRIPES = 64
+
+# session.info 中的键
+_TX_STARTED = 'entity_cache_tx_started'
+_PENDING = 'entity_cache_pending'
+
+
+def _encode(data: dict) -> bytes:
+    """列值编码为 JSON，日期时间和二进制列带类型标记"""
+    def default(value):
+        if isinstance(value, datetime):
+            return {'$t': value.isoformat()}
+        if isinstance(value, bytes):
+            return {'$b': value.hex()}
+        raise TypeError(f'无法缓存的列值类型: {type(value).__name__}')
+    return json.dumps(data, default=default, separators=(',', ':')).encode()
+
+
+def _decode_value(obj: dict):
+    if '$t' in obj:
+        return datetime.fromisoformat(obj['$t'])
+    if '$b' in obj:
+        return bytes.fromhex(obj['$b'])
+    return obj
+
+
+def _decode(payload: bytes) -> dict:
+    return json.loads(payload, object_hook=_decode_value)
+
+
+def default_shm_path() -> str:
+    """默认的共享内存文件路径"""
+    directory = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return os.path.join(directory, 'box-entities')
+
+
+class EntityCache:
+    """设备与用户的两级读缓存"""
+
+    def __init__(self):
+        self._shared = None
+        self._shared_lock = threading.Lock()
+        self._local: 'OrderedDict[tuple, list]' = OrderedDict()  # (表, ID) -> [代数, 版本号, 类型, 列值, 校验时间]
+        self._local_lock = threading.Lock()
+        self._load_locks = [threading.Lock() for _ in range(LOAD_LOCK_STRIPES)]
+        self.local_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.rejected_fills = 0
+
+    def get(self, model, ident):
+        """按主键获取对象，行为与 db.session.get 相同"""
+        try:
+            ident = int(ident)
+        except (TypeError, ValueError):
+            return None
+        session = db.session
+        table = model.__tablename__
+        if not current_app.config['ENTITY_CACHE_ENABLED'] or table not in CACHED_MODELS:
+            return session.get(model, ident)
+        existing = session.identity_map.get(inspect(model).identity_key_from_primary_key([ident]))
+        if existing is not None:
+            return existing
+
+        entry = self._lookup(table, ident)
+        if entry is None:
+            entry = self._load(session, model, ident)
+            if not isinstance(entry, list):
+                return entry
+        if entry[2] == CACHE_MISSING:
+            return None
+        return self._attach(session, model, entry[3])
+
+    def _lookup(self, table: str, ident: int) -> Optional[list]:
+        """依次查找本地层和共享层，都未命中时返回 None"""
+        local_key = (table, ident)
+        with self._local_lock:
+            entry = self._local.get(local_key)
+            if entry is not None and time.monotonic() - entry[4] < current_app.config['ENTITY_CACHE_LOCAL_TTL']:
+                self._local.move_to_end(local_key)
+                self.local_hits += 1
+                return entry
+
+        shared = self._get_shared()
+        generation = shared.read(f'gen:{table}')[0]
+        version, kind, payload, _ = shared.read(f'{table}:{generation}:{ident}')
+        if kind == CACHE_EMPTY:
+            return None
+        if entry is not None and entry[0] == generation and entry[1] == version:
+            data = entry[3]
+        else:
+            data = _decode(payload) if kind == CACHE_VALUE else None
+            # 键哈希冲突时槽中可能是其他行
+            if data is not None and data.get('id') != ident:
+                return None
+        self.shared_hits += 1
+        return self._store_local(local_key, [generation, version, kind, data, time.monotonic()])
+
+    def _load(self, session, model, ident: int):
+        """从数据库加载并写入缓存；同一进程内并发的相同加载只执行一次"""
+        table = model.__tablename__
+        with self._load_locks[hash((table, ident)) % LOAD_LOCK_STRIPES]:
+            entry = self._lookup(table, ident)
+            if entry is not None:
+                return entry
+            self.misses += 1
+            shared = self._get_shared()
+            generation, _, _, generation_bumped = shared.read(f'gen:{table}')
+            obj = session.get(model, ident)
+            not_before = session.info.get(_TX_STARTED, 0.0)
+            if obj is None:
+                kind, data, ttl = CACHE_MISSING, None, current_app.config['ENTITY_CACHE_NEGATIVE_TTL']
+            else:
+                kind, ttl = CACHE_VALUE, current_app.config['ENTITY_CACHE_TTL']
+                hidden = getattr(model, '_hidden_columns', ())
+                data = {
+                    attr.key: getattr(obj, attr.key) for attr in inspect(model).column_attrs if attr.key not in hidden
+                }
+            payload = _encode(data) if data is not None else b''
+            key = f'{table}:{generation}:{ident}'
+            version = shared.fill(key, kind, payload, ttl, not_before) if generation_bumped < not_before else None
+            if version is not None:
+                self._store_local((table, ident), [generation, version, kind, data, time.monotonic()])
+            else:
+                self.rejected_fills += 1
+            return obj
+
+    @staticmethod
+    def _attach(session, model, data: dict):
+        """把缓存的列值组装为持久化对象加入会话"""
+        obj = inspect(model).class_manager.new_instance()
+        for key, value in data.items():
+            set_committed_value(obj, key, value)
+        make_transient_to_detached(obj)
+        session.add(obj)
+        return obj
+
+    def _store_local(self, local_key: tuple, entry: list) -> list:
+        with self._local_lock:
+            self._local[local_key] = entry
+            self._local.move_to_end(local_key)
+            while len(self._local) > current_app.config['ENTITY_CACHE_LOCAL_SIZE']:
+                self._local.popitem(last=False)
+        return entry
+
+    def invalidate(self, table: str, ident: int) -> None:
+        """使单个实体失效"""
+        shared = self._get_shared()
+        generation = shared.read(f'gen:{table}')[0]
+        shared.bump(f'{table}:{generation}:{ident}')
+        with self._local_lock:
+            self._local.pop((table, ident), None)
+
+    def invalidate_model(self, table: str) -> None:
+        """使模型的所有缓存失效"""
+        self._get_shared().bump(f'gen:{table}')
+        with self._local_lock:
+            for local_key in [key for key in self._local if key[0] == table]:
+                del self._local[local_key]
+
+    def clear_local(self) -> None:
+        with self._local_lock:
+            self._local.clear()
+
+    def _get_shared(self) -> SharedCacheTable:
+        # worker fork 之后再打开映射
+        with self._shared_lock:
+            if self._shared is None:
+                self._shared = SharedCacheTable(
+                    current_app.config['ENTITY_CACHE_SHM_PATH'] or default_shm_path(),
+                    current_app.config['ENTITY_CACHE_SLOTS'],
+                    current_app.config['ENTITY_CACHE_SLOT_BYTES']
+                )
+            return self._shared
+
+    def collect(self):
+        """metrics 采集函数"""
+        return [
+            Metric('box_entity_cache_lookups_total', 'counter', 'Entity cache lookups by result', [
+                ({'result': 'local_hit'}, self.local_hits),
+                ({'result': 'shared_hit'}, self.shared_hits),
+                ({'result': 'miss'}, self.misses),
+            ]),
+            Metric('box_entity_cache_rejected_fills_total', 'counter',
+                   'Loads not cached because the entity was invalidated during the read', [({}, self.rejected_fills)]),
+            Metric('box_entity_cache_local_entries', 'gauge', 'Entries in the in-process tier', [({}, len(self._local))]),
+        ]
+
+
+entity_cache = EntityCache()
+register_collector(entity_cache.collect)
+
+
+def _enabled() -> bool:
+    return has_app_context() and current_app.config['ENTITY_CACHE_ENABLED']
+
+
+@event.listens_for(Session, 'after_begin')
+def _record_transaction_start(session, transaction, connection):
+    session.info[_TX_STARTED] = time.time()
+
+
+@event.listens_for(Session, 'after_flush')
+def _invalidate_flushed(session, flush_context):
+    """flush 后立即失效，提交后再失效一次（提交前其他事务仍可能读到旧数据并写回缓存）"""
+    if not _enabled():
+        return
+    pending = session.info.setdefault(_PENDING, set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        table = getattr(obj, '__tablename__', None)
+        if table in CACHED_MODELS and obj.id is not None:
+            entity_cache.invalidate(table, obj.id)
+            pending.add((table, obj.id))
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _invalidate_bulk(orm_execute_state):
+    """批量 UPDATE/DELETE/INSERT 无法确定影响的行，使整个模型失效"""
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert):
+        return
+    if not _enabled():
+        return
+    pending = orm_execute_state.session.info.setdefault(_PENDING, set())
+    for mapper in orm_execute_state.all_mappers:
+        table = mapper.class_.__tablename__
+        if table in CACHED_MODELS:
+            entity_cache.invalidate_model(table)
+            pending.add((table, None))
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed(session):
+    for table, ident in session.info.pop(_PENDING, ()):
+        if ident is None:
+            entity_cache.invalidate_model(table)
+        else:
+            entity_cache.invalidate(table, ident)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_pending(session):
+    session.info.pop(_PENDING, None)
@@ -0,0 +1,157 @@
+"""分组授权服务模块"""
+from typing import List, Optional, Tuple
+from sqlalchemy import literal
+from app.models.device import Device
+from app.models.group import DeviceGroup, DeviceGroupMember, GroupGrant, UserGroup, UserGroupMember
+from app.models.user import User
+from app.models.base import db
+from app.services.authz_cache import authz_cache
+from app.utils.device_filter import FilterError, FilterTerm, compile_filter
+
+class GroupService:
+    """分组授权服务类"""
+    
+    @staticmethod
+    def create_group(model, name: str, description: str = '') -> Tuple[Optional[object], Optional[str]]:
+        """创建设备组或用户组
+        
+        Args:
+            model: DeviceGroup 或 UserGroup
+            name: 组名
+            description: 描述
+            
+        Returns:
+            Tuple[Optional[object], Optional[str]]: (分组对象, 错误信息)
+        """
+        if model.query.filter_by(name=name).first():
+            return None, '分组名称已存在'
+        group = model(name=name, description=description)
+        group.save()
+        return group, None
+    
+    @staticmethod
+    def list_groups(model, member_model) -> List[dict]:
+        """列出分组及成员数量"""
+        counts = dict(
+            db.session.query(member_model.group_id, db.func.count())
+            .group_by(member_model.group_id).all()
+        )
+        result = []
+        for group in model.query.order_by(model.id).all():
+            item = group.to_dict()
+            item['member_count'] = counts.get(group.id, 0)
+            result.append(item)
+        return result
+    
+    @staticmethod
+    def add_devices(group_id: int, device_ids: Optional[List[int]] = None,
+                    terms: Tuple[FilterTerm, ...] = ()) -> int:
+        """按设备 ID 或过滤条件向设备组添加设备，单条 INSERT ... SELECT 完成
+        
+        Returns:
+            int: 新增的成员数
+            
+        Raises:
+            FilterError: 过滤条件无效
+        """
+        indexed, residual = compile_filter(terms)
+        if not device_ids and not indexed and not residual:
+            raise FilterError('没有提供设备ID或过滤条件')
+        
+        query = db.select(literal(group_id), Device.id).where(*indexed, *residual).where(
+            ~db.select(DeviceGroupMember.device_id).where(
+                DeviceGroupMember.group_id == group_id,
+                DeviceGroupMember.device_id == Device.id
+            ).exists()
+        )
+        if device_ids:
+            query = query.where(Device.id.in_(device_ids))
+        result = db.session.execute(
+            db.insert(DeviceGroupMember).from_select(['group_id', 'device_id'], query)
+        )
+        db.session.commit()
+        authz_cache.invalidate()
+        return result.rowcount
+    
+    @staticmethod
+    def remove_devices(group_id: int, device_ids: List[int]) -> int:
+        """从设备组移除设备"""
+        count = DeviceGroupMember.query.filter(
+            DeviceGroupMember.group_id == group_id,
+            DeviceGroupMember.device_id.in_(device_ids)
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        authz_cache.invalidate()
+        return count
+    
+    @staticmethod
+    def add_users(group_id: int, user_ids: List[int]) -> int:
+        """向用户组添加用户
+        
+        Returns:
+            int: 新增的成员数
+        """
+        query = db.select(literal(group_id), User.id).where(
+            User.id.in_(user_ids),
+            ~db.select(UserGroupMember.user_id).where(
+                UserGroupMember.group_id == group_id,
+                UserGroupMember.user_id == User.id
+            ).exists()
+        )
+        result = db.session.execute(
+            db.insert(UserGroupMember).from_select(['group_id', 'user_id'], query)
+        )
+        db.session.commit()
+        authz_cache.invalidate(user_ids)
+        return result.rowcount
+    
+    @staticmethod
+    def remove_users(group_id: int, user_ids: List[int]) -> int:
+        """从用户组移除用户"""
+        count = UserGroupMember.query.filter(
+            UserGroupMember.group_id == group_id,
+            UserGroupMember.user_id.in_(user_ids)
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        authz_cache.invalidate(user_ids)
+        return count
+    
+    @staticmethod
+    def grant(user_group_id: int, device_group_id: int,
+              permission_type: str = 'read') -> Tuple[Optional[GroupGrant], Optional[str]]:
+        """授权用户组访问设备组，已存在时更新权限类型
+        
+        Returns:
+            Tuple[Optional[GroupGrant], Optional[str]]: (授权记录, 错误信息)
+        """
+        if not db.session.get(UserGroup, user_group_id):
+            return None, '用户组不存在'
+        if not db.session.get(DeviceGroup, device_group_id):
+            return None, '设备组不存在'
+        
+        grant = GroupGrant.query.filter_by(
+            user_group_id=user_group_id,
+            device_group_id=device_group_id
+        ).first()
+        if grant:
+            grant.permission_type = permission_type
+        else:
+            grant = GroupGrant(
+                user_group_id=user_group_id,
+                device_group_id=device_group_id,
+                permission_type=permission_type
+            )
+            db.session.add(grant)
+        db.session.commit()
+        authz_cache.invalidate()
+        return grant, None
+    
+    @staticmethod
+    def revoke(grant_id: int) -> bool:
+        """撤销分组授权"""
+        grant = db.session.get(GroupGrant, grant_id)
+        if not grant:
+            return False
+        grant.delete()
+        authz_cache.invalidate()
+        return True
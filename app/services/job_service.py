@@ -0,0 +1,232 @@
+"""后台任务队列服务模块
+
+任务持久化在数据库 jobs 表中，由 ``flask worker`` 启动的线程池执行，不依赖外部消息队列。
+处理函数通过 ``job_handler`` 装饰器按任务类型注册，签名为 ``handler(payload, context)``，
+返回值（可 JSON 序列化）保存为任务结果。
+"""
+import os
+import socket
+import threading
+from collections import namedtuple
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+from flask import current_app
+from sqlalchemy import and_, func, or_
+from app.models.job import Job
+from app.models.base import db
+
+JobType = namedtuple('JobType', ['handler', 'max_attempts'])
+
+# 任务类型 -> 处理函数
+JOB_HANDLERS: Dict[str, JobType] = {}
+
+
+def job_handler(job_type: str, max_attempts: int = 3):
+    """注册任务处理函数，任务失败后最多执行 max_attempts 次"""
+    def decorator(func):
+        JOB_HANDLERS[job_type] = JobType(func, max_attempts)
+        return func
+    return decorator
+
+
+class JobLeaseLost(Exception):
+    """任务租约已过期并被其他 worker 接管"""
+    pass
+
+
+class JobContext:
+    """传给处理函数的任务上下文，用于上报进度并续约"""
+
+    def __init__(self, job_id: int, worker_id: str):
+        self.job_id = job_id
+        self.worker_id = worker_id
+
+    def progress(self, done: int, total: Optional[int] = None) -> None:
+        """上报进度并延长租约，长时间运行的处理函数应定期调用
+
+        Raises:
+            JobLeaseLost: 任务已被其他 worker 接管，应立即停止
+        """
+        values = {'progress': done, 'lease_expires_at': JobService.lease_deadline()}
+        if total is not None:
+            values['total'] = total
+        updated = Job.query.filter_by(id=self.job_id, worker_id=self.worker_id, status='running').update(
+            values, synchronize_session=False
+        )
+        db.session.commit()
+        if not updated:
+            raise JobLeaseLost(f'任务 {self.job_id} 的租约已失效')
+
+
+class JobService:
+    """后台任务服务类"""
+
+    @staticmethod
+    def lease_deadline() -> datetime:
+        return datetime.utcnow() + timedelta(seconds=current_app.config['JOB_LEASE_SECONDS'])
+
+    @staticmethod
+    def enqueue(job_type: str, payload: dict, user_id: Optional[int] = None,
+                total: Optional[int] = None) -> Job:
+        """创建任务，由 worker 异步执行"""
+        if job_type not in JOB_HANDLERS:
+            raise ValueError(f'未知的任务类型: {job_type}')
+        job = Job(
+            type=job_type,
+            status='queued',
+            payload=payload,
+            total=total,
+            max_attempts=JOB_HANDLERS[job_type].max_attempts,
+            run_after=datetime.utcnow(),
+            created_by=user_id
+        )
+        job.save()
+        return job
+
+    @staticmethod
+    def is_active(job: Optional[Job]) -> bool:
+        """任务是否仍在排队或持有有效租约"""
+        if job is None:
+            return False
+        if job.status == 'queued':
+            return True
+        return job.status == 'running' and job.lease_expires_at > datetime.utcnow()
+
+    @staticmethod
+    def claim(worker_id: str) -> Optional[Job]:
+        """抢占一个可执行的任务
+
+        可执行的任务包括到期的排队任务，以及租约已过期的运行中任务（worker 崩溃后重新执行）。
+        正在运行的任务数已达到 JOB_CONCURRENCY 上限的类型不会被抢占；多个进程同时抢占时
+        上限只在抢占时检查，可能被短暂超出。
+        """
+        now = datetime.utcnow()
+        expired = and_(Job.status == 'running', Job.lease_expires_at <= now)
+
+        # 重试次数用尽的过期任务直接标记失败
+        Job.query.filter(expired, Job.attempts >= Job.max_attempts).update(
+            {'status': 'failed', 'error': '任务执行超时且已达到最大重试次数', 'worker_id': None},
+            synchronize_session=False
+        )
+        db.session.commit()
+
+        running = dict(db.session.query(Job.type, func.count(Job.id)).filter(
+            Job.status == 'running', Job.lease_expires_at > now
+        ).group_by(Job.type))
+        limits = current_app.config['JOB_CONCURRENCY']
+        types = [job_type for job_type in JOB_HANDLERS if running.get(job_type, 0) < limits.get(job_type, 1)]
+        if not types:
+            return None
+
+        claimable = and_(
+            Job.type.in_(types),
+            or_(and_(Job.status == 'queued', Job.run_after <= now), expired)
+        )
+        candidates = [job_id for (job_id,) in db.session.query(Job.id).filter(claimable).order_by(Job.id).limit(10)]
+        for job_id in candidates:
+            # 条件更新保证同一任务只会被一个 worker 抢到
+            claimed = Job.query.filter(Job.id == job_id, claimable).update({
+                'status': 'running',
+                'worker_id': worker_id,
+                'lease_expires_at': JobService.lease_deadline(),
+                'attempts': Job.attempts + 1,
+            }, synchronize_session=False)
+            db.session.commit()
+            if claimed:
+                return db.session.get(Job, job_id, populate_existing=True)
+        return None
+
+    @staticmethod
+    def execute(job: Job, worker_id: str) -> None:
+        """执行已抢占的任务，失败时按指数退避重新排队"""
+        job_id, job_type, attempts, max_attempts = job.id, job.type, job.attempts, job.max_attempts
+        mine = Job.query.filter_by(id=job_id, worker_id=worker_id, status='running')
+        try:
+            result = JOB_HANDLERS[job_type].handler(job.payload, JobContext(job_id, worker_id))
+        except JobLeaseLost:
+            db.session.rollback()
+            return
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error(f"Job {job_id} ({job_type}) attempt {attempts} error: {str(e)}")
+            if attempts < max_attempts:
+                backoff = current_app.config['JOB_RETRY_BACKOFF_SECONDS'] * 2 ** (attempts - 1)
+                values = {'status': 'queued', 'run_after': datetime.utcnow() + timedelta(seconds=backoff)}
+            else:
+                values = {'status': 'failed'}
+            values.update({'error': str(e)[:500], 'worker_id': None, 'lease_expires_at': None})
+            mine.update(values, synchronize_session=False)
+            db.session.commit()
+            return
+
+        mine.update({
+            'status': 'succeeded',
+            'result': result,
+            'error': None,
+            'worker_id': None,
+            'lease_expires_at': None,
+        }, synchronize_session=False)
+        db.session.commit()
+
+    @staticmethod
+    def run_pending(worker_id: Optional[str] = None) -> int:
+        """在当前线程中执行所有可执行的任务，返回执行的任务数"""
+        worker_id = worker_id or JobWorker.make_worker_id()
+        count = 0
+        while True:
+            job = JobService.claim(worker_id)
+            if job is None:
+                return count
+            JobService.execute(job, worker_id)
+            count += 1
+
+
+class JobWorker:
+    """任务 worker 线程池"""
+
+    def __init__(self, app, threads: int = 4):
+        self.app = app
+        self.threads = threads
+        self.stopping = threading.Event()
+
+    @staticmethod
+    def make_worker_id() -> str:
+        return f'{socket.gethostname()}:{os.getpid()}:{threading.current_thread().name}'[:100]
+
+    def run(self) -> None:
+        """启动线程池并阻塞，直到 stop() 被调用"""
+        workers = [
+            threading.Thread(target=self._loop, name=f'job-worker-{i}', daemon=True)
+            for i in range(self.threads)
+        ]
+        for worker in workers:
+            worker.start()
+        try:
+            while any(worker.is_alive() for worker in workers):
+                for worker in workers:
+                    worker.join(timeout=1)
+        except KeyboardInterrupt:
+            self.stop()
+            for worker in workers:
+                worker.join()
+
+    def stop(self) -> None:
+        """当前任务执行完后停止"""
+        self.stopping.set()
+
+    def _loop(self) -> None:
+        worker_id = self.make_worker_id()
+        with self.app.app_context():
+            poll_interval = current_app.config['JOB_POLL_INTERVAL']
+            while not self.stopping.is_set():
+                try:
+                    job = JobService.claim(worker_id)
+                    if job is not None:
+                        JobService.execute(job, worker_id)
+                        continue
+                except Exception as e:
+                    db.session.rollback()
+                    current_app.logger.error(f"Job worker {worker_id} error: {str(e)}")
+                finally:
+                    db.session.remove()
+                self.stopping.wait(poll_interval)
@@ -0,0 +1,139 @@
+"""设备批量删除服务模块"""
+import time
+from typing import Optional, Tuple
+from flask import current_app
+from app.models.device import Device, DevicePurge
+from app.models.job import Job
+from app.models.base import db
+from app.services.authz_cache import authz_cache
+from app.services.device_service import DeviceService
+from app.services.job_service import JobContext, JobService, job_handler
+from app.utils.device_filter import FilterError, compile_filter, parse_filter
+
+# 可以继续执行的任务状态
+RESUMABLE_STATUSES = ('pending', 'running', 'failed')
+
+
+class PurgeService:
+    """设备批量删除服务类
+    
+    按设备 ID 键集顺序分块删除，每块一个短事务，块之间休眠以限制对数据库的压力。
+    """
+    
+    @staticmethod
+    def create(expression: str, user_id: int) -> Tuple[Optional[DevicePurge], Optional[str]]:
+        """创建批量删除任务
+        
+        Args:
+            expression: 过滤表达式，不能为空
+            user_id: 创建人 ID
+            
+        Returns:
+            Tuple[Optional[DevicePurge], Optional[str]]: (任务, 错误信息)
+        """
+        try:
+            terms = parse_filter(expression)
+            if not terms:
+                return None, '批量删除必须指定过滤条件'
+            indexed, residual = compile_filter(terms)
+        except FilterError as e:
+            return None, str(e)
+        
+        purge = DevicePurge(
+            filter=expression,
+            status='pending',
+            total=Device.query.filter(*indexed, *residual).count(),
+            created_by=user_id
+        )
+        purge.save()
+        return purge, None
+    
+    @staticmethod
+    def start(purge_id: int) -> bool:
+        """提交后台任务执行批量删除
+        
+        Returns:
+            bool: 任务已在排队或执行中时返回 False
+        """
+        purge = db.session.get(DevicePurge, purge_id)
+        if JobService.is_active(db.session.get(Job, purge.job_id) if purge.job_id else None):
+            return False
+        job = JobService.enqueue('device_purge', {'purge_id': purge_id}, purge.created_by, total=purge.total)
+        purge.job_id = job.id
+        db.session.commit()
+        return True
+    
+    @staticmethod
+    def run(purge_id: int, context: Optional[JobContext] = None) -> Optional[DevicePurge]:
+        """执行任务直到完成、取消或失败，可重复调用以从游标处继续
+        
+        Args:
+            purge_id: 任务 ID
+            context: 后台任务上下文，每块删除后上报进度并续约
+        """
+        purge = db.session.get(DevicePurge, purge_id)
+        if not purge or purge.status not in RESUMABLE_STATUSES:
+            return purge
+        
+        chunk_size = current_app.config['PURGE_CHUNK_SIZE']
+        throttle = current_app.config['PURGE_THROTTLE_SECONDS']
+        indexed, residual = compile_filter(parse_filter(purge.filter))
+        purge.status = 'running'
+        purge.error = None
+        db.session.commit()
+        
+        while True:
+            try:
+                ids = [device_id for (device_id,) in db.session.query(Device.id).filter(
+                    Device.id > purge.cursor, *indexed, *residual
+                ).order_by(Device.id).limit(chunk_size)]
+                if not ids:
+                    purge.status = 'completed'
+                    db.session.commit()
+                    return purge
+                
+                associations = DeviceService.delete_devices(ids)
+                purge.cursor = ids[-1]
+                purge.deleted_count += len(ids)
+                purge.association_count += associations
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                purge.status = 'failed'
+                purge.error = str(e)[:500]
+                db.session.commit()
+                raise
+            authz_cache.discard_devices(ids)
+            if context is not None:
+                context.progress(purge.deleted_count, purge.total)
+            
+            time.sleep(throttle)
+            # 取消操作由其他请求写入，需要重新读取状态
+            db.session.refresh(purge)
+            if purge.status == 'cancelled':
+                return purge
+    
+    @staticmethod
+    def cancel(purge_id: int) -> Tuple[Optional[DevicePurge], Optional[str]]:
+        """取消任务，已删除的设备不会恢复"""
+        purge = db.session.get(DevicePurge, purge_id)
+        if not purge:
+            return None, '任务不存在'
+        if purge.status not in RESUMABLE_STATUSES:
+            return None, '任务已结束'
+        purge.status = 'cancelled'
+        db.session.commit()
+        return purge, None
+
+
+@job_handler('device_purge')
+def run_purge_job(payload: dict, context: JobContext) -> dict:
+    """后台任务：执行批量删除，重复执行时从游标处继续"""
+    purge = PurgeService.run(payload['purge_id'], context)
+    if purge is None:
+        return None
+    return {
+        'status': purge.status,
+        'deleted_count': purge.deleted_count,
+        'association_count': purge.association_count,
+    }
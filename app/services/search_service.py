@@ -0,0 +1,112 @@
+"""设备搜索服务模块"""
+import math
+from typing import List, Set, Tuple
+from flask import current_app
+from sqlalchemy import func
+from app.models.device import Device, DeviceTrigram
+from app.models.base import db
+
+# 参与全文搜索的设备字段
+SEARCH_FIELDS = ('name', 'description', 'mac_address', 'ip_address')
+
+
+def trigrams(text: str) -> Set[str]:
+    """拆分文本为小写三元组"""
+    text = (text or '').lower()
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class SearchService:
+    """设备搜索服务类"""
+    
+    @staticmethod
+    def device_trigrams(device: Device) -> Set[str]:
+        """计算设备所有搜索字段的三元组"""
+        result = set()
+        for field in SEARCH_FIELDS:
+            result |= trigrams(getattr(device, field))
+        return result
+    
+    @staticmethod
+    def index_device(device: Device) -> None:
+        """重建单个设备的三元组索引，不提交事务
+        
+        设备需要已 flush 以获得 id，调用方负责在同一事务中提交。
+        """
+        DeviceTrigram.query.filter_by(device_id=device.id).delete(synchronize_session=False)
+        grams = SearchService.device_trigrams(device)
+        if grams:
+            db.session.execute(
+                db.insert(DeviceTrigram),
+                [{'trigram': gram, 'device_id': device.id} for gram in grams]
+            )
+    
+    @staticmethod
+    def search(keyword: str, user_id: int, is_admin: bool, limit: int = 20) -> List[Tuple[Device, float]]:
+        """按片段搜索设备
+        
+        Args:
+            keyword: 搜索关键字，至少 3 个字符
+            user_id: 当前用户 ID
+            is_admin: 是否管理员
+            limit: 最多返回条数
+            
+        Returns:
+            List[Tuple[Device, float]]: 按得分降序排列的 (设备, 得分)
+        """
+        from app.services.device_service import DeviceService
+        
+        grams = trigrams(keyword)
+        if not grams:
+            raise ValueError('搜索关键字至少需要 3 个字符')
+        
+        min_hits = math.ceil(len(grams) * current_app.config['SEARCH_MIN_SIMILARITY'])
+        hits = func.count(DeviceTrigram.trigram)
+        stmt = db.select(DeviceTrigram.device_id, hits).where(DeviceTrigram.trigram.in_(grams))
+        if not is_admin:
+            visible = DeviceService.scoped_query(user_id, is_admin).with_entities(Device.id)
+            stmt = stmt.where(DeviceTrigram.device_id.in_(visible))
+        # 多取一些候选，以便按子串匹配情况重新排序
+        stmt = stmt.group_by(DeviceTrigram.device_id).having(hits >= min_hits) \
+            .order_by(hits.desc(), DeviceTrigram.device_id).limit(limit * 3)
+        candidates = dict(db.session.execute(stmt).all())
+        if not candidates:
+            return []
+        
+        keyword = keyword.lower()
+        results = []
+        for device in Device.query.filter(Device.id.in_(candidates.keys())):
+            score = candidates[device.id] / len(grams)
+            values = [(getattr(device, field) or '').lower() for field in SEARCH_FIELDS]
+            if any(keyword in value for value in values):
+                score += 1
+            if values[0].startswith(keyword):
+                score += 0.5
+            results.append((device, round(score, 3)))
+        results.sort(key=lambda item: (-item[1], item[0].id))
+        return results[:limit]
+    
+    @staticmethod
+    def rebuild(batch_size: int = 1000) -> int:
+        """全量重建三元组索引
+        
+        Returns:
+            int: 已索引的设备数
+        """
+        DeviceTrigram.query.delete()
+        db.session.commit()
+        
+        count = 0
+        last_id = 0
+        while True:
+            devices = Device.query.filter(Device.id > last_id).order_by(Device.id).limit(batch_size).all()
+            if not devices:
+                break
+            rows = [{'trigram': gram, 'device_id': device.id}
+                    for device in devices for gram in SearchService.device_trigrams(device)]
+            if rows:
+                db.session.execute(db.insert(DeviceTrigram), rows)
+            db.session.commit()
+            count += len(devices)
+            last_id = devices[-1].id
+        return count
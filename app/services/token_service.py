@@ -0,0 +1,121 @@
+"""Token 撤销服务模块
+
+撤销的 jti 持久化在 revoked_tokens 表中，每个进程在内存中维护未过期 jti 的集合，
+每次请求只做一次集合查找。集合最多每 TOKEN_BLOCKLIST_SYNC_SECONDS 秒按自增 ID 从表中
+增量同步一次，其他进程撤销的 token 在该时间内生效；过期记录在同步时定期清理。
+
+自增 ID 在插入时分配，事务的提交顺序与 ID 顺序不一定一致：读到 ID N 时，更小的 ID 可能属于
+尚未提交的事务。因此同步时记录已读到的最大 ID 之下尚未出现的 ID（空洞），下次同步时一并查询；
+空洞超过 TOKEN_BLOCKLIST_GAP_SECONDS 仍未出现则视为事务已回滚而丢弃。
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+from flask import current_app
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+from app.models.user import RevokedToken
+from app.models.base import db
+
+# 每次同步最多记录的空洞数
+MAX_BLOCKLIST_GAPS = 1000
+
+
+class TokenBlocklist:
+    """已撤销 jti 的进程内集合"""
+
+    def __init__(self):
+        self._entries = {}  # jti -> expires_at
+        self._last_id = 0
+        self._gaps = {}  # 尚未出现的 ID -> 首次发现的时间
+        self._last_sync = float('-inf')
+        self._last_prune = time.monotonic()
+        self._sync_lock = threading.Lock()
+
+    def is_revoked(self, jti: str) -> bool:
+        """检查 jti 是否已撤销"""
+        if time.monotonic() - self._last_sync >= current_app.config['TOKEN_BLOCKLIST_SYNC_SECONDS']:
+            # 同一时间只需要一个线程同步，其他线程使用当前集合
+            if self._sync_lock.acquire(blocking=False):
+                try:
+                    self.sync()
+                finally:
+                    self._sync_lock.release()
+        return jti in self._entries
+
+    def add(self, jti: str, expires_at: datetime) -> None:
+        """在本进程中立即生效"""
+        self._entries[jti] = expires_at
+
+    def sync(self) -> None:
+        """从数据库增量加载新撤销的 jti，并定期清理过期记录"""
+        now = datetime.utcnow()
+        started = time.monotonic()
+        max_age = current_app.config['TOKEN_BLOCKLIST_GAP_SECONDS']
+        gaps = {row_id: seen for row_id, seen in self._gaps.items() if started - seen < max_age}
+
+        condition = RevokedToken.id > self._last_id
+        if gaps:
+            condition = or_(condition, RevokedToken.id.in_(list(gaps)))
+        rows = db.session.query(RevokedToken.id, RevokedToken.jti, RevokedToken.expires_at).filter(
+            condition,
+            RevokedToken.expires_at > now
+        ).order_by(RevokedToken.id).all()
+        for row_id, jti, expires_at in rows:
+            self._entries[jti] = expires_at
+            gaps.pop(row_id, None)
+            if row_id > self._last_id:
+                gaps.update((missing, started) for missing in
+                            range(max(self._last_id + 1, row_id - MAX_BLOCKLIST_GAPS), row_id))
+                self._last_id = row_id
+        self._gaps = gaps
+
+        if time.monotonic() - self._last_prune >= current_app.config['TOKEN_BLOCKLIST_PRUNE_SECONDS']:
+            # 替换而不是原地删除，其他线程读取时不会遇到字典大小变化
+            self._entries = {jti: expires_at for jti, expires_at in self._entries.items() if expires_at > now}
+            RevokedToken.query.filter(RevokedToken.expires_at <= now).delete(synchronize_session=False)
+            db.session.commit()
+            self._last_prune = time.monotonic()
+        self._last_sync = time.monotonic()
+
+    def clear(self) -> None:
+        self._entries = {}
+        self._last_id = 0
+        self._gaps = {}
+        self._last_sync = float('-inf')
+
+
+token_blocklist = TokenBlocklist()
+
+
+class TokenService:
+    """Token 撤销服务类"""
+
+    @staticmethod
+    def revoke(jti: str, expires_at: Optional[datetime] = None, user_id: Optional[int] = None) -> bool:
+        """撤销 token
+
+        Args:
+            jti: token 的 jti
+            expires_at: token 过期时间（UTC），未知时按最长有效期计算
+            user_id: token 所属用户 ID
+
+        Returns:
+            bool: 已撤销过时返回 False
+        """
+        if expires_at is None:
+            expires_at = datetime.utcnow() + current_app.config['JWT_ACCESS_TOKEN_EXPIRES']
+        db.session.add(RevokedToken(jti=jti, user_id=user_id, expires_at=expires_at))
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            return False
+        token_blocklist.add(jti, expires_at)
+        return True
+
+    @staticmethod
+    def expires_at(jwt_payload: dict) -> datetime:
+        """token 的过期时间（UTC）"""
+        return datetime(1970, 1, 1) + timedelta(seconds=jwt_payload['exp'])
@@ -0,0 +1,175 @@
+"""压缩位图模块
+
+按 Roaring Bitmap 的思路实现的整数集合：以高 16 位分桶，每个桶根据基数选择
+有序数组（基数不超过 4096，每个元素 2 字节）或位图（65536 位，8 KB，以 Python int 表示）
+两种容器，兼顾稀疏集合的内存占用与稠密集合的集合运算速度。
+"""
+from array import array
+from bisect import bisect_left
+from typing import Dict, Iterable, Iterator, Union
+
+# 数组容器的最大基数，超过后转换为位图容器
+ARRAY_MAX_SIZE = 4096
+
+Container = Union[array, int]
+
+
+def _popcount(value: int) -> int:
+    return bin(value).count('1')
+
+
+def _array_to_bits(values: array) -> int:
+    bits = 0
+    for value in values:
+        bits |= 1 << value
+    return bits
+
+
+def _bits_to_array(bits: int) -> array:
+    values = array('H')
+    while bits:
+        lowest = bits & -bits
+        values.append(lowest.bit_length() - 1)
+        bits ^= lowest
+    return values
+
+
+class RoaringBitmap:
+    """压缩整数位图，只支持 0 ~ 2^32-1 的非负整数"""
+
+    __slots__ = ('_containers',)
+
+    def __init__(self, values: Iterable[int] = ()):
+        self._containers: Dict[int, Container] = {}
+        self.update(values)
+
+    @staticmethod
+    def _split(value: int):
+        return value >> 16, value & 0xFFFF
+
+    def add(self, value: int) -> None:
+        """添加元素"""
+        high, low = self._split(value)
+        container = self._containers.get(high)
+        if container is None:
+            self._containers[high] = array('H', [low])
+        elif isinstance(container, int):
+            self._containers[high] = container | (1 << low)
+        else:
+            index = bisect_left(container, low)
+            if index < len(container) and container[index] == low:
+                return
+            container.insert(index, low)
+            if len(container) > ARRAY_MAX_SIZE:
+                self._containers[high] = _array_to_bits(container)
+
+    def update(self, values: Iterable[int]) -> None:
+        """批量添加元素"""
+        buckets: Dict[int, set] = {}
+        for value in values:
+            high, low = self._split(value)
+            buckets.setdefault(high, set()).add(low)
+        for high, lows in buckets.items():
+            container = self._containers.get(high)
+            if container is not None:
+                lows.update(container if not isinstance(container, int) else _bits_to_array(container))
+            self._containers[high] = self._from_lows(lows)
+
+    @staticmethod
+    def _from_lows(lows) -> Container:
+        if len(lows) > ARRAY_MAX_SIZE:
+            return _array_to_bits(lows)
+        return array('H', sorted(lows))
+
+    def discard(self, value: int) -> None:
+        """移除元素，不存在时忽略"""
+        high, low = self._split(value)
+        container = self._containers.get(high)
+        if container is None:
+            return
+        if isinstance(container, int):
+            container &= ~(1 << low)
+            if _popcount(container) <= ARRAY_MAX_SIZE:
+                container = _bits_to_array(container)
+            self._containers[high] = container
+        else:
+            index = bisect_left(container, low)
+            if index < len(container) and container[index] == low:
+                del container[index]
+        if not self._containers[high]:
+            del self._containers[high]
+
+    def __contains__(self, value: int) -> bool:
+        high, low = self._split(value)
+        container = self._containers.get(high)
+        if container is None:
+            return False
+        if isinstance(container, int):
+            return bool((container >> low) & 1)
+        index = bisect_left(container, low)
+        return index < len(container) and container[index] == low
+
+    def __len__(self) -> int:
+        return sum(
+            _popcount(container) if isinstance(container, int) else len(container)
+            for container in self._containers.values()
+        )
+
+    def __iter__(self) -> Iterator[int]:
+        for high in sorted(self._containers):
+            container = self._containers[high]
+            lows = _bits_to_array(container) if isinstance(container, int) else container
+            base = high << 16
+            for low in lows:
+                yield base | low
+
+    def __and__(self, other: 'RoaringBitmap') -> 'RoaringBitmap':
+        result = RoaringBitmap()
+        for high in self._containers.keys() & other._containers.keys():
+            a, b = self._containers[high], other._containers[high]
+            if isinstance(a, int) and isinstance(b, int):
+                bits = a & b
+                if bits:
+                    result._containers[high] = _bits_to_array(bits) \
+                        if _popcount(bits) <= ARRAY_MAX_SIZE else bits
+                continue
+            if isinstance(a, int):
+                a, b = b, a
+            if isinstance(b, int):
+                lows = array('H', (low for low in a if (b >> low) & 1))
+            else:
+                lows = array('H', sorted(set(a) & set(b)))
+            if lows:
+                result._containers[high] = lows
+        return result
+
+    def __or__(self, other: 'RoaringBitmap') -> 'RoaringBitmap':
+        result = self.copy()
+        for high, b in other._containers.items():
+            a = result._containers.get(high)
+            if a is None:
+                result._containers[high] = b if isinstance(b, int) else array('H', b)
+            elif isinstance(a, int) or isinstance(b, int):
+                a = a if isinstance(a, int) else _array_to_bits(a)
+                b = b if isinstance(b, int) else _array_to_bits(b)
+                bits = a | b
+                result._containers[high] = bits if _popcount(bits) > ARRAY_MAX_SIZE else _bits_to_array(bits)
+            else:
+                result._containers[high] = self._from_lows(set(a) | set(b))
+        return result
+
+    def copy(self) -> 'RoaringBitmap':
+        """浅拷贝"""
+        result = RoaringBitmap()
+        result._containers = {
+            high: container if isinstance(container, int) else array('H', container)
+            for high, container in self._containers.items()
+        }
+        return result
+
+    def memory_usage(self) -> int:
+        """容器数据占用的大致字节数"""
+        return sum(
+            8192 if isinstance(container, int) else container.itemsize * len(container)
+            for container in self._containers.values()
+        )
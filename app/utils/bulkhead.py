@@ -0,0 +1,129 @@
+"""接口隔离舱模块
+
+视图函数用 ``@bulkhead(name)`` 标记接口类别，未标记的接口属于 BULKHEAD_DEFAULT 类别。每个类别在配置 BULKHEADS
+中定义并发上限、排队上限和最长排队秒数：并发已满时请求排队等待，队列已满或等待超时时立即返回 503 和 Retry-After，
+批量授权、大列表等重接口占满自己的配额后不会继续占用处理交互接口的 worker 线程。
+
+并发按 worker 进程计算；排队中的请求同样占用线程，各非默认类别的并发上限与排队上限之和应小于每个 worker 的线程数。
+"""
+import math
+import threading
+import time
+from flask import current_app, request
+from app.utils.metrics import Metric, register_collector
+from app.utils.response import Response
+
+ENVIRON_KEY = 'box.bulkhead'
+
+_bulkheads = {}
+
+
+def bulkhead(name: str):
+    """为视图函数指定接口类别，需放在路由装饰器之后（紧贴路由装饰器）"""
+    def decorator(func):
+        func.bulkhead = name
+        return func
+    return decorator
+
+
+class Bulkhead:
+    """带排队上限的并发限制"""
+
+    def __init__(self, name: str, concurrency: int, queue: int, timeout: float):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue = queue
+        self.timeout = timeout
+        self._cond = threading.Condition()
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+
+    def acquire(self) -> bool:
+        """获取一个并发名额，队列已满或等待超时时返回 False"""
+        with self._cond:
+            if self.active < self.concurrency and not self.waiting:
+                self.active += 1
+                self.admitted += 1
+                return True
+            if self.waiting >= self.queue:
+                self.rejected += 1
+                return False
+
+            self.waiting += 1
+            started = time.monotonic()
+            deadline = started + self.timeout
+            try:
+                while self.active >= self.concurrency:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        return False
+                    self._cond.wait(remaining)
+                self.active += 1
+                self.admitted += 1
+                return True
+            finally:
+                self.waiting -= 1
+                self.wait_seconds += time.monotonic() - started
+
+    def release(self) -> None:
+        with self._cond:
+            self.active -= 1
+            self._cond.notify()
+
+
+def _before_request():
+    if not current_app.config['BULKHEAD_ENABLED'] or request.method == 'OPTIONS':
+        return None
+    view = current_app.view_functions.get(request.endpoint)
+    name = getattr(view, 'bulkhead', current_app.config['BULKHEAD_DEFAULT'])
+    compartment = _bulkheads.get(name)
+    if compartment is None:
+        return None
+    if not compartment.acquire():
+        response, status = Response.error('服务繁忙，请稍后重试', 503)
+        response.headers['Retry-After'] = str(max(math.ceil(compartment.timeout), 1))
+        return response, status
+    request.environ[ENVIRON_KEY] = compartment
+    return None
+
+
+def _teardown_request(exc):
+    compartment = request.environ.pop(ENVIRON_KEY, None)
+    if compartment is not None:
+        compartment.release()
+
+
+def collect():
+    """metrics 采集函数"""
+    items = [({'class': name}, compartment) for name, compartment in _bulkheads.items()]
+    return [
+        Metric('box_bulkhead_limit', 'gauge', 'Concurrency limit per endpoint class',
+               [(labels, c.concurrency) for labels, c in items]),
+        Metric('box_bulkhead_active', 'gauge', 'Requests executing per endpoint class',
+               [(labels, c.active) for labels, c in items]),
+        Metric('box_bulkhead_queued', 'gauge', 'Requests waiting for a slot per endpoint class',
+               [(labels, c.waiting) for labels, c in items]),
+        Metric('box_bulkhead_admitted_total', 'counter', 'Requests admitted per endpoint class',
+               [(labels, c.admitted) for labels, c in items]),
+        Metric('box_bulkhead_rejected_total', 'counter', 'Requests rejected with 503 per endpoint class', [
+            (dict(labels, reason=reason), count)
+            for labels, c in items for reason, count in (('queue_full', c.rejected), ('timeout', c.timeouts))
+        ]),
+        Metric('box_bulkhead_wait_seconds_total', 'counter', 'Time spent queueing per endpoint class',
+               [(labels, c.wait_seconds) for labels, c in items]),
+    ]
+
+
+def init_bulkheads(app):
+    """按配置创建各类别的并发限制并注册检查，应在限流之后注册，被限流的请求不占用名额"""
+    _bulkheads.clear()
+    for name, options in app.config['BULKHEADS'].items():
+        _bulkheads[name] = Bulkhead(name, options['concurrency'], options['queue'], options['timeout'])
+    app.before_request(_before_request)
+    app.teardown_request(_teardown_request)
+    register_collector(collect)
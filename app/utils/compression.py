@@ -0,0 +1,188 @@
+"""响应压缩模块
+
+按 Accept-Encoding 在 zstd、br、gzip 中协商压缩算法（客户端权重相同时按 COMPRESS_ALGORITHMS 的顺序），
+普通响应一次性压缩，小于 COMPRESS_MIN_SIZE 的不压缩；流式响应逐块压缩并在每块后刷新，
+不会先把整个响应缓冲在内存中。brotli、zstandard 为可选依赖，未安装时对应算法不参与协商。
+
+压缩耗费的 CPU 时间和压缩前后的字节数按算法累计，通过 /api/_debug/metrics 输出。
+"""
+import threading
+import time
+import zlib
+from typing import Iterable, Iterator, Optional
+from flask import current_app, request
+from app.utils.metrics import Metric, register_collector
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+
+class _Gzip:
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class _Brotli:
+    def __init__(self, level: int):
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class _Zstd:
+    def __init__(self, level: int):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+COMPRESSORS = {'gzip': _Gzip}
+if brotli is not None:
+    COMPRESSORS['br'] = _Brotli
+if zstandard is not None:
+    COMPRESSORS['zstd'] = _Zstd
+
+
+class CompressionStats:
+    """按算法累计的压缩统计"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}  # encoding -> [响应数, 压缩前字节, 压缩后字节, CPU 秒]
+
+    def add(self, encoding: str, responses: int, bytes_in: int, bytes_out: int, seconds: float) -> None:
+        with self._lock:
+            entry = self._stats.setdefault(encoding, [0, 0, 0, 0.0])
+            entry[0] += responses
+            entry[1] += bytes_in
+            entry[2] += bytes_out
+            entry[3] += seconds
+
+    def collect(self):
+        """metrics 采集函数"""
+        with self._lock:
+            items = [({'encoding': encoding}, list(entry)) for encoding, entry in self._stats.items()]
+        return [
+            Metric('box_compression_responses_total', 'counter', 'Compressed responses',
+                   [(labels, entry[0]) for labels, entry in items]),
+            Metric('box_compression_bytes_in_total', 'counter', 'Response bytes before compression',
+                   [(labels, entry[1]) for labels, entry in items]),
+            Metric('box_compression_bytes_out_total', 'counter', 'Response bytes after compression',
+                   [(labels, entry[2]) for labels, entry in items]),
+            Metric('box_compression_cpu_seconds_total', 'counter', 'CPU time spent compressing',
+                   [(labels, entry[3]) for labels, entry in items]),
+        ]
+
+
+compression_stats = CompressionStats()
+
+
+def negotiate(accept_encodings, algorithms: Iterable[str]) -> Optional[str]:
+    """选择客户端接受且已安装的算法，权重相同时按 algorithms 的顺序"""
+    best, best_quality = None, 0
+    for name in algorithms:
+        if name not in COMPRESSORS:
+            continue
+        quality = accept_encodings[name]
+        if quality > best_quality:
+            best, best_quality = name, quality
+    return best
+
+
+def _compress_stream(chunks: Iterable[bytes], encoding: str, level: int) -> Iterator[bytes]:
+    compressor = COMPRESSORS[encoding](level)
+    bytes_in = bytes_out = 0
+    seconds = 0.0
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            started = time.thread_time()
+            # 每块刷新，保证客户端及时收到已生成的数据
+            data = compressor.compress(chunk) + compressor.flush()
+            seconds += time.thread_time() - started
+            bytes_in += len(chunk)
+            bytes_out += len(data)
+            if data:
+                yield data
+        started = time.thread_time()
+        data = compressor.finish()
+        seconds += time.thread_time() - started
+        bytes_out += len(data)
+        yield data
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+        compression_stats.add(encoding, 1, bytes_in, bytes_out, seconds)
+
+
+def _after_request(response):
+    config = current_app.config
+    if not config['COMPRESS_ENABLED'] or request.method == 'HEAD':
+        return response
+    if response.status_code < 200 or response.status_code in (204, 304) or response.direct_passthrough:
+        return response
+    if 'Content-Encoding' in response.headers or response.mimetype not in config['COMPRESS_MIMETYPES']:
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate(request.accept_encodings, config['COMPRESS_ALGORITHMS'])
+    if encoding is None:
+        return response
+    level = config['COMPRESS_LEVELS'][encoding]
+
+    if response.is_streamed:
+        response.response = _compress_stream(response.response, encoding, level)
+        response.headers.pop('Content-Length', None)
+    else:
+        body = response.get_data()
+        if len(body) < config['COMPRESS_MIN_SIZE']:
+            return response
+        started = time.thread_time()
+        compressor = COMPRESSORS[encoding](level)
+        data = compressor.compress(body) + compressor.finish()
+        compression_stats.add(encoding, 1, len(body), len(data), time.thread_time() - started)
+        response.set_data(data)
+
+    response.headers['Content-Encoding'] = encoding
+    # 压缩后的内容与原内容不再逐字节相同
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def init_compression(app):
+    """注册响应压缩，应最后注册，使压缩在其他 after_request 钩子之前执行"""
+    app.after_request(_after_request)
+    register_collector(compression_stats.collect)
@@ -0,0 +1,63 @@
+"""计数缓存模块
+
+缓存 COUNT(*) 之类开销较大的统计结果。首次读取时同步计算，之后过期或被标记为过期时
+先返回旧值，并在后台线程中刷新，读取方不会等待计数查询。
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Hashable
+from flask import current_app
+
+
+class CountCache:
+    """后台刷新的计数缓存"""
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[Hashable, list]' = OrderedDict()  # key -> [value, computed_at]
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, compute: Callable[[], int], ttl: float) -> int:
+        """获取计数，compute 在应用上下文中执行"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                if time.monotonic() - entry[1] >= ttl and key not in self._refreshing:
+                    self._refreshing.add(key)
+                    app = current_app._get_current_object()
+                    threading.Thread(target=self._refresh, args=(app, key, compute), daemon=True).start()
+                return entry[0]
+
+        value = compute()
+        self._store(key, value)
+        return value
+
+    def mark_stale(self) -> None:
+        """标记所有计数过期，下次读取时在后台刷新"""
+        with self._lock:
+            for entry in self._entries.values():
+                entry[1] = float('-inf')
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def _store(self, key: Hashable, value: int) -> None:
+        with self._lock:
+            self._entries[key] = [value, time.monotonic()]
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _refresh(self, app, key: Hashable, compute: Callable[[], int]) -> None:
+        with app.app_context():
+            try:
+                self._store(key, compute())
+            except Exception as e:
+                app.logger.error(f"Count cache refresh {key} error: {str(e)}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
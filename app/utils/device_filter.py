@@ -0,0 +1,171 @@
+"""设备过滤表达式模块
+
+支持形如 ``status:online tag:web ip:10.2.0.0/16 name:edge-*`` 的简单查询语言：
+
+- 多个条件之间为 AND 关系，同一条件内用逗号分隔的多个值为 OR 关系
+- ``name``/``mac`` 支持末尾通配符 ``*``，分别编译为前缀 LIKE 和整数区间，都可以使用索引（前导通配不支持）
+- ``mac`` 支持任意常见写法，按 48 位整数编码匹配
+- ``ip`` 支持 IPv4/IPv6 地址和任意长度的 CIDR 网段，编译为编码列上的范围扫描
+- ``tag`` 无法使用索引，只能在扫描行数受限时使用
+"""
+import shlex
+from collections import namedtuple
+from functools import lru_cache
+from typing import Iterable, List, Tuple
+from sqlalchemy import or_
+from app.models.device import Device
+from app.utils.ip import cidr_range, pack_ip
+from app.utils.mac import mac_prefix_range, parse_mac
+
+FilterTerm = namedtuple('FilterTerm', ['field', 'values'])
+
+# 可以命中索引的字段
+INDEXED_FIELDS = ('status', 'name', 'ip', 'mac')
+# 需要扫描的字段
+RESIDUAL_FIELDS = ('tag',)
+
+
+class FilterError(ValueError):
+    """过滤表达式错误"""
+
+
+@lru_cache(maxsize=256)
+def parse_filter(expression: str) -> Tuple[FilterTerm, ...]:
+    """解析过滤表达式
+
+    Args:
+        expression: 过滤表达式，如 ``status:online name:edge-*``
+
+    Returns:
+        Tuple[FilterTerm, ...]: 解析后的条件列表
+
+    Raises:
+        FilterError: 表达式无法解析
+    """
+    if not expression or not expression.strip():
+        return ()
+    try:
+        tokens = shlex.split(expression)
+    except ValueError:
+        raise FilterError('过滤表达式引号不匹配')
+
+    terms = []
+    for token in tokens:
+        field, sep, raw = token.partition(':')
+        field = field.strip().lower()
+        if not sep or not field:
+            raise FilterError(f'无法解析的过滤条件: {token}')
+        if field not in INDEXED_FIELDS and field not in RESIDUAL_FIELDS:
+            raise FilterError(f'不支持的过滤字段: {field}')
+        values = tuple(v.strip() for v in raw.split(',') if v.strip())
+        if not values:
+            raise FilterError(f'过滤条件缺少取值: {token}')
+        terms.append(FilterTerm(field, values))
+    return tuple(terms)
+
+
+def terms_from_args(args) -> Tuple[FilterTerm, ...]:
+    """将旧版查询参数 ``name``/``status``/``tags[]`` 转换为过滤条件
+
+    ``name`` 按前缀匹配，``tags[]`` 多个值之间为 OR 关系。
+    """
+    terms = []
+    name = args.get('name')
+    if name:
+        terms.append(FilterTerm('name', (name if name.endswith('*') else name + '*',)))
+    status = args.get('status')
+    if status:
+        terms.append(FilterTerm('status', (status,)))
+    tags = tuple(t for t in args.getlist('tags[]') if t)
+    if tags:
+        terms.append(FilterTerm('tag', tags))
+    return tuple(terms)
+
+
+def compile_filter(terms: Iterable[FilterTerm]) -> Tuple[List, List]:
+    """将过滤条件编译为 SQLAlchemy 表达式
+
+    Args:
+        terms: 过滤条件
+
+    Returns:
+        Tuple[List, List]: (可命中索引的表达式, 需要扫描的表达式)
+    """
+    indexed, residual = [], []
+    for term in terms:
+        compiler = _COMPILERS[term.field]
+        clause = or_(*[compiler(value) for value in term.values])
+        if term.field in RESIDUAL_FIELDS:
+            residual.append(clause)
+        else:
+            indexed.append(clause)
+    return indexed, residual
+
+
+def _prefix_range(column, prefix: str):
+    """前缀匹配：末尾通配符的 LIKE 由数据库按排序规则转换为索引范围扫描"""
+    if not prefix:
+        raise FilterError('通配符前必须至少包含一个字符')
+    return column.startswith(prefix, autoescape=True)
+
+
+def _exact_or_prefix(column, value: str):
+    """精确匹配或末尾通配符的前缀匹配"""
+    if '*' in value[:-1]:
+        raise FilterError(f'仅支持末尾通配符: {value}')
+    if value.endswith('*'):
+        return _prefix_range(column, value[:-1])
+    return column == value
+
+
+def _compile_status(value: str):
+    if '*' in value:
+        raise FilterError('status 不支持通配符')
+    return Device.status == value
+
+
+def _compile_name(value: str):
+    return _exact_or_prefix(Device.name, value)
+
+
+def _compile_mac(value: str):
+    if '*' in value[:-1]:
+        raise FilterError(f'仅支持末尾通配符: {value}')
+    try:
+        if value.endswith('*'):
+            return Device.mac_int.between(*mac_prefix_range(value[:-1]))
+        return Device.mac_int == parse_mac(value)
+    except ValueError as e:
+        raise FilterError(str(e))
+
+
+def _compile_ip(value: str):
+    if '*' in value:
+        raise FilterError(f'ip 不支持通配符，请使用 CIDR 网段: {value}')
+    try:
+        if '/' not in value:
+            return Device.ip_packed == pack_ip(value)
+        low, high = cidr_range(value)
+    except ValueError as e:
+        raise FilterError(str(e))
+    return Device.ip_packed.between(low, high)
+
+
+def _compile_tag(value: str):
+    if '*' in value:
+        raise FilterError('tag 不支持通配符')
+    return or_(
+        Device.tags == value,
+        Device.tags.startswith(f'{value},', autoescape=True),
+        Device.tags.endswith(f',{value}', autoescape=True),
+        Device.tags.contains(f',{value},', autoescape=True)
+    )
+
+
+_COMPILERS = {
+    'status': _compile_status,
+    'name': _compile_name,
+    'ip': _compile_ip,
+    'mac': _compile_mac,
+    'tag': _compile_tag,
+}
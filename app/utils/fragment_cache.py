@@ -0,0 +1,146 @@
+"""JSON 片段缓存模块
+
+缓存模型对象 to_dict() 编码后的 JSON 片段，按 (id, updated_at) 校验：updated_at 变化后旧片段失效，
+同一 id 只保留最新的片段。列表响应把各行片段直接拼接进响应体，只有变化过的行需要重新序列化。
+缓存按片段总字节数限制大小，超出时淘汰最久未使用的片段。
+
+updated_at 精确到微秒（MySQL 上为 DATETIME(6)），其他进程的修改（包括 ORM 批量 UPDATE）依靠 updated_at 变化失效；
+本进程内通过 ORM 修改或删除对象时在 flush 后立即淘汰对应片段。
+"""
+import threading
+from collections import OrderedDict
+from typing import Iterable, List
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app.utils import wire
+from app.utils.metrics import Metric, register_collector
+from app.utils.timing import phase
+
+# 每个条目除片段本身外的大致内存开销（键、元组与字典槽位）
+ENTRY_OVERHEAD = 200
+
+
+class JsonFragments:
+    """已编码的 JSON 片段列表，由 Response 拼接为 JSON 数组"""
+
+    def __init__(self, fragments: List[str]):
+        self.fragments = fragments
+
+    def __len__(self) -> int:
+        return len(self.fragments)
+
+    def to_json(self) -> str:
+        return '[' + ','.join(self.fragments) + ']'
+
+
+class FragmentCache:
+    """按 (id, updated_at) 校验的 JSON 片段缓存"""
+
+    def __init__(self, model, max_bytes: int = 64 * 1024 * 1024):
+        self.model = model
+        self.max_bytes = max_bytes
+        self._entries: 'OrderedDict[int, tuple]' = OrderedDict()  # id -> (updated_at, fragment)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @phase('serialize')
+    def render(self, objects: Iterable) -> object:
+        """序列化对象列表：JSON 响应返回拼接好的片段，二进制格式返回 to_dict() 列表"""
+        if wire.negotiate() != wire.JSON:
+            return [obj.to_dict() for obj in objects]
+
+        fragments = []
+        missing = []
+        with self._lock:
+            for obj in objects:
+                entry = self._entries.get(obj.id)
+                if entry is not None and entry[0] == obj.updated_at:
+                    self._entries.move_to_end(obj.id)
+                    fragments.append(entry[1])
+                else:
+                    missing.append((len(fragments), obj))
+                    fragments.append(None)
+            self.hits += len(fragments) - len(missing)
+            self.misses += len(missing)
+
+        if missing:
+            dumps = current_app.json.dumps
+            encoded = []
+            for index, obj in missing:
+                fragments[index] = dumps(obj.to_dict())
+                encoded.append((obj.id, obj.updated_at, fragments[index]))
+            self._store(encoded)
+        return JsonFragments(fragments)
+
+    def _store(self, encoded: list) -> None:
+        with self._lock:
+            for object_id, updated_at, fragment in encoded:
+                old = self._entries.pop(object_id, None)
+                if old is not None:
+                    self._bytes -= len(old[1]) + ENTRY_OVERHEAD
+                self._entries[object_id] = (updated_at, fragment)
+                self._bytes += len(fragment) + ENTRY_OVERHEAD
+            while self._bytes > self.max_bytes and self._entries:
+                _, (_, fragment) = self._entries.popitem(last=False)
+                self._bytes -= len(fragment) + ENTRY_OVERHEAD
+                self.evictions += 1
+
+    def evict(self, object_ids: Iterable[int]) -> None:
+        with self._lock:
+            for object_id in object_ids:
+                old = self._entries.pop(object_id, None)
+                if old is not None:
+                    self._bytes -= len(old[1]) + ENTRY_OVERHEAD
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+    def collect(self):
+        """metrics 采集函数"""
+        stats = self.stats()
+        labels = {'model': self.model.__tablename__}
+        return [
+            Metric('box_fragment_cache_hits_total', 'counter', 'Fragment cache hits', [(labels, stats['hits'])]),
+            Metric('box_fragment_cache_misses_total', 'counter', 'Fragment cache misses', [(labels, stats['misses'])]),
+            Metric('box_fragment_cache_evictions_total', 'counter', 'Fragments evicted for size',
+                   [(labels, stats['evictions'])]),
+            Metric('box_fragment_cache_entries', 'gauge', 'Cached fragments', [(labels, stats['entries'])]),
+            Metric('box_fragment_cache_bytes', 'gauge', 'Approximate memory used by cached fragments',
+                   [(labels, stats['bytes'])]),
+        ]
+
+    def install(self, app) -> None:
+        """读取大小上限，注册 flush 淘汰与指标采集"""
+        self.max_bytes = app.config['FRAGMENT_CACHE_MAX_BYTES']
+        if self not in _caches:
+            _caches.append(self)
+            register_collector(self.collect)
+
+
+_caches: List[FragmentCache] = []
+
+
+@event.listens_for(Session, 'after_flush')
+def _evict_flushed(session, flush_context):
+    """本进程内修改或删除的对象立即淘汰片段"""
+    for cache in _caches:
+        changed = [obj.id for obj in session.dirty if isinstance(obj, cache.model)]
+        changed += [obj.id for obj in session.deleted if isinstance(obj, cache.model)]
+        if changed:
+            cache.evict(changed)
@@ -0,0 +1,85 @@
+"""IP 地址编码工具模块
+
+IPv4 与 IPv6 统一编码为 16 字节大端序二进制（IPv4 使用 ``::ffff:a.b.c.d`` 映射地址），
+字节序与数值序一致，因此 CIDR 网段可以直接转换为索引上的范围扫描。
+"""
+import ipaddress
+from typing import Tuple
+
+# IPv4 映射地址前缀 ::ffff:0:0/96
+IPV4_MAPPED_PREFIX = b'\x00' * 10 + b'\xff\xff'
+IPV4_RANGE = (IPV4_MAPPED_PREFIX + b'\x00' * 4, IPV4_MAPPED_PREFIX + b'\xff' * 4)
+
+
+def _parse(value: str):
+    try:
+        address = ipaddress.ip_address(value.strip())
+    except (ValueError, AttributeError):
+        raise ValueError(f'无效的IP地址: {value}')
+    if address.version == 6 and address.ipv4_mapped:
+        address = address.ipv4_mapped
+    return address
+
+
+def normalize_ip(value: str) -> str:
+    """返回 IP 地址的规范显示形式（IPv6 使用压缩格式）"""
+    return str(_parse(value))
+
+
+def pack_ip(value: str) -> bytes:
+    """将 IP 地址编码为 16 字节定长二进制
+
+    Raises:
+        ValueError: 无效的 IP 地址
+    """
+    address = _parse(value)
+    if address.version == 4:
+        return IPV4_MAPPED_PREFIX + address.packed
+    return address.packed
+
+
+def unpack_ip(packed: bytes) -> str:
+    """将 16 字节二进制还原为 IP 地址字符串"""
+    if packed[:12] == IPV4_MAPPED_PREFIX:
+        return str(ipaddress.IPv4Address(packed[12:]))
+    return str(ipaddress.IPv6Address(packed))
+
+
+def parse_network(cidr: str):
+    """解析 CIDR 网段，主机位不为零时自动截断
+
+    Raises:
+        ValueError: 无效的网段
+    """
+    try:
+        return ipaddress.ip_network(cidr.strip(), strict=False)
+    except (ValueError, AttributeError):
+        raise ValueError(f'无效的网段: {cidr}')
+
+
+def cidr_range(cidr: str) -> Tuple[bytes, bytes]:
+    """将 CIDR 网段转换为编码后的闭区间 [起始地址, 结束地址]
+
+    Raises:
+        ValueError: 无效的网段
+    """
+    network = parse_network(cidr)
+    return pack_ip(str(network.network_address)), pack_ip(str(network.broadcast_address))
+
+
+def subnet_key_length(version: int, prefixlen: int) -> int:
+    """按字节对齐的网段在编码中所占的前缀字节数
+
+    Raises:
+        ValueError: 前缀长度不是 8 的倍数或超出范围
+    """
+    max_len = 32 if version == 4 else 128
+    if prefixlen % 8 or not 0 < prefixlen <= max_len:
+        raise ValueError(f'网段前缀长度必须是 8 的倍数且不超过 {max_len}')
+    return (12 if version == 4 else 0) + prefixlen // 8
+
+
+def subnet_from_key(key: bytes, prefixlen: int) -> str:
+    """将编码前缀还原为网段字符串"""
+    packed = bytes(key) + b'\x00' * (16 - len(key))
+    return f'{unpack_ip(packed)}/{prefixlen}'
@@ -1,5 +1,7 @@
 """JWT 错误处理模块"""
+from flask_jwt_extended.config import config as jwt_config
 from app.utils.response import Response
+from app.utils.timing import mark_jwt_decode, phase, record_jwt_decode
 
 def register_jwt_error_handlers(jwt):
     """注册 JWT 错误处理器"""
@@ -23,3 +25,30 @@ def register_jwt_error_handlers(jwt):
     @jwt.revoked_token_loader
     def revoked_token_callback(jwt_header, jwt_payload):
         return Response.error('Token 已被撤销', 401)
+
+
+def register_token_blocklist_loader(jwt, blocklist):
+    """注册 token 撤销检查，blocklist 需提供 is_revoked(jti)"""
+    
+    @jwt.decode_key_loader
+    def decode_key_callback(jwt_header, jwt_payload):
+        # 解码前调用，用于统计 Server-Timing 的 auth 阶段
+        mark_jwt_decode()
+        return jwt_config.decode_key
+    
+    @jwt.token_in_blocklist_loader
+    def check_if_token_revoked(jwt_header, jwt_payload):
+        record_jwt_decode()
+        with phase('auth'):
+            return blocklist.is_revoked(jwt_payload['jti'])
+
+
+def register_role_claim_loader(jwt):
+    """在 token 中写入用户角色，供不查库的场景（如 Server-Timing）判断管理员"""
+    
+    @jwt.additional_claims_loader
+    def add_role_claim(identity):
+        from app.models.user import User
+        from app.models.base import db
+        user = db.session.get(User, int(identity))
+        return {'role': user.role} if user else {}
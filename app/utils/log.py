@@ -0,0 +1,177 @@
+"""结构化日志模块
+
+应用日志和访问日志格式化为 JSON 行，经由 QueueHandler 放入内存队列，由 QueueListener
+的后台线程写入文件或标准错误，请求线程不会等待磁盘 I/O。队列满时直接丢弃记录并计数。
+访问日志按 LOG_ACCESS_SAMPLE_RATE 采样，服务端错误和慢请求总是记录。
+"""
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import re
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, WatchedFileHandler
+from flask import current_app, g, has_request_context, request
+from flask.logging import default_handler
+from flask_jwt_extended import get_jwt
+
+access_logger = logging.getLogger('box.access')
+
+# 允许透传的请求 ID 格式
+_REQUEST_ID = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+# 当前的日志写入线程，重复调用 init_logging 时替换
+_listener = None
+
+
+def _restart_listener():
+    # 预加载应用后 fork 出的 worker 中没有写入线程，需要重新启动
+    if _listener is not None and _listener._thread is not None:
+        _listener._thread = None
+        _listener.start()
+
+
+def _stop_listener():
+    global _listener
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()
+    _listener = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_restart_listener)
+atexit.register(_stop_listener)
+
+
+def current_user_id():
+    """当前请求 token 中的用户 ID，未验证 token 时返回 None"""
+    try:
+        return get_jwt().get('sub')
+    except RuntimeError:
+        return None
+
+
+class JsonFormatter(logging.Formatter):
+    """把日志记录格式化为单行 JSON，请求上下文中自动附带请求 ID 与接口"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key in ('request_id', 'endpoint', 'user_id'):
+            value = getattr(record, key, None)
+            if value is not None:
+                entry[key] = value
+        entry.update(getattr(record, 'fields', None) or {})
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """队列满时丢弃记录而不是阻塞请求线程"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        # 请求上下文在后台线程中不可用，在请求线程中写入 record
+        if has_request_context():
+            record.request_id = getattr(g, 'request_id', None)
+            record.endpoint = request.endpoint
+            if getattr(record, 'user_id', None) is None:
+                record.user_id = current_user_id()
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = JsonFormatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def _before_request():
+    request_id = request.headers.get('X-Request-ID', '')
+    g.request_id = request_id if _REQUEST_ID.match(request_id) else uuid.uuid4().hex
+    g.request_started = time.perf_counter()
+
+
+def _after_request(response):
+    request_id = getattr(g, 'request_id', None)
+    if request_id is None:
+        return response
+    response.headers['X-Request-ID'] = request_id
+    latency_ms = (time.perf_counter() - g.request_started) * 1000
+    if response.status_code >= 500 or latency_ms >= current_app.config['LOG_SLOW_REQUEST_MS'] or \
+            random.random() < current_app.config['LOG_ACCESS_SAMPLE_RATE']:
+        access_logger.info('%s %s %s', request.method, request.path, response.status_code, extra={'fields': {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'latency_ms': round(latency_ms, 2),
+            'remote_addr': request.remote_addr,
+        }})
+    return response
+
+
+def init_logging(app):
+    """安装日志队列、后台写入线程以及请求 ID 与访问日志钩子，可重复调用"""
+    if app.config['LOG_FILE']:
+        directory = os.path.dirname(app.config['LOG_FILE'])
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if app.config['LOG_MAX_BYTES']:
+            target = RotatingFileHandler(
+                app.config['LOG_FILE'],
+                maxBytes=app.config['LOG_MAX_BYTES'],
+                backupCount=app.config['LOG_BACKUP_COUNT'],
+                encoding='utf-8'
+            )
+        else:
+            # 由 logrotate 等外部工具轮转，文件被移走后自动重新打开
+            target = WatchedFileHandler(app.config['LOG_FILE'], encoding='utf-8')
+    else:
+        target = logging.StreamHandler(sys.stderr)
+    target.setFormatter(JsonFormatter())
+
+    # 重复创建应用时先停止之前的写入线程并移除其处理器（app.logger 按名称在各应用之间共享）
+    global _listener
+    _stop_listener()
+    for existing in [h for h in app.logger.handlers if isinstance(h, NonBlockingQueueHandler)]:
+        app.logger.removeHandler(existing)
+
+    log_queue = queue.Queue(maxsize=app.config['LOG_QUEUE_SIZE'])
+    handler = NonBlockingQueueHandler(log_queue)
+    _listener = QueueListener(log_queue, target, respect_handler_level=False)
+    _listener.start()
+    app.extensions['log_listener'] = _listener
+    app.extensions['log_handler'] = handler
+
+    level = getattr(logging, app.config['LOG_LEVEL'])
+    app.logger.removeHandler(default_handler)
+    app.logger.addHandler(handler)
+    app.logger.setLevel(level)
+    access_logger.handlers[:] = [handler]
+    access_logger.setLevel(logging.INFO)
+    access_logger.propagate = False
+
+    app.before_request(_before_request)
+    app.after_request(_after_request)
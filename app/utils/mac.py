@@ -0,0 +1,60 @@
+"""MAC 地址编码工具模块
+
+MAC 地址统一编码为 48 位整数保存，兼容 ``AA-BB-CC-DD-EE-FF``、``aa:bb:cc:dd:ee:ff``、
+``aabb.ccdd.eeff`` 等常见写法。
+"""
+import re
+from typing import Tuple
+
+_SEPARATORS = re.compile(r'[\s:.\-]')
+_HEX = re.compile(r'^[0-9a-f]*$')
+
+
+def _hex_digits(value: str) -> str:
+    if value is not None and not isinstance(value, str):
+        raise ValueError(f'无效的MAC地址: {value!r}')
+    digits = _SEPARATORS.sub('', value or '').lower()
+    if not _HEX.match(digits):
+        raise ValueError(f'无效的MAC地址: {value}')
+    return digits
+
+
+def parse_mac(value: str) -> int:
+    """将 MAC 地址解析为 48 位整数
+
+    Raises:
+        ValueError: 无效的 MAC 地址
+    """
+    digits = _hex_digits(value)
+    if len(digits) != 12:
+        raise ValueError(f'无效的MAC地址: {value}')
+    return int(digits, 16)
+
+
+def format_mac(value: int) -> str:
+    """将 48 位整数格式化为 ``aa:bb:cc:dd:ee:ff``"""
+    digits = f'{value:012x}'
+    return ':'.join(digits[i:i + 2] for i in range(0, 12, 2))
+
+
+def normalize_mac(value: str) -> str:
+    """返回 MAC 地址的规范显示形式
+
+    Raises:
+        ValueError: 无效的 MAC 地址
+    """
+    return format_mac(parse_mac(value))
+
+
+def mac_prefix_range(prefix: str) -> Tuple[int, int]:
+    """将 MAC 地址前缀（如 OUI ``00:11:22``）转换为整数闭区间
+
+    Raises:
+        ValueError: 前缀无效
+    """
+    digits = _hex_digits(prefix)
+    if not 0 < len(digits) < 12:
+        raise ValueError(f'无效的MAC地址前缀: {prefix}')
+    shift = 4 * (12 - len(digits))
+    low = int(digits, 16) << shift
+    return low, low + (1 << shift) - 1
@@ -0,0 +1,173 @@
+"""按接口统计内存分配模块
+
+开启 MEMORY_PROFILING_ENABLED 后用 tracemalloc 跟踪分配，每个请求记录净增字节数（请求结束时
+与开始时已分配内存之差）和峰值字节数（请求期间已分配内存的最大值减去开始时的值），按接口汇总。
+
+历史峰值超过 MEMORY_CAPTURE_MIN_BYTES 的接口，每 MEMORY_CAPTURE_INTERVAL 秒抽取一个请求
+记录分配位置：请求开始时和 Response.success 序列化时（查询结果与响应数据都还在内存中）各取一次
+快照，两者之差按代码行排序即为该请求的主要分配位置。取快照的耗时与已跟踪的分配数成正比。
+
+tracemalloc 是进程级的：多线程 worker 中并发请求的分配会互相计入，sync worker 中的数据最准确。
+"""
+import threading
+import time
+import tracemalloc
+from typing import Optional
+from flask import current_app, has_request_context, request
+from app.utils.metrics import Metric, register_collector
+
+ENVIRON_KEY = 'box.memory'
+
+_SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>'),
+)
+
+
+class _RequestMemory:
+    def __init__(self, started_bytes: int, baseline=None):
+        self.started_bytes = started_bytes
+        self.baseline = baseline
+        self.snapshot = None
+
+
+class MemoryStats:
+    """按接口汇总的内存分配统计"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._endpoints = {}
+            self._worst = []
+            self._last_capture = {}
+
+    def should_capture(self, endpoint: str, min_bytes: int, interval: float) -> bool:
+        """历史峰值超过 min_bytes 且距上次抽取超过 interval 秒的接口抽取本次请求"""
+        with self._lock:
+            entry = self._endpoints.get(endpoint)
+            if entry is None or entry['peak_max'] < min_bytes:
+                return False
+            now = time.monotonic()
+            if now - self._last_capture.get(endpoint, float('-inf')) < interval:
+                return False
+            self._last_capture[endpoint] = now
+            return True
+
+    def record(self, endpoint: str, path: str, net: int, peak: int, sites: Optional[list], worst_size: int) -> None:
+        with self._lock:
+            entry = self._endpoints.setdefault(endpoint, {
+                'count': 0, 'net_sum': 0, 'net_max': 0, 'peak_sum': 0, 'peak_max': 0, 'sites': None
+            })
+            entry['count'] += 1
+            entry['net_sum'] += net
+            entry['net_max'] = max(entry['net_max'], net)
+            entry['peak_sum'] += peak
+            if sites is not None and (entry['sites'] is None or peak >= entry['sites_peak']):
+                entry['sites'], entry['sites_peak'] = sites, peak
+            entry['peak_max'] = max(entry['peak_max'], peak)
+
+            if len(self._worst) < worst_size or peak > self._worst[-1]['peak']:
+                self._worst.append({
+                    'endpoint': endpoint, 'path': path, 'net': net, 'peak': peak,
+                    'at': time.time(), 'sites': sites
+                })
+                self._worst.sort(key=lambda item: item['peak'], reverse=True)
+                del self._worst[worst_size:]
+
+    def summary(self) -> dict:
+        """按峰值倒序的接口统计和峰值最大的请求"""
+        with self._lock:
+            endpoints = []
+            for endpoint, entry in self._endpoints.items():
+                endpoints.append({
+                    'endpoint': endpoint,
+                    'count': entry['count'],
+                    'net_avg': entry['net_sum'] // entry['count'],
+                    'net_max': entry['net_max'],
+                    'peak_avg': entry['peak_sum'] // entry['count'],
+                    'peak_max': entry['peak_max'],
+                    'sites': entry['sites'],
+                })
+            endpoints.sort(key=lambda item: item['peak_max'], reverse=True)
+            return {'tracing': tracemalloc.is_tracing(), 'endpoints': endpoints, 'worst': list(self._worst)}
+
+    def collect(self):
+        """metrics 采集函数"""
+        with self._lock:
+            items = [({'endpoint': endpoint}, entry) for endpoint, entry in self._endpoints.items()]
+        return [
+            Metric('box_request_memory_requests_total', 'counter', 'Requests measured by tracemalloc',
+                   [(labels, entry['count']) for labels, entry in items]),
+            Metric('box_request_memory_net_bytes_total', 'counter', 'Sum of net allocated bytes per request',
+                   [(labels, entry['net_sum']) for labels, entry in items]),
+            Metric('box_request_memory_peak_bytes_total', 'counter', 'Sum of peak allocated bytes per request',
+                   [(labels, entry['peak_sum']) for labels, entry in items]),
+            Metric('box_request_memory_peak_bytes_max', 'gauge', 'Largest peak allocated bytes of a request',
+                   [(labels, entry['peak_max']) for labels, entry in items]),
+        ]
+
+
+memory_stats = MemoryStats()
+
+
+def _take_snapshot():
+    return tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+
+
+def checkpoint() -> None:
+    """在响应数据仍在内存中时为被抽取的请求取快照，由 Response.success 调用"""
+    if not has_request_context():
+        return
+    state = request.environ.get(ENVIRON_KEY)
+    if state is not None and state.baseline is not None and state.snapshot is None:
+        state.snapshot = _take_snapshot()
+
+
+def _before_request():
+    config = current_app.config
+    if not config['MEMORY_PROFILING_ENABLED']:
+        return
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(config['MEMORY_TRACE_FRAMES'])
+    baseline = None
+    if memory_stats.should_capture(request.endpoint, config['MEMORY_CAPTURE_MIN_BYTES'],
+                                   config['MEMORY_CAPTURE_INTERVAL']):
+        baseline = _take_snapshot()
+    # 峰值是进程级的，每个请求开始时重置
+    tracemalloc.reset_peak()
+    request.environ[ENVIRON_KEY] = _RequestMemory(tracemalloc.get_traced_memory()[0], baseline)
+
+
+def _after_request(response):
+    state = request.environ.pop(ENVIRON_KEY, None)
+    if state is None or not tracemalloc.is_tracing():
+        return response
+    current, peak = tracemalloc.get_traced_memory()
+    sites = None
+    if state.baseline is not None:
+        snapshot = state.snapshot or _take_snapshot()
+        sites = [
+            {'site': str(stat.traceback[0]), 'size': stat.size_diff, 'count': stat.count_diff}
+            for stat in snapshot.compare_to(state.baseline, 'lineno')[:current_app.config['MEMORY_TOP_SITES']]
+        ]
+    memory_stats.record(
+        request.endpoint or '<unmatched>',
+        request.path,
+        current - state.started_bytes,
+        max(peak - state.started_bytes, 0),
+        sites,
+        current_app.config['MEMORY_WORST_REQUESTS']
+    )
+    return response
+
+
+def init_memory_profiler(app):
+    """注册内存统计钩子，未开启 MEMORY_PROFILING_ENABLED 时每个请求只多一次配置读取"""
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    register_collector(memory_stats.collect)
@@ -0,0 +1,42 @@
+"""指标输出模块
+
+各模块通过 register_collector 注册采集函数，/api/_debug/metrics 调用时按 Prometheus 文本格式输出。
+采集函数返回 Metric 列表，在请求线程中执行，应只读取内存中的统计数据。
+"""
+import threading
+from typing import Callable, Dict, Iterable, List, NamedTuple, Tuple
+
+
+class Metric(NamedTuple):
+    name: str
+    type: str  # counter, gauge
+    help: str
+    samples: List[Tuple[Dict[str, str], float]]
+
+
+_collectors: List[Callable[[], Iterable[Metric]]] = []
+_collectors_lock = threading.Lock()
+
+
+def register_collector(collector: Callable[[], Iterable[Metric]]) -> None:
+    """注册采集函数，重复注册同一函数时忽略"""
+    with _collectors_lock:
+        if collector not in _collectors:
+            _collectors.append(collector)
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def render() -> str:
+    """按 Prometheus 文本格式输出所有指标"""
+    lines = []
+    for collector in list(_collectors):
+        for metric in collector():
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            for labels, value in metric.samples:
+                label_text = ','.join(f'{key}="{_escape(str(val))}"' for key, val in labels.items())
+                lines.append(f'{metric.name}{{{label_text}}} {value}' if label_text else f'{metric.name} {value}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,17 @@
+"""NDJSON 解析工具模块"""
+import json
+from typing import IO, Iterator
+
+
+def parse_ndjson(stream: IO) -> Iterator:
+    """逐行解析 NDJSON 流，跳过空行，无法解析的行产出 None"""
+    for line in stream:
+        if isinstance(line, bytes):
+            line = line.decode('utf-8', errors='replace')
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield None
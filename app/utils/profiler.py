@@ -0,0 +1,97 @@
+"""采样分析器模块
+
+后台线程定期通过 sys._current_frames() 读取正在处理请求的线程的调用栈，按
+Flask 接口名作为根帧折叠计数，输出可直接交给 flamegraph.pl / speedscope 的折叠栈文本。
+
+不使用 SIGPROF 信号：信号处理函数只在主线程执行，无法采到 gthread worker 中其他线程的栈。
+采样线程按自身消耗的 CPU 时间自适应放宽采样间隔，保证开销不超过 PROFILER_MAX_OVERHEAD；
+同一进程同一时间只允许一个采样。
+"""
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Optional
+from flask import request
+
+# 线程 ID -> 正在处理的接口名
+_request_threads = {}
+_profile_lock = threading.Lock()
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    module = frame.f_globals.get('__name__', '?')
+    return f"{module}.{getattr(code, 'co_qualname', code.co_name)}"
+
+
+class SamplingProfiler:
+    """基于线程的栈采样器"""
+
+    def __init__(self, interval: float, max_overhead: float, max_depth: int = 64):
+        self.interval = interval
+        self.max_overhead = max_overhead
+        self.max_depth = max_depth
+        self.stacks = Counter()
+        self.samples = 0
+        self.sampling_time = 0.0
+        self.elapsed = 0.0
+
+    def run(self, seconds: float, exclude_thread: Optional[int] = None) -> Counter:
+        """在当前线程中采样 seconds 秒，exclude_thread 的栈不采集（通常是发起采样的请求线程）"""
+        started = time.monotonic()
+        deadline = started + seconds
+        while True:
+            cpu_start = time.thread_time()
+            self.sample(exclude_thread)
+            cost = time.thread_time() - cpu_start
+            self.sampling_time += cost
+            self.samples += 1
+            # 采样耗时 cost 时，至少等待 cost / max_overhead 才能把开销控制在上限以内
+            delay = max(self.interval, cost / self.max_overhead) - cost
+            now = time.monotonic()
+            if now + delay >= deadline:
+                break
+            time.sleep(delay)
+        self.elapsed = time.monotonic() - started
+        return self.stacks
+
+    def sample(self, exclude_thread: Optional[int] = None) -> None:
+        frames = sys._current_frames()
+        for thread_id, endpoint in list(_request_threads.items()):
+            frame = frames.get(thread_id)
+            if frame is None or thread_id == exclude_thread:
+                continue
+            names = []
+            while frame is not None and len(names) < self.max_depth:
+                names.append(_frame_name(frame))
+                frame = frame.f_back
+            names.append(endpoint)
+            self.stacks[';'.join(reversed(names))] += 1
+
+    def collapsed(self) -> str:
+        """折叠栈格式：每行为分号分隔的调用栈和采样次数"""
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+def try_acquire() -> bool:
+    """获取进程内的采样锁，已有采样在进行时返回 False"""
+    return _profile_lock.acquire(blocking=False)
+
+
+def release() -> None:
+    _profile_lock.release()
+
+
+def _before_request():
+    _request_threads[threading.get_ident()] = request.endpoint or '<unmatched>'
+
+
+def _teardown_request(exc):
+    _request_threads.pop(threading.get_ident(), None)
+
+
+def init_profiler(app):
+    """登记各线程正在处理的接口，供采样时标记调用栈"""
+    app.before_request(_before_request)
+    app.teardown_request(_teardown_request)
@@ -0,0 +1,91 @@
+"""接口限流模块
+
+视图函数用 ``@rate_limit(name)`` 标记限流规则名称，规则在配置 RATELIMITS 中定义。
+检查在 before_request 中进行，早于请求体解析和数据库访问；超过限制时返回 429 和 Retry-After。
+令牌桶保存在共享内存中（见 app.utils.shm），同一台机器上的 gunicorn worker 共享限额。
+"""
+import math
+import os
+import tempfile
+import threading
+from flask import current_app, request
+from flask_jwt_extended import decode_token
+from app.utils.response import Response
+from app.utils.shm import SharedTokenBuckets
+
+_buckets = None
+_buckets_lock = threading.Lock()
+
+
+def rate_limit(name: str):
+    """为视图函数指定限流规则名称，需放在路由装饰器之后（紧贴路由装饰器）"""
+    def decorator(func):
+        func.rate_limit = name
+        return func
+    return decorator
+
+
+def default_shm_path() -> str:
+    """默认的共享内存文件路径"""
+    directory = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return os.path.join(directory, 'box-ratelimit')
+
+
+def _get_buckets() -> SharedTokenBuckets:
+    # worker fork 之后再打开映射
+    global _buckets
+    with _buckets_lock:
+        if _buckets is None:
+            _buckets = SharedTokenBuckets(
+                current_app.config['RATELIMIT_SHM_PATH'] or default_shm_path(),
+                current_app.config['RATELIMIT_SLOTS']
+            )
+        return _buckets
+
+
+def _client_key(scope: str) -> str:
+    """按限流维度计算客户端标识，user 维度在没有有效 token 时退化为按 IP"""
+    if scope == 'global':
+        return 'global'
+    if scope == 'user':
+        auth = request.headers.get('Authorization', '')
+        if auth.startswith('Bearer '):
+            try:
+                return f"user:{decode_token(auth[7:])['sub']}"
+            except Exception:
+                pass
+    return f'ip:{request.remote_addr}'
+
+
+def check_rate_limit():
+    """before_request 钩子：按视图函数标记的规则限流"""
+    if not current_app.config['RATELIMIT_ENABLED'] or request.method == 'OPTIONS':
+        return None
+    view = current_app.view_functions.get(request.endpoint)
+    name = getattr(view, 'rate_limit', None)
+    if name is None:
+        return None
+
+    buckets = _get_buckets()
+    retry_after = 0.0
+    acquired = []
+    for scope, count, seconds in current_app.config['RATELIMITS'].get(name, ()):
+        key = f'{name}:{_client_key(scope)}'
+        allowed, wait = buckets.acquire(key, count, count / seconds)
+        if allowed:
+            acquired.append((key, count))
+        else:
+            retry_after = max(retry_after, wait)
+    if retry_after:
+        # 被拒绝的请求不消耗其他桶的令牌
+        for key, count in acquired:
+            buckets.refund(key, count)
+        response, status = Response.error('请求过于频繁，请稍后重试', 429)
+        response.headers['Retry-After'] = str(max(math.ceil(retry_after), 1))
+        return response, status
+    return None
+
+
+def init_rate_limiter(app):
+    """注册限流检查"""
+    app.before_request(check_rate_limit)
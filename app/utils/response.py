@@ -1,5 +1,10 @@
-from flask import jsonify
+import uuid
+from flask import current_app
 from typing import Any, Dict, List, Optional, Union
+from app.utils import wire
+from app.utils.fragment_cache import JsonFragments
+from app.utils.memory import checkpoint
+from app.utils.timing import phase
 
 class Response:
     """统一的响应格式工具类"""
@@ -12,7 +17,21 @@ class Response:
             "message": message,
             "data": data
         }
-        return jsonify(response)
+        checkpoint()
+        with phase('serialize'):
+            return Response._render(response)
+    
+    @staticmethod
+    def accepted(data: Optional[Union[Dict, List]] = None, message: str = "请求已接受") -> Dict:
+        """已接受、由后台任务处理的响应"""
+        response = {
+            "code": 202,
+            "message": message,
+            "data": data
+        }
+        checkpoint()
+        with phase('serialize'):
+            return Response._render(response), 202
     
     @staticmethod
     def error(message: str, code: int = 400, data: Optional[Dict] = None) -> Dict:
@@ -22,7 +41,37 @@ class Response:
             "message": message,
             "data": data
         }
-        return jsonify(response), code
+        with phase('serialize'):
+            return Response._render(response), code
+    
+    @staticmethod
+    def _render(response: Dict):
+        """按 Accept 头协商的格式编码响应，默认 JSON"""
+        fmt = wire.negotiate()
+        if fmt == wire.JSON:
+            result = Response._render_json(response)
+        else:
+            result = current_app.response_class(wire.encode(response, fmt), mimetype=fmt)
+        result.vary.add('Accept')
+        return result
+    
+    @staticmethod
+    def _render_json(response: Dict):
+        """JSON 编码，数据中的 JsonFragments 直接拼接已编码的片段"""
+        fragments = []
+        # 每次调用使用随机的占位字符串，数据中的字符串无法预先构造出相同的占位
+        sentinel = uuid.uuid4().hex
+        
+        def default(obj):
+            if isinstance(obj, JsonFragments):
+                fragments.append(obj)
+                return f'{sentinel}:{len(fragments) - 1}'
+            return current_app.json.default(obj)
+        
+        body = current_app.json.dumps(response, default=default)
+        for index, obj in enumerate(fragments):
+            body = body.replace(f'"{sentinel}:{index}"', obj.to_json(), 1)
+        return current_app.response_class(body + '\n', mimetype=current_app.json.mimetype)
     
     @staticmethod
     def forbidden(message: str = "权限不足") -> Dict:
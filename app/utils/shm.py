@@ -0,0 +1,270 @@
+"""共享内存模块
+
+令牌桶、实体缓存和授权缓存代数保存在 mmap 映射的文件中，同一台机器上的多个 worker 进程共享同一份状态。
+文件由固定数量的槽组成，键的哈希值决定起始槽，在相邻的 PROBE_SLOTS 个槽中线性探测；
+探测范围内没有空槽时覆盖最久未使用的槽（令牌桶相当于重置为满，缓存相当于淘汰）。
+
+进程之间用 fcntl 字节范围锁互斥，进程内的线程之间用线程锁互斥；没有 fcntl 的平台上
+只在进程内共享。
+
+文件位于 /dev/shm 等公共目录，打开时要求属主为当前用户、权限为 0600，拒绝其他用户预先创建的文件。
+"""
+import hashlib
+import mmap
+import os
+import stat
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+# 槽结构：键哈希（0 表示空槽）、剩余令牌数、最后更新时间，补齐到 32 字节
+SLOT = struct.Struct('<Qdd8x')
+# 每个键探测的槽数
+PROBE_SLOTS = 4
+
+# 缓存槽头部：键哈希、版本号、过期时间、最后失效时间、数据长度、类型，之后是数据
+CACHE_HEADER = struct.Struct('<QQddIB3x')
+# 缓存文件第 0 个槽保存元数据：下一个版本号、被淘汰的槽中最晚的失效时间
+CACHE_META = struct.Struct('<Qd')
+# 缓存槽类型：无数据（只有版本号）、有数据、确认不存在
+CACHE_EMPTY, CACHE_VALUE, CACHE_MISSING = 0, 1, 2
+# 键不在表中时返回的版本号标记
+CACHE_ABSENT = 1 << 63
+
+# 计数器文件只有一个 8 字节的槽
+COUNTER = struct.Struct('<Q')
+
+
+def _key_hash(key: str) -> int:
+    # 内置 hash() 在每个进程中随机化，不能用于跨进程共享
+    value = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'little')
+    return value or 1
+
+
+class _SlotFile:
+    """映射到内存的定长槽文件"""
+
+    def __init__(self, path: str, slots: int, slot_size: int):
+        self.path = path
+        self.slots = slots
+        self.slot_size = slot_size
+        self._thread_lock = threading.Lock()
+        size = slots * slot_size
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT | getattr(os, 'O_NOFOLLOW', 0), 0o600)
+        st = os.fstat(self._fd)
+        if hasattr(os, 'getuid') and (st.st_uid != os.getuid() or stat.S_IMODE(st.st_mode) != 0o600):
+            os.close(self._fd)
+            raise PermissionError(f'共享内存文件的属主或权限不安全（要求当前用户、0600）: {path}')
+        if st.st_size < size:
+            os.ftruncate(self._fd, size)
+        self._map = mmap.mmap(self._fd, size)
+
+    @contextmanager
+    def _locked(self, start: int):
+        """锁定探测范围内的槽"""
+        # fcntl 锁属于进程，同一进程的线程之间需要额外的线程锁
+        with self._thread_lock:
+            with self._range_locked(start, PROBE_SLOTS):
+                yield
+
+    @contextmanager
+    def _range_locked(self, start: int, count: int):
+        offset, length = start * self.slot_size, count * self.slot_size
+        if fcntl is not None:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, length, offset)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, length, offset)
+
+    def close(self) -> None:
+        self._map.close()
+        os.close(self._fd)
+
+
+class SharedTokenBuckets(_SlotFile):
+    """跨进程共享的令牌桶表"""
+
+    def __init__(self, path: str, slots: int = 65536):
+        super().__init__(path, slots, SLOT.size)
+
+    def acquire(self, key: str, capacity: float, rate: float, now: float = None) -> Tuple[bool, float]:
+        """从桶中取一个令牌
+
+        Args:
+            key: 桶的键
+            capacity: 桶容量（允许的突发请求数）
+            rate: 每秒补充的令牌数
+            now: 当前时间戳，默认为 time.time()
+
+        Returns:
+            Tuple[bool, float]: (是否允许, 不允许时需要等待的秒数)
+        """
+        now = time.time() if now is None else now
+        key_hash = _key_hash(key)
+        start = key_hash % (self.slots - PROBE_SLOTS + 1)
+        with self._locked(start):
+            index = self._find_slot(start, key_hash)
+            offset = index * SLOT.size
+            stored_hash, tokens, updated = SLOT.unpack_from(self._map, offset)
+            if stored_hash != key_hash:
+                tokens, updated = capacity, now
+            tokens = min(capacity, tokens + max(now - updated, 0) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            SLOT.pack_into(self._map, offset, key_hash, tokens, now)
+        return allowed, 0.0 if allowed else (1 - tokens) / rate
+
+    def refund(self, key: str, capacity: float) -> None:
+        """退还一个之前取出的令牌，桶已被其他键占用时忽略"""
+        key_hash = _key_hash(key)
+        start = key_hash % (self.slots - PROBE_SLOTS + 1)
+        with self._locked(start):
+            index = self._find_slot(start, key_hash)
+            offset = index * SLOT.size
+            stored_hash, tokens, updated = SLOT.unpack_from(self._map, offset)
+            if stored_hash == key_hash:
+                SLOT.pack_into(self._map, offset, key_hash, min(capacity, tokens + 1), updated)
+
+    def _find_slot(self, start: int, key_hash: int) -> int:
+        """在探测范围内查找键所在的槽，找不到时返回空槽或最久未使用的槽"""
+        oldest, oldest_time = start, float('inf')
+        for index in range(start, start + PROBE_SLOTS):
+            stored_hash, _, updated = SLOT.unpack_from(self._map, index * SLOT.size)
+            if stored_hash == key_hash:
+                return index
+            if stored_hash == 0:
+                updated = float('-inf')
+            if updated < oldest_time:
+                oldest, oldest_time = index, updated
+        return oldest
+
+
+class SharedCounter(_SlotFile):
+    """跨进程共享的递增计数器"""
+
+    def __init__(self, path: str):
+        super().__init__(path, 1, COUNTER.size)
+
+    def value(self) -> int:
+        return COUNTER.unpack_from(self._map, 0)[0]
+
+    def increment(self) -> int:
+        """加一并返回新值"""
+        with self._locked(0):
+            value = COUNTER.unpack_from(self._map, 0)[0] + 1
+            COUNTER.pack_into(self._map, 0, value)
+        return value
+
+
+class SharedCacheTable(_SlotFile):
+    """跨进程共享的缓存表
+
+    每个键带有全局递增的版本号，失效时分配新版本号并清除数据。写入数据时要求该键最后一次
+    失效早于 not_before（调用方读取数据库的事务开始时间），否则读到的可能是失效之前的旧数据，
+    放弃写入。被淘汰的键的失效时间记录在元数据中，键不在表中时按它判断。
+    """
+
+    def __init__(self, path: str, slots: int = 32768, slot_size: int = 1024):
+        super().__init__(path, slots, slot_size)
+        self.max_payload = slot_size - CACHE_HEADER.size
+
+    def read(self, key: str, now: Optional[float] = None) -> Tuple[int, int, Optional[bytes], float]:
+        """读取缓存
+
+        Returns:
+            Tuple[int, int, Optional[bytes], float]: (版本号, 槽类型, 数据, 最后失效时间)，
+            键不在表中时版本号带 CACHE_ABSENT 标记；过期的数据按 CACHE_EMPTY 返回
+        """
+        now = time.time() if now is None else now
+        key_hash = _key_hash(key)
+        start = self._start(key_hash)
+        with self._locked(start):
+            index = self._find(start, key_hash)
+            if index is None:
+                next_version, max_bumped = CACHE_META.unpack_from(self._map, 0)
+                return CACHE_ABSENT | next_version, CACHE_EMPTY, None, max_bumped
+            offset = index * self.slot_size
+            _, version, expires_at, bumped_at, length, kind = CACHE_HEADER.unpack_from(self._map, offset)
+            if kind != CACHE_EMPTY and expires_at <= now:
+                kind = CACHE_EMPTY
+            payload = None
+            if kind == CACHE_VALUE:
+                payload = bytes(self._map[offset + CACHE_HEADER.size:offset + CACHE_HEADER.size + length])
+            return version, kind, payload, bumped_at
+
+    def fill(self, key: str, kind: int, payload: bytes, ttl: float, not_before: float,
+             now: Optional[float] = None) -> Optional[int]:
+        """写入数据或不存在标记，返回写入的版本号；键在 not_before 之后失效过或数据过大时放弃写入，返回 None"""
+        if len(payload) > self.max_payload:
+            return None
+        now = time.time() if now is None else now
+        key_hash = _key_hash(key)
+        start = self._start(key_hash)
+        with self._locked(start):
+            index = self._find(start, key_hash)
+            if index is None:
+                if CACHE_META.unpack_from(self._map, 0)[1] >= not_before:
+                    return None
+                index = self._claim(start)
+                version, bumped_at = self._next_version(), 0.0
+            else:
+                _, version, _, bumped_at, _, _ = CACHE_HEADER.unpack_from(self._map, index * self.slot_size)
+                if bumped_at >= not_before:
+                    return None
+            offset = index * self.slot_size
+            CACHE_HEADER.pack_into(self._map, offset, key_hash, version, now + ttl, bumped_at, len(payload), kind)
+            self._map[offset + CACHE_HEADER.size:offset + CACHE_HEADER.size + len(payload)] = payload
+        return version
+
+    def bump(self, key: str, now: Optional[float] = None) -> int:
+        """使键失效并分配新版本号"""
+        now = time.time() if now is None else now
+        key_hash = _key_hash(key)
+        start = self._start(key_hash)
+        with self._locked(start):
+            index = self._find(start, key_hash)
+            if index is None:
+                index = self._claim(start)
+            version = self._next_version()
+            CACHE_HEADER.pack_into(self._map, index * self.slot_size, key_hash, version, 0.0, now, 0, CACHE_EMPTY)
+        return version
+
+    def _start(self, key_hash: int) -> int:
+        # 第 0 个槽是元数据
+        return 1 + key_hash % (self.slots - PROBE_SLOTS)
+
+    def _find(self, start: int, key_hash: int) -> Optional[int]:
+        for index in range(start, start + PROBE_SLOTS):
+            if CACHE_HEADER.unpack_from(self._map, index * self.slot_size)[0] == key_hash:
+                return index
+        return None
+
+    def _claim(self, start: int) -> int:
+        """返回探测范围内的空槽，没有空槽时淘汰最早过期的槽"""
+        oldest, oldest_time, oldest_bumped = start, float('inf'), 0.0
+        for index in range(start, start + PROBE_SLOTS):
+            stored_hash, _, expires_at, bumped_at, _, _ = CACHE_HEADER.unpack_from(self._map, index * self.slot_size)
+            if stored_hash == 0:
+                return index
+            if expires_at < oldest_time:
+                oldest, oldest_time, oldest_bumped = index, expires_at, bumped_at
+        with self._range_locked(0, 1):
+            next_version, max_bumped = CACHE_META.unpack_from(self._map, 0)
+            CACHE_META.pack_into(self._map, 0, next_version, max(max_bumped, oldest_bumped))
+        return oldest
+
+    def _next_version(self) -> int:
+        with self._range_locked(0, 1):
+            next_version, max_bumped = CACHE_META.unpack_from(self._map, 0)
+            CACHE_META.pack_into(self._map, 0, next_version + 1, max_bumped)
+        return next_version
@@ -0,0 +1,219 @@
+"""请求合并模块
+
+相同作用域键的并发计算只执行一次：第一个到达的请求（领头请求）执行计算，之后到达的请求等待并共享其结果。
+计算完成后不保留结果，之后到达的请求重新计算，合并只发生在计算进行期间。
+
+开启 SINGLE_FLIGHT_SHARED 后同一台机器上的 worker 之间也合并：领头请求持有按键划分的 fcntl 文件锁，
+其他 worker 的请求等待锁释放后读取领头请求以 JSON 写入共享内存目录的结果。目录的属主必须是当前用户、
+权限为 0700，否则拒绝使用。等待超过 SINGLE_FLIGHT_TIMEOUT 秒时
+不再等待，自行计算，卡住的领头请求不会一直阻塞其他请求。
+
+合并的计算应返回已序列化的数据（dict、list 等），不能返回绑定到领头请求会话的 ORM 对象。
+"""
+import hashlib
+import json
+import os
+import stat
+import tempfile
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable
+from flask import current_app
+from app.utils.fragment_cache import JsonFragments
+from app.utils.metrics import Metric, register_collector
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+# 跨 worker 锁文件中按键哈希划分的字节数
+LOCK_RANGE = 65536
+# 等待跨 worker 锁时的最长轮询间隔（秒）
+LOCK_POLL_MAX = 0.05
+
+
+def _encode(value: Any) -> bytes:
+    """结果编码为 JSON，日期时间和已编码的 JSON 片段带类型标记"""
+    def default(obj):
+        if isinstance(obj, datetime):
+            return {'$t': obj.isoformat()}
+        if isinstance(obj, JsonFragments):
+            return {'$f': obj.fragments}
+        raise TypeError(f'无法共享的结果类型: {type(obj).__name__}')
+    return json.dumps(value, default=default, separators=(',', ':')).encode()
+
+
+def _decode_value(obj: dict):
+    if '$t' in obj:
+        return datetime.fromisoformat(obj['$t'])
+    if '$f' in obj:
+        return JsonFragments(obj['$f'])
+    return obj
+
+
+def default_shm_path() -> str:
+    """默认的共享结果目录"""
+    directory = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return os.path.join(directory, 'box-singleflight')
+
+
+class _Call:
+    """进行中的计算"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """按键合并并发计算"""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._lock_fds = {}
+        self._lock_fds_lock = threading.Lock()
+        self.leaders = 0
+        self.followers = 0
+        self.shared_followers = 0
+        self.timeouts = 0
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        """执行 fn，键相同的并发调用共享同一次执行的结果或异常"""
+        config = current_app.config
+        if not config['SINGLE_FLIGHT_ENABLED']:
+            return fn()
+
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+
+        if not leader:
+            if not call.done.wait(config['SINGLE_FLIGHT_TIMEOUT']):
+                self.timeouts += 1
+                return fn()
+            self.followers += 1
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            if config['SINGLE_FLIGHT_SHARED'] and fcntl is not None:
+                call.result = self._do_shared(key, fn, config)
+            else:
+                call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def _do_shared(self, key: str, fn: Callable[[], Any], config) -> Any:
+        """持有跨 worker 锁执行计算；等待过锁时先尝试读取其他 worker 在等待期间完成的结果"""
+        arrived = time.time()
+        directory = config['SINGLE_FLIGHT_SHM_PATH'] or default_shm_path()
+        digest = hashlib.blake2b(key.encode(), digest_size=8).hexdigest()
+        result_path = os.path.join(directory, digest)
+        fd = self._get_lock_fd(directory)
+        offset = int(digest, 16) % LOCK_RANGE
+
+        acquired, waited = self._acquire(fd, offset, time.monotonic() + config['SINGLE_FLIGHT_TIMEOUT'])
+        if not acquired:
+            self.timeouts += 1
+        try:
+            if waited:
+                found, result = self._read_result(result_path, key, arrived)
+                if found:
+                    self.shared_followers += 1
+                    return result
+            result = fn()
+            if acquired:
+                self._write_result(directory, result_path, key, result, config['SINGLE_FLIGHT_TIMEOUT'])
+            return result
+        finally:
+            if acquired:
+                fcntl.lockf(fd, fcntl.LOCK_UN, 1, offset)
+
+    @staticmethod
+    def _acquire(fd: int, offset: int, deadline: float):
+        """在截止时间之前获取锁，返回 (是否获取, 是否等待过)"""
+        delay = 0.001
+        waited = False
+        while True:
+            try:
+                fcntl.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB, 1, offset)
+                return True, waited
+            except OSError:
+                waited = True
+                if time.monotonic() + delay > deadline:
+                    return False, waited
+                time.sleep(delay)
+                delay = min(delay * 2, LOCK_POLL_MAX)
+
+    @staticmethod
+    def _read_result(path: str, key: str, arrived: float):
+        """读取在 arrived 之后完成的结果，返回 (是否找到, 结果)"""
+        try:
+            with open(path, 'rb') as f:
+                stored = json.loads(f.read(), object_hook=_decode_value)
+            stored_key, finished_at, result = stored['k'], stored['t'], stored['r']
+        except (OSError, ValueError, KeyError, TypeError):
+            return False, None
+        if stored_key != key or finished_at < arrived:
+            return False, None
+        return True, result
+
+    @staticmethod
+    def _write_result(directory: str, path: str, key: str, result: Any, timeout: float) -> None:
+        """写入结果，并清理超过等待时限、不会再被读取的旧结果"""
+        now = time.time()
+        try:
+            payload = _encode({'k': key, 't': now, 'r': result})
+        except TypeError:
+            return
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(payload)
+        os.replace(tmp_path, path)
+        for entry in os.scandir(directory):
+            try:
+                if not entry.name.startswith('.') and entry.stat().st_mtime < now - timeout:
+                    os.unlink(entry.path)
+            except OSError:
+                pass
+
+    def _get_lock_fd(self, directory: str) -> int:
+        # worker fork 之后再打开锁文件
+        with self._lock_fds_lock:
+            if directory not in self._lock_fds:
+                os.makedirs(directory, mode=0o700, exist_ok=True)
+                st = os.stat(directory, follow_symlinks=False)
+                if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or stat.S_IMODE(st.st_mode) != 0o700:
+                    raise PermissionError(f'共享结果目录的属主或权限不安全（要求当前用户、0700）: {directory}')
+                self._lock_fds[directory] = os.open(os.path.join(directory, '.lock'), os.O_RDWR | os.O_CREAT, 0o600)
+            return self._lock_fds[directory]
+
+    def collect(self):
+        """metrics 采集函数"""
+        return [
+            Metric('box_single_flight_calls_total', 'counter', 'Coalesced computations by role', [
+                ({'role': 'leader'}, self.leaders),
+                ({'role': 'follower'}, self.followers),
+                ({'role': 'shared_follower'}, self.shared_followers),
+            ]),
+            Metric('box_single_flight_timeouts_total', 'counter',
+                   'Waits for a leader that timed out and computed independently', [({}, self.timeouts)]),
+        ]
+
+
+single_flight = SingleFlight()
+register_collector(single_flight.collect)
@@ -0,0 +1,180 @@
+"""Server-Timing 分阶段计时模块
+
+把请求耗时拆分为 auth（JWT 校验与撤销检查）、db（SQL 执行）、serialize（to_dict 与 jsonify）
+和其余的 app 时间，通过标准的 Server-Timing 响应头返回，浏览器开发者工具和压测工具可以直接展示。
+
+各阶段按独占时间统计：阶段内嵌套的其他阶段（例如序列化时触发的延迟加载查询）只计入内层阶段，
+各阶段之和加上 app 等于 total。携带管理员 token 的请求总是计时，其他请求按
+SERVER_TIMING_SAMPLE_RATE 采样；未被选中的请求每个计时点只多一次字典查找。
+"""
+import random
+import time
+from contextlib import ContextDecorator
+from typing import Optional
+import jwt as pyjwt
+from flask import current_app, g, has_request_context, request
+from flask_jwt_extended import get_jwt
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# 响应头中的阶段顺序
+PHASES = ('auth', 'db', 'serialize', 'app')
+# 计时器保存在请求的 environ 中：路由内嵌套的 app_context 会创建新的 g
+ENVIRON_KEY = 'box.server_timing'
+
+
+class RequestTimer:
+    """单个请求的阶段计时器"""
+
+    def __init__(self, started: float):
+        self.started = started
+        self.totals = dict.fromkeys(PHASES[:-1], 0.0)
+        self.queries = 0
+        self.sampled = False
+        self.decode_started = None
+        self._stack = []
+        self._current = None
+        self._mark = time.perf_counter()
+
+    def enter(self, name: str) -> None:
+        now = time.perf_counter()
+        if self._current is not None:
+            self.totals[self._current] += now - self._mark
+        self._stack.append(self._current)
+        self._current = name
+        self._mark = now
+
+    def exit(self) -> None:
+        if not self._stack:
+            return
+        now = time.perf_counter()
+        self.totals[self._current] += now - self._mark
+        self._current = self._stack.pop()
+        self._mark = now
+
+    def add(self, name: str, seconds: float) -> None:
+        """补记一段已经结束的阶段时间（期间没有其他阶段）"""
+        self.totals[name] += seconds
+
+    def header(self) -> str:
+        """生成 Server-Timing 头，未结束的阶段计算到当前时间"""
+        while self._stack:
+            self.exit()
+        total = time.perf_counter() - self.started
+        durations = dict(self.totals, app=max(total - sum(self.totals.values()), 0.0))
+        parts = []
+        for name in PHASES:
+            part = f'{name};dur={durations[name] * 1000:.2f}'
+            if name == 'db':
+                part += f';desc="{self.queries} queries"'
+            parts.append(part)
+        parts.append(f'total;dur={total * 1000:.2f}')
+        return ', '.join(parts)
+
+
+def current_timer() -> Optional[RequestTimer]:
+    """当前请求的计时器，未计时时返回 None"""
+    if not has_request_context():
+        return None
+    return request.environ.get(ENVIRON_KEY)
+
+
+class phase(ContextDecorator):
+    """把一段代码计入指定阶段，可作为上下文管理器或装饰器使用"""
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        timer = current_timer()
+        if timer is not None:
+            timer.enter(self.name)
+        return self
+
+    def __exit__(self, *exc):
+        timer = current_timer()
+        if timer is not None:
+            timer.exit()
+        return False
+
+
+def mark_jwt_decode() -> None:
+    """记录 JWT 解码开始的时间，由解码密钥回调调用"""
+    timer = current_timer()
+    if timer is not None:
+        timer.decode_started = time.perf_counter()
+
+
+def record_jwt_decode() -> None:
+    """把 JWT 解码耗时计入 auth 阶段，由撤销检查回调调用"""
+    timer = current_timer()
+    if timer is not None and timer.decode_started is not None:
+        timer.add('auth', time.perf_counter() - timer.decode_started)
+        timer.decode_started = None
+
+
+def _token_role() -> Optional[str]:
+    """不校验签名读取 token 中的角色，只用于决定是否计时"""
+    auth = request.headers.get('Authorization', '')
+    if not auth.startswith('Bearer '):
+        return None
+    try:
+        return pyjwt.decode(auth[7:], options={'verify_signature': False}).get('role')
+    except pyjwt.PyJWTError:
+        return None
+
+
+def _before_request():
+    if not current_app.config['SERVER_TIMING_ENABLED']:
+        return
+    sampled = random.random() < current_app.config['SERVER_TIMING_SAMPLE_RATE']
+    if sampled or _token_role() == 'admin':
+        timer = RequestTimer(g.get('request_started') or time.perf_counter())
+        timer.sampled = sampled
+        request.environ[ENVIRON_KEY] = timer
+
+
+def _after_request(response):
+    timer = current_timer()
+    if timer is None:
+        return response
+    # 未被采样的请求只有在 token 校验通过且角色为管理员时才返回计时
+    if not timer.sampled:
+        try:
+            is_admin = get_jwt().get('role') == 'admin'
+        except RuntimeError:
+            is_admin = False
+        if not is_admin:
+            return response
+    response.headers['Server-Timing'] = timer.header()
+    response.headers['Timing-Allow-Origin'] = '*'
+    return response
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    timer = current_timer()
+    if timer is not None:
+        timer.queries += 1
+        timer.enter('db')
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    timer = current_timer()
+    if timer is not None:
+        timer.exit()
+
+
+def _handle_error(exception_context):
+    timer = current_timer()
+    if timer is not None and timer._current == 'db':
+        timer.exit()
+
+
+def init_server_timing(app):
+    """注册计时钩子，需在 init_logging 之后调用"""
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(Engine, 'handle_error', _handle_error)
+    app.before_request(_before_request)
+    app.after_request(_after_request)
@@ -0,0 +1,87 @@
+"""二进制传输格式模块
+
+按 Accept 头在 JSON、MessagePack 和 CBOR 之间协商响应格式，按 Content-Type 解码请求体。
+JSON 始终是默认格式，只有客户端明确偏好二进制格式时才使用；msgpack、cbor2 为可选依赖，
+未安装时对应格式不参与协商。
+
+二进制格式下模型的日期时间字段保持为原生时间类型（MessagePack 时间戳扩展类型、CBOR 数字时间戳，
+按 UTC 编码），而不是 ISO 8601 字符串。
+"""
+from datetime import datetime, timezone
+from typing import Any, Optional
+from flask import has_request_context, request
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:  # pragma: no cover
+    cbor2 = None
+
+JSON = 'application/json'
+MSGPACK = 'application/msgpack'
+CBOR = 'application/cbor'
+
+# 其他常见写法
+ALIASES = {
+    'application/x-msgpack': MSGPACK,
+    'application/vnd.msgpack': MSGPACK,
+}
+
+ENVIRON_KEY = 'box.wire_format'
+
+
+def _msgpack_default(obj):
+    # 带时区的 datetime 由 msgpack 直接编码，这里只处理不带时区的（按 UTC）
+    if isinstance(obj, datetime):
+        if obj.tzinfo is None:
+            obj = obj.replace(tzinfo=timezone.utc)
+        return msgpack.Timestamp.from_datetime(obj)
+    raise TypeError(f'Object of type {type(obj).__name__} is not MessagePack serializable')
+
+
+_ENCODERS = {}
+_DECODERS = {}
+if msgpack is not None:
+    _ENCODERS[MSGPACK] = lambda data: msgpack.packb(data, default=_msgpack_default, use_bin_type=True, datetime=True)
+    _DECODERS[MSGPACK] = lambda body: msgpack.unpackb(body, raw=False, timestamp=3)
+if cbor2 is not None:
+    _ENCODERS[CBOR] = lambda data: cbor2.dumps(data, timezone=timezone.utc, datetime_as_timestamp=True)
+    _DECODERS[CBOR] = cbor2.loads
+
+# JSON 排在第一位，Accept 为 */* 或优先级相同时选择 JSON
+_OFFERS = [JSON] + list(_ENCODERS) + [alias for alias, name in ALIASES.items() if name in _ENCODERS]
+
+
+def negotiate() -> str:
+    """当前请求的响应格式，结果缓存在请求中"""
+    fmt = request.environ.get(ENVIRON_KEY)
+    if fmt is None:
+        fmt = request.accept_mimetypes.best_match(_OFFERS, default=JSON)
+        fmt = ALIASES.get(fmt, fmt)
+        request.environ[ENVIRON_KEY] = fmt
+    return fmt
+
+
+def native_types() -> bool:
+    """序列化时是否保留原生日期时间类型"""
+    return has_request_context() and negotiate() != JSON
+
+
+def encode(data: Any, fmt: str) -> bytes:
+    return _ENCODERS[fmt](data)
+
+
+def get_body() -> Optional[Any]:
+    """按 Content-Type 解码请求体，无法解码时返回 None"""
+    fmt = ALIASES.get(request.mimetype, request.mimetype)
+    decoder = _DECODERS.get(fmt)
+    if decoder is None:
+        return request.get_json(silent=True)
+    try:
+        return decoder(request.get_data())
+    except Exception:
+        return None
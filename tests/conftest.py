@@ -4,6 +4,7 @@ from flask_jwt_extended import create_access_token
 from app.models.user import User
 from app.models.device import DeviceUserAssociation
 from app.models.base import db
+from app.services.authz_cache import authz_cache
 
 @pytest.fixture(scope='session')
 def app():
@@ -91,3 +92,5 @@ def clean_users(app):
         # 再删除用户
         User.query.filter(User.username != 'admin').delete()
         db.session.commit()
+        # 测试中直接写库的授权不会经过服务层，清空授权范围缓存
+        authz_cache.invalidate()
@@ -1,9 +1,16 @@
 """认证 API 测试模块"""
 import pytest
 import json
-from flask_jwt_extended import create_access_token
-from app.models.user import User
+import logging
+import time
+from datetime import datetime, timedelta
+from flask_jwt_extended import create_access_token, decode_token
+from app.models.user import RevokedToken, User
 from app.models.base import db
+from app.services.auth_service import user_count_cache
+from app.services.token_service import TokenBlocklist
+from app.utils import ratelimit
+from app.utils.shm import SharedTokenBuckets
 
 @pytest.fixture
 def client(app):
@@ -235,3 +242,285 @@ def test_update_user(client, admin_token):
     data = json.loads(response.data)
     assert data['code'] == 400
     assert '用户不存在' in data['message']
+
+def test_get_users_keyset_and_search(client, admin_token):
+    """测试用户列表键集分页、前缀搜索与总数缓存"""
+    with client.application.app_context():
+        User.query.filter(User.username != 'admin').delete()
+        db.session.commit()
+        for i in range(5):
+            user = User(username=f'keyset{i}', email=f'k{i}@corp.example.com', role='user')
+            user.set_password('password123')
+            db.session.add(user)
+        db.session.commit()
+    user_count_cache.clear()
+
+    headers = {'Authorization': f'Bearer {admin_token}'}
+    data = client.get('/api/auth/users?per_page=4', headers=headers).get_json()['data']
+    assert data['total'] == 6
+    assert len(data['items']) == 4
+    assert data['next_after'] == data['items'][-1]['id']
+
+    data = client.get(f"/api/auth/users?per_page=4&after={data['next_after']}", headers=headers).get_json()['data']
+    assert [item['username'] for item in data['items']] == ['keyset3', 'keyset4']
+    assert data['next_after'] is None
+
+    # 按用户名或邮箱前缀搜索，通配符按字面匹配
+    data = client.get('/api/auth/users?q=keyset', headers=headers).get_json()['data']
+    assert data['total'] == 5
+    data = client.get('/api/auth/users?q=k1@', headers=headers).get_json()['data']
+    assert [item['username'] for item in data['items']] == ['keyset1']
+    data = client.get('/api/auth/users?q=k%25', headers=headers).get_json()['data']
+    assert data['items'] == []
+
+    # 新用户注册后先返回缓存的总数，后台刷新后更新
+    client.post('/api/auth/register', json={
+        'username': 'keyset5', 'email': 'k5@corp.example.com', 'password': 'password123'
+    })
+    assert client.get('/api/auth/users', headers=headers).get_json()['data']['total'] == 6
+    deadline = time.time() + 5
+    while time.time() < deadline:
+        if client.get('/api/auth/users', headers=headers).get_json()['data']['total'] == 7:
+            break
+        time.sleep(0.05)
+    else:
+        pytest.fail('用户总数没有在后台刷新')
+
+def test_bulk_create_users(client, admin_token, app):
+    """测试批量创建用户的冲突检查、并行哈希与逐条结果"""
+    with client.application.app_context():
+        User.query.filter(User.username != 'admin').delete()
+        db.session.commit()
+        existing = User(username='bulk-existing', email='existing@corp.example.com', role='user')
+        existing.set_password('password123')
+        existing.save()
+
+    records = [{'username': f'bulk{i}', 'email': f'bulk{i}@corp.example.com', 'password': f'pw-{i}'} for i in range(6)]
+    records += [
+        {'username': 'bulk0', 'email': 'other@corp.example.com', 'password': 'x'},
+        {'username': 'bulk-existing', 'email': 'new@corp.example.com', 'password': 'x'},
+        {'username': 'bulk-new', 'email': 'existing@corp.example.com', 'password': 'x'},
+        {'username': 'bulk-nopass', 'email': 'nopass@corp.example.com'},
+        {'username': 'bulk-role', 'email': 'role@corp.example.com', 'password': 'x', 'role': 'root'},
+        {'username': 123, 'email': 'int@corp.example.com', 'password': 'x'},
+        {'username': 'bulk-list', 'email': ['list@corp.example.com'], 'password': 'x'},
+    ]
+    headers = {'Authorization': f'Bearer {admin_token}'}
+    app.config.update(USER_BULK_BATCH_SIZE=4, USER_BULK_HASH_WORKERS=2)
+    try:
+        response = client.post('/api/auth/users/bulk', json={'users': records}, headers=headers)
+    finally:
+        app.config.update(USER_BULK_BATCH_SIZE=500, USER_BULK_HASH_WORKERS=None)
+    assert response.status_code == 200
+    data = response.get_json()['data']
+    assert data['created'] == 6
+    assert data['failed'] == 7
+    assert [item['index'] for item in data['items']] == list(range(13))
+    assert [item.get('error') for item in data['items'][6:]] == [
+        '用户名重复', '用户名已存在', '邮箱已存在', '缺少必要字段', '无效的角色', '字段类型无效', '字段类型无效'
+    ]
+    assert data['items'][11]['username'] is None
+    assert all(item['id'] for item in data['items'][:6])
+
+    # 并行计算的密码哈希可以正常登录
+    response = client.post('/api/auth/login', json={'username': 'bulk5', 'password': 'pw-5'})
+    assert response.status_code == 200
+
+    # NDJSON 流式上传
+    body = '{"username": "bulk-stream", "email": "stream@corp.example.com", "password": "x"}\n\nnot json\n'
+    response = client.post('/api/auth/users/bulk', data=body, headers={
+        **headers, 'Content-Type': 'application/x-ndjson'
+    })
+    data = response.get_json()['data']
+    assert [item['status'] for item in data['items']] == ['created', 'failed']
+    assert data['items'][1]['error'] == '无效的记录'
+
+def test_token_revocation(client, admin_token, app):
+    """测试退出登录、管理员撤销 token 与多进程同步"""
+    with client.application.app_context():
+        User.query.filter_by(username='revoke-user').delete()
+        db.session.commit()
+        user = User(username='revoke-user', email='revoke@example.com', role='user')
+        user.set_password('password123')
+        user.save()
+
+    def login():
+        response = client.post('/api/auth/login', json={'username': 'revoke-user', 'password': 'password123'})
+        return {'Authorization': f"Bearer {response.get_json()['data']['token']}"}
+
+    # 退出登录后当前 token 失效
+    headers = login()
+    assert client.get('/api/auth/profile', headers=headers).status_code == 200
+    assert client.post('/api/auth/logout', headers=headers).status_code == 200
+    response = client.get('/api/auth/profile', headers=headers)
+    assert response.status_code == 401
+    assert response.get_json()['message'] == 'Token 已被撤销'
+
+    # 管理员撤销泄露的 token
+    headers = login()
+    token = headers['Authorization'].split(' ')[1]
+    admin_headers = {'Authorization': f'Bearer {admin_token}'}
+    response = client.post('/api/auth/tokens/revoke', json={'token': token}, headers=admin_headers)
+    assert response.status_code == 200
+    response = client.post('/api/auth/tokens/revoke', json={'token': token}, headers=admin_headers)
+    assert response.status_code == 400
+    assert client.get('/api/auth/profile', headers=headers).status_code == 401
+    response = client.post('/api/auth/tokens/revoke', json={'jti': 'x'}, headers=headers)
+    assert response.status_code == 401
+
+    # 其他进程通过增量同步看到撤销记录，过期记录不会加载
+    with app.app_context():
+        db.session.add(RevokedToken(jti='expired-jti', expires_at=datetime.utcnow() - timedelta(seconds=1)))
+        db.session.commit()
+        other = TokenBlocklist()
+        assert other.is_revoked(decode_token(token)['jti'])
+        assert not other.is_revoked('expired-jti')
+
+        # 先提交的记录 ID 更大时，ID 较小、之后才提交的记录在下次同步时补上
+        last_id = db.session.query(db.func.max(RevokedToken.id)).scalar()
+        expires_at = datetime.utcnow() + timedelta(hours=1)
+        db.session.add(RevokedToken(id=last_id + 2, jti='late-2', expires_at=expires_at))
+        db.session.commit()
+        other.sync()
+        assert other.is_revoked('late-2')
+        db.session.add(RevokedToken(id=last_id + 1, jti='late-1', expires_at=expires_at))
+        db.session.commit()
+        other.sync()
+        assert other.is_revoked('late-1')
+
+def test_login_rate_limit(client, app, tmp_path):
+    """测试登录按 IP 限流及多个 worker 共享令牌桶"""
+    shm_path = str(tmp_path / 'ratelimit')
+    limits = app.config['RATELIMITS']
+    app.config.update(
+        RATELIMIT_ENABLED=True,
+        RATELIMIT_SHM_PATH=shm_path,
+        RATELIMITS={'auth_login': [('global', 5, 60), ('ip', 3, 60)]}
+    )
+    ratelimit._buckets = None
+    try:
+        statuses = [
+            client.post('/api/auth/login', json={'username': 'nobody', 'password': 'x'}).status_code
+            for _ in range(3)
+        ]
+        assert statuses == [401, 401, 401]
+
+        # 超过限额时在解析请求体之前拒绝
+        response = client.post('/api/auth/login', data='not json', content_type='application/json')
+        assert response.status_code == 429
+        assert 1 <= int(response.headers['Retry-After']) <= 20
+
+        # 其他 IP 不受影响，被拒绝的请求已退还全局桶的令牌
+        for _ in range(2):
+            response = client.post('/api/auth/login', json={'username': 'nobody', 'password': 'x'},
+                                   environ_base={'REMOTE_ADDR': '10.0.0.9'})
+            assert response.status_code == 401
+
+        # 另一个进程映射同一文件，看到相同的令牌桶
+        other = SharedTokenBuckets(shm_path, app.config['RATELIMIT_SLOTS'])
+        allowed, wait = other.acquire('auth_login:ip:127.0.0.1', 3, 3 / 60)
+        assert not allowed and wait > 0
+        allowed, _ = other.acquire('auth_login:ip:127.0.0.1', 3, 3 / 60, now=time.time() + 20)
+        assert allowed
+        other.close()
+    finally:
+        app.config.update(RATELIMIT_ENABLED=False, RATELIMIT_SHM_PATH=None, RATELIMITS=limits)
+        ratelimit._buckets = None
+
+def test_rate_limit_behind_proxy(client, app, tmp_path, monkeypatch):
+    """测试经由可信代理时按 X-Forwarded-For 中的客户端 IP 限流"""
+    from werkzeug.middleware.proxy_fix import ProxyFix
+    from config import config
+    assert config['production'].PROXY_FIX_X_FOR == 1
+    limits = app.config['RATELIMITS']
+    app.config.update(
+        RATELIMIT_ENABLED=True,
+        RATELIMIT_SHM_PATH=str(tmp_path / 'ratelimit'),
+        RATELIMITS={'auth_login': [('ip', 1, 60)]}
+    )
+    monkeypatch.setattr(app, 'wsgi_app', ProxyFix(app.wsgi_app, x_for=1))
+    ratelimit._buckets = None
+    try:
+        body = {'username': 'nobody', 'password': 'x'}
+        for forwarded, status in (('203.0.113.1', 401), ('203.0.113.1', 429), ('203.0.113.2', 401)):
+            response = client.post('/api/auth/login', json=body, headers={'X-Forwarded-For': forwarded})
+            assert response.status_code == status
+    finally:
+        app.config.update(RATELIMIT_ENABLED=False, RATELIMIT_SHM_PATH=None, RATELIMITS=limits)
+        ratelimit._buckets = None
+
+def test_structured_access_log(client, app, admin_token):
+    """测试请求 ID 与 JSON 访问日志"""
+    records = []
+    listener = app.extensions['log_listener']
+    capture = logging.Handler()
+    capture.emit = lambda record: records.append(listener.handlers[0].format(record))
+    listener.handlers = listener.handlers + (capture,)
+    app.config['LOG_ACCESS_SAMPLE_RATE'] = 1.0
+    try:
+        response = client.get('/api/auth/profile', headers={
+            'Authorization': f'Bearer {admin_token}', 'X-Request-ID': 'req-123'
+        })
+        assert response.headers['X-Request-ID'] == 'req-123'
+        response = client.get('/api/auth/profile', headers={'X-Request-ID': 'bad id!'})
+        assert len(response.headers['X-Request-ID']) == 32
+
+        deadline = time.time() + 5
+        while len(records) < 2 and time.time() < deadline:
+            time.sleep(0.01)
+    finally:
+        listener.handlers = listener.handlers[:-1]
+        app.config['LOG_ACCESS_SAMPLE_RATE'] = 0.1
+
+    entry = json.loads(records[0])
+    assert entry['logger'] == 'box.access'
+    assert entry['request_id'] == 'req-123'
+    assert entry['endpoint'] == 'api.auth.get_profile'
+    assert entry['status'] == 200
+    with app.app_context():
+        assert entry['user_id'] == decode_token(admin_token)['sub']
+    assert entry['latency_ms'] >= 0
+    assert json.loads(records[1])['status'] == 401
+
+def test_init_logging_idempotent(app, monkeypatch):
+    """测试重复初始化日志时不会叠加处理器和写入线程"""
+    from flask import Flask
+    from app.utils import log
+    # 不影响测试应用自己的写入线程和访问日志处理器
+    monkeypatch.setattr(log, '_listener', None)
+    monkeypatch.setattr(log.access_logger, 'handlers', list(log.access_logger.handlers))
+    other = Flask('box-log-test')
+    other.config.from_mapping(app.config)
+    log.init_logging(other)
+    first = other.extensions['log_listener']
+    log.init_logging(other)
+    second = other.extensions['log_listener']
+    assert first._thread is None and second._thread is not None
+    assert sum(isinstance(h, log.NonBlockingQueueHandler) for h in other.logger.handlers) == 1
+    second.stop()
+
+    from config import config
+    assert config['production'].LOG_MAX_BYTES == 0
+
+def test_server_timing(client, app, admin_token, normal_user_token):
+    """测试 Server-Timing 分阶段计时"""
+    response = client.get('/api/auth/users', headers={'Authorization': f'Bearer {admin_token}'})
+    assert response.status_code == 200
+    phases = {}
+    for part in response.headers['Server-Timing'].split(', '):
+        name, dur = part.split(';')[:2]
+        phases[name] = float(dur[4:])
+    assert list(phases) == ['auth', 'db', 'serialize', 'app', 'total']
+    assert 'queries"' in response.headers['Server-Timing']
+    assert phases['auth'] > 0 and phases['db'] > 0 and phases['serialize'] > 0
+    assert abs(sum(phases[name] for name in ('auth', 'db', 'serialize', 'app')) - phases['total']) < 0.1
+
+    # 普通用户默认不返回，开启采样后返回
+    response = client.get('/api/auth/profile', headers={'Authorization': f'Bearer {normal_user_token}'})
+    assert 'Server-Timing' not in response.headers
+    app.config['SERVER_TIMING_SAMPLE_RATE'] = 1.0
+    try:
+        response = client.get('/api/auth/profile', headers={'Authorization': f'Bearer {normal_user_token}'})
+        assert 'total;dur=' in response.headers['Server-Timing']
+    finally:
+        app.config['SERVER_TIMING_SAMPLE_RATE'] = 0.0
@@ -0,0 +1,78 @@
+"""权限检查 API 测试模块"""
+import base64
+from flask_jwt_extended import create_access_token
+from app.models.device import Device, DeviceUserAssociation
+from app.models.base import db
+from app.services.authz_cache import AuthzCache, authz_cache
+
+def test_bulk_access_check(client, admin_token, admin_user, normal_user):
+    """测试批量权限检查"""
+    with client.application.app_context():
+        DeviceUserAssociation.query.delete()
+        Device.query.delete()
+        readable = Device(name='authz-read', ip_address='10.9.0.1', mac_address='00:11:22:33:66:01')
+        writable = Device(name='authz-write', ip_address='10.9.0.2', mac_address='00:11:22:33:66:02')
+        db.session.add_all([readable, writable])
+        db.session.commit()
+        db.session.add_all([
+            DeviceUserAssociation(device_id=readable.id, user_id=normal_user.id, permission_type='read'),
+            DeviceUserAssociation(device_id=writable.id, user_id=normal_user.id, permission_type='write')
+        ])
+        db.session.commit()
+        read_id, write_id = readable.id, writable.id
+
+    checks = [
+        [normal_user.id, read_id, 'read'],
+        [normal_user.id, read_id, 'write'],
+        {'user_id': normal_user.id, 'device_id': write_id, 'permission': 'write'},
+        [admin_user.id, write_id, 'write'],
+        [admin_user.id, write_id + 1000, 'read'],
+        [999999, read_id, 'read']
+    ]
+    headers = {'Authorization': f'Bearer {admin_token}'}
+
+    response = client.post('/api/authz/check?format=array', json={'checks': checks}, headers=headers)
+    assert response.status_code == 200
+    data = response.get_json()['data']
+    assert data['results'] == [1, 0, 1, 1, 0, 0]
+    assert data['allowed'] == 3
+
+    response = client.post('/api/authz/check', json={'checks': checks}, headers=headers)
+    bits = base64.b64decode(response.get_json()['data']['bitset'])
+    assert bits == bytes([0b00001101])
+
+    response = client.post('/api/authz/check', json={'checks': [[1, 2, 'admin']]}, headers=headers)
+    assert response.status_code == 422
+
+    with client.application.app_context():
+        token = create_access_token(identity=str(normal_user.id))
+    response = client.post('/api/authz/check', json={'checks': checks},
+                           headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 403
+
+def test_revocation_reaches_other_workers(app, normal_user):
+    """测试撤销授权后其他 worker 的授权范围缓存立即失效"""
+    with app.app_context():
+        DeviceUserAssociation.query.delete()
+        Device.query.filter(Device.name == 'authz-revoke').delete()
+        device = Device(name='authz-revoke', ip_address='10.9.1.1', mac_address='00:11:22:33:66:11')
+        db.session.add(device)
+        db.session.commit()
+        db.session.add(DeviceUserAssociation(device_id=device.id, user_id=normal_user.id, permission_type='read'))
+        db.session.commit()
+        device_id = device.id
+
+        # 另一个 worker 中的缓存实例映射同一个代数文件
+        other = AuthzCache()
+        assert other.get(normal_user.id).allows(device_id)
+        DeviceUserAssociation.query.filter_by(device_id=device_id).delete()
+        db.session.commit()
+        authz_cache.invalidate([normal_user.id])
+        assert not other.get(normal_user.id).allows(device_id)
+
+        # 本进程撤销后，未受影响用户的缓存仍然有效
+        authz_cache.get(normal_user.id)
+        misses = authz_cache.misses
+        authz_cache.discard_devices([device_id])
+        authz_cache.get(normal_user.id)
+        assert authz_cache.misses == misses
@@ -0,0 +1,67 @@
+"""诊断接口测试"""
+import threading
+import tracemalloc
+
+
+def test_profile(client, app, admin_token, normal_user_token):
+    """测试采样分析器"""
+    response = client.post('/api/_debug/profile?seconds=0.5',
+                           headers={'Authorization': f'Bearer {normal_user_token}'})
+    assert response.status_code == 403
+    response = client.post('/api/_debug/profile?seconds=3600',
+                           headers={'Authorization': f'Bearer {admin_token}'})
+    assert response.status_code == 422
+
+    # 另一个线程持续发起请求，作为被采样的负载（/profile 命中实体缓存后不访问数据库，几乎采不到）
+    stop = threading.Event()
+    def load():
+        load_client = app.test_client()
+        while not stop.is_set():
+            load_client.get('/api/devices', headers={'Authorization': f'Bearer {normal_user_token}'})
+    worker = threading.Thread(target=load)
+    worker.start()
+    try:
+        response = client.post('/api/_debug/profile?seconds=0.5',
+                               headers={'Authorization': f'Bearer {admin_token}'})
+    finally:
+        stop.set()
+        worker.join()
+
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    assert int(response.headers['X-Profile-Samples']) > 0
+    assert float(response.headers['X-Profile-Overhead']) <= app.config['PROFILER_MAX_OVERHEAD'] * 1.5
+    lines = response.get_data(as_text=True).splitlines()
+    assert lines
+    stack, count = lines[0].rsplit(' ', 1)
+    assert int(count) > 0
+    assert all(line.startswith('api.device.get_devices;') for line in lines)
+    assert not any('api.debug.profile' in line for line in lines)
+
+
+def test_memory_accounting(client, app, admin_token):
+    """测试按接口的内存分配统计"""
+    headers = {'Authorization': f'Bearer {admin_token}'}
+    app.config.update(MEMORY_PROFILING_ENABLED=True, MEMORY_CAPTURE_MIN_BYTES=0, MEMORY_CAPTURE_INTERVAL=0)
+    try:
+        client.get('/api/_debug/memory?reset=1', headers=headers)
+        for _ in range(3):
+            assert client.get('/api/devices', headers=headers).status_code == 200
+        response = client.get('/api/_debug/memory', headers=headers)
+        metrics = client.get('/api/_debug/metrics', headers=headers)
+    finally:
+        app.config.update(MEMORY_PROFILING_ENABLED=False, MEMORY_CAPTURE_MIN_BYTES=10 * 1024 * 1024,
+                          MEMORY_CAPTURE_INTERVAL=60)
+        tracemalloc.stop()
+
+    data = response.get_json()['data']
+    assert data['tracing'] is True
+    entry = next(item for item in data['endpoints'] if item['endpoint'] == 'api.device.get_devices')
+    assert entry['count'] == 3
+    assert entry['peak_max'] > 0
+    # 第一个请求之后才有历史峰值，后续请求记录分配位置
+    assert entry['sites'] and ':' in entry['sites'][0]['site']
+    assert data['worst'][0]['peak'] >= data['worst'][-1]['peak']
+
+    assert metrics.status_code == 200
+    assert 'box_request_memory_peak_bytes_max{endpoint="api.device.get_devices"}' in metrics.get_data(as_text=True)
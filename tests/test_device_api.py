@@ -1,15 +1,32 @@
 """设备 API 测试模块"""
 import pytest
+import json
+import threading
+import time
+import zlib
+from datetime import datetime
+from sqlalchemy.dialects import mysql
 from flask_jwt_extended import create_access_token
-from app.models.device import Device, DeviceUserAssociation
+from app.models.device import Device, DeviceChange, DeviceUserAssociation
 from app.models.user import User
 from app.models.base import db
+from app.services.change_service import MAX_CURSOR_GAPS, decode_cursor
+from app.services.device_service import DeviceService, device_fragments
+from app.services.entity_cache import entity_cache
+from app.services.job_service import JobService
+from app.utils import bulkhead, compression, singleflight
+from app.utils.device_filter import compile_filter, parse_filter
+from app.utils.fragment_cache import JsonFragments
+from app.utils.response import Response
+from app.utils.shm import CACHE_VALUE, SharedCacheTable
 
-def clean_device_data(app, device_name):
-    """清理设备相关数据"""
+def clean_device_data(app, device_name, mac_address='00:11:22:33:44:55'):
+    """清理设备相关数据（MAC 地址唯一，占用测试 MAC 的设备也一并清理）"""
     with app.app_context():
-        device = Device.query.filter_by(name=device_name).first()
-        if device:
+        devices = Device.query.filter(
+            (Device.name == device_name) | (Device.mac_address == mac_address)
+        ).all()
+        for device in devices:
             # 先删除关联记录
             DeviceUserAssociation.query.filter_by(device_id=device.id).delete()
             db.session.commit()
@@ -208,6 +225,24 @@ def test_batch_authorize_by_tags(client, admin_token, normal_user):
     data = response.get_json()
     assert data['code'] == 200
 
+    # 按完整标签匹配，device 不匹配 device_0 等包含它的标签
+    with client.application.app_context():
+        DeviceUserAssociation.query.delete()
+        db.session.commit()
+    headers = {'Authorization': f'Bearer {admin_token}'}
+    response = client.post('/api/devices/batch_authorize', json={
+        'tags': ['device'], 'user_id': normal_user.id
+    }, headers=headers)
+    assert response.get_json()['data']['count'] == 0
+    response = client.post('/api/devices/batch_authorize', json={
+        'tags': ['device_1'], 'user_id': normal_user.id
+    }, headers=headers)
+    assert response.get_json()['data']['count'] == 1
+    response = client.post('/api/devices/batch_authorize', json={
+        'tags': [1], 'user_id': normal_user.id
+    }, headers=headers)
+    assert response.status_code == 422
+
 def test_search_devices_by_name(client, admin_token):
     """测试按名称搜索设备"""
     # 清理并创建测试设备
@@ -442,3 +477,708 @@ def test_search_devices_combined(client, admin_token):
     assert data['code'] == 200
     assert len(data['data']['items']) == 1
     assert data['data']['items'][0]['name'] == '测试设备1'
+
+def test_filter_devices_by_expression(client, admin_token):
+    """测试过滤表达式"""
+    with client.application.app_context():
+        Device.query.delete()
+        DeviceUserAssociation.query.delete()
+        db.session.commit()
+
+        devices = [
+            Device(name='edge-01', ip_address='10.2.0.1', mac_address='00:11:22:33:44:01',
+                   status='online', tags='web,edge'),
+            Device(name='edge-02', ip_address='10.2.1.1', mac_address='00:11:22:33:44:02',
+                   status='offline', tags='web'),
+            Device(name='core-01', ip_address='10.3.0.1', mac_address='00:11:22:33:44:03',
+                   status='online', tags='webapp')
+        ]
+        for device in devices:
+            db.session.add(device)
+        db.session.commit()
+
+    headers = {'Authorization': f'Bearer {admin_token}'}
+
+    # 前缀 + 状态
+    response = client.get('/api/devices?filter=name:edge-* status:online', headers=headers)
+    assert response.status_code == 200
+    data = response.get_json()
+    assert [d['name'] for d in data['data']['items']] == ['edge-01']
+
+    # 网段
+    response = client.get('/api/devices?filter=ip:10.2.0.0/16', headers=headers)
+    assert response.status_code == 200
+    data = response.get_json()
+    assert [d['name'] for d in data['data']['items']] == ['edge-01', 'edge-02']
+
+    # 标签为精确匹配，不匹配 webapp
+    response = client.get('/api/devices?filter=tag:web status:online', headers=headers)
+    assert response.status_code == 200
+    data = response.get_json()
+    assert [d['name'] for d in data['data']['items']] == ['edge-01']
+
+    # 前缀按 LIKE 匹配，其中的 _ 等通配字符按字面匹配；末尾为任意字符时都不会出错
+    response = client.get('/api/devices?filter=name:edge_*', headers=headers)
+    assert response.get_json()['data']['items'] == []
+    response = client.get('/api/devices', query_string={'filter': 'name:edge-0\U0010ffff*'}, headers=headers)
+    assert response.status_code == 200 and response.get_json()['data']['items'] == []
+    indexed, _ = compile_filter(parse_filter('name:edge-z*'))
+    assert 'LIKE' in str(indexed[0].compile(dialect=mysql.dialect()))
+
+    # 前导通配符和未知字段会被拒绝
+    response = client.get('/api/devices?filter=name:*edge', headers=headers)
+    assert response.status_code == 422
+    response = client.get('/api/devices?filter=description:test', headers=headers)
+    assert response.status_code == 422
+
+def test_search_devices_fulltext(client, admin_token, normal_user):
+    """测试设备全文搜索"""
+    with client.application.app_context():
+        Device.query.delete()
+        DeviceUserAssociation.query.delete()
+        db.session.commit()
+
+    headers = {'Authorization': f'Bearer {admin_token}'}
+    for i, name in enumerate(['edge-router-01', 'core-switch-01']):
+        response = client.post('/api/devices', json={
+            'name': name,
+            'ip_address': f'10.20.0.{i + 1}',
+            'mac_address': f'00:11:22:33:44:{i + 1:02x}',
+            'description': 'rack A'
+        }, headers=headers)
+        assert response.status_code == 200
+
+    response = client.get('/api/devices/search?q=router', headers=headers)
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['data']['items'][0]['name'] == 'edge-router-01'
+
+    # 按 MAC 片段搜索
+    response = client.get('/api/devices/search?q=44:02', headers=headers)
+    data = response.get_json()
+    assert data['data']['items'][0]['name'] == 'core-switch-01'
+
+    # 更新后索引同步
+    device_id = data['data']['items'][0]['id']
+    client.put(f'/api/devices/{device_id}', json={'name': 'core-firewall-01'}, headers=headers)
+    response = client.get('/api/devices/search?q=firewall', headers=headers)
+    data = response.get_json()
+    assert [d['id'] for d in data['data']['items']] == [device_id]
+
+    # 普通用户只能搜索到被授权的设备
+    with client.application.app_context():
+        token = create_access_token(identity=str(normal_user.id))
+    response = client.get('/api/devices/search?q=router',
+                          headers={'Authorization': f'Bearer {token}'})
+    assert response.get_json()['data']['items'] == []
+
+    # 关键字过短
+    response = client.get('/api/devices/search?q=ab', headers=headers)
+    assert response.status_code == 422
+
+def test_ip_range_queries(client, admin_token, normal_user):
+    """测试 IP 编码、网段过滤、网段统计与按网段批量授权"""
+    with client.application.app_context():
+        Device.query.delete()
+        DeviceUserAssociation.query.delete()
+        db.session.commit()
+
+        devices = [
+            Device(name='v4-a', ip_address='10.20.1.5', mac_address='00:11:22:33:44:01'),
+            Device(name='v4-b', ip_address='10.20.1.200', mac_address='00:11:22:33:44:02'),
+            Device(name='v4-c', ip_address='10.20.2.1', mac_address='00:11:22:33:44:03'),
+            Device(name='v6-a', ip_address='2001:DB8:0:0::1', mac_address='00:11:22:33:44:04')
+        ]
+        for device in devices:
+            db.session.add(device)
+        db.session.commit()
+
+    headers = {'Authorization': f'Bearer {admin_token}'}
+
+    # IPv6 以压缩格式保存
+    response = client.get('/api/devices?filter=ip:2001:db8::/32', headers=headers)
+    data = response.get_json()
+    assert [d['ip_address'] for d in data['data']['items']] == ['2001:db8::1']
+
+    # 非字节对齐的网段
+    response = client.get('/api/devices?filter=ip:10.20.1.128/25', headers=headers)
+    data = response.get_json()
+    assert [d['name'] for d in data['data']['items']] == ['v4-b']
+
+    # 按 /24 统计
+    response = client.get('/api/devices/subnets?prefix=24', headers=headers)
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['data']['items'] == [
+        {'subnet': '10.20.1.0/24', 'count': 2},
+        {'subnet': '10.20.2.0/24', 'count': 1}
+    ]
+
+    # 按网段批量授权
+    response = client.post('/api/devices/batch_authorize', json={
+        'cidr': '10.20.1.0/24',
+        'user_id': normal_user.id
+    }, headers=headers)
+    assert response.status_code == 200
+    assert response.get_json()['data']['count'] == 2
+
+    # 无效 IP
+    response = client.post('/api/devices', json={
+        'name': 'bad', 'ip_address': '10.20.1.256', 'mac_address': '00:11:22:33:44:05'
+    }, headers=headers)
+    assert response.status_code == 422
+
+def test_lookup_devices_by_mac(client, admin_token):
+    """测试 MAC 地址规范化、唯一性与按 MAC 查询"""
+    with client.application.app_context():
+        Device.query.delete()
+        DeviceUserAssociation.query.delete()
+        db.session.commit()
+
+    headers = {'Authorization': f'Bearer {admin_token}'}
+    response = client.post('/api/devices', json={
+        'name': 'mac_device',
+        'ip_address': '10.0.0.1',
+        'mac_address': 'AA-BB-CC-DD-EE-01'
+    }, headers=headers)
+    assert response.status_code == 200
+    device_id = response.get_json()['data']['id']
+    assert response.get_json()['data']['mac_address'] == 'aa:bb:cc:dd:ee:01'
+
+    # 不同写法的相同 MAC 不能重复创建
+    response = client.post('/api/devices', json={
+        'name': 'mac_device_dup',
+        'ip_address': '10.0.0.2',
+        'mac_address': 'aabb.ccdd.ee01'
+    }, headers=headers)
+    assert response.status_code == 400
+    assert 'MAC地址已存在' in response.get_json()['message']
+
+    response = client.get('/api/devices/by-mac/AABBCCDDEE01', headers=headers)
+    assert response.status_code == 200
+    assert response.get_json()['data']['id'] == device_id
+
+    response = client.get('/api/devices/by-mac/aa:bb:cc:dd:ee:02', headers=headers)
+    assert response.status_code == 404
+
+    response = client.post('/api/devices/by-mac', json={
+        'macs': ['aa:bb:cc:dd:ee:01', 'aa:bb:cc:dd:ee:02', 'not-a-mac']
+    }, headers=headers)
+    assert response.status_code == 200
+    data = response.get_json()['data']
+    assert data['items'] == {
+        'aa:bb:cc:dd:ee:01': device_id,
+        'aa:bb:cc:dd:ee:02': None,
+        'not-a-mac': None
+    }
+    assert data['found'] == 1
+
+    # 非字符串的 MAC 地址和非对象请求体返回 422
+    for body in ({'macs': [123]}, {'macs': [['aa']]}, ['macs']):
+        response = client.post('/api/devices/by-mac', json=body, headers=headers)
+        assert response.status_code == 422
+    response = client.post('/api/devices', json={
+        'name': 'mac_device_int', 'ip_address': '10.0.0.3', 'mac_address': 123
+    }, headers=headers)
+    assert response.status_code == 422
+    response = client.put(f'/api/devices/{device_id}', json={'mac_address': ['aa']}, headers=headers)
+    assert response.status_code == 422
+    response = client.put(f'/api/devices/{device_id}', json=['mac_address'], headers=headers)
+    assert response.status_code == 422
+
+    # 按 OUI 前缀过滤
+    response = client.get('/api/devices?filter=mac:AA:BB:CC*', headers=headers)
+    assert [d['id'] for d in response.get_json()['data']['items']] == [device_id]
+
+def test_authorize_updates_cached_scope(client, admin_token, normal_user):
+    """测试授权后缓存的授权范围原地更新"""
+    clean_device_data(client.application, 'test_device')
+    with client.application.app_context():
+        device = Device(name='test_device', ip_address='192.168.1.100', mac_address='00:11:22:33:44:55')
+        db.session.add(device)
+        db.session.commit()
+        device_id = device.id
+        token = create_access_token(identity=str(normal_user.id))
+
+    user_headers = {'Authorization': f'Bearer {token}'}
+
+    # 首次访问加载空的授权范围
+    response = client.get('/api/devices', headers=user_headers)
+    assert response.get_json()['data']['items'] == []
+
+    response = client.post(
+        f'/api/devices/{device_id}/authorize',
+        json={'user_id': normal_user.id, 'permission_type': 'write'},
+        headers={'Authorization': f'Bearer {admin_token}'}
+    )
+    assert response.status_code == 200
+
+    response = client.get('/api/devices', headers=user_headers)
+    assert [d['id'] for d in response.get_json()['data']['items']] == [device_id]
+
+    with client.application.app_context():
+        assert DeviceService.has_permission(normal_user.id, device_id, 'write')
+        assert not DeviceService.has_permission(normal_user.id, device_id + 1)
+
+def test_delete_devices(client, admin_token, normal_user):
+    """测试删除设备与按过滤条件分块批量删除"""
+    with client.application.app_context():
+        DeviceUserAssociation.query.delete()
+        Device.query.delete()
+        db.session.commit()
+        for i in range(5):
+            device = Device(name=f'purge-{i}', ip_address=f'10.30.0.{i + 1}', mac_address=f'00:11:22:33:77:{i:02x}')
+            db.session.add(device)
+            db.session.flush()
+            db.session.add(DeviceUserAssociation(device_id=device.id, user_id=normal_user.id, permission_type='read'))
+        db.session.add(Device(name='keep-0', ip_address='10.30.1.1', mac_address='00:11:22:33:77:ff'))
+        db.session.commit()
+        single_id = Device.query.filter_by(name='purge-0').first().id
+
+    headers = {'Authorization': f'Bearer {admin_token}'}
+
+    # 删除单个设备
+    response = client.delete(f'/api/devices/{single_id}', headers=headers)
+    assert response.status_code == 200
+    response = client.delete(f'/api/devices/{single_id}', headers=headers)
+    assert response.status_code == 404
+
+    # 批量删除必须指定过滤条件
+    response = client.post('/api/devices/purges', json={'filter': ''}, headers=headers)
+    assert response.status_code == 422
+
+    response = client.post('/api/devices/purges', json={'filter': 'name:purge-*'}, headers=headers)
+    assert response.status_code == 202
+    assert response.get_json()['code'] == 202
+    purge = response.get_json()['data']
+    assert purge['total'] == 4
+
+    assert purge['job_id']
+
+    # 由 worker 执行后台任务
+    with client.application.app_context():
+        assert JobService.run_pending() == 1
+    purge = client.get(f"/api/devices/purges/{purge['id']}", headers=headers).get_json()['data']
+    assert purge['status'] == 'completed'
+    assert purge['deleted_count'] == 4
+    assert purge['association_count'] == 4
+
+    with client.application.app_context():
+        assert [d.name for d in Device.query.all()] == ['keep-0']
+        assert DeviceUserAssociation.query.count() == 0
+
+def test_device_change_feed(client, admin_token, normal_user):
+    """测试设备变更增量同步、墓碑与乱序提交的序号空洞"""
+    headers = {'Authorization': f'Bearer {admin_token}'}
+    with client.application.app_context():
+        DeviceUserAssociation.query.delete()
+        Device.query.delete()
+        db.session.commit()
+
+    response = client.get('/api/devices/changes', headers=headers)
+    assert response.status_code == 200
+    cursor = response.get_json()['data']['cursor']
+
+    response = client.post('/api/devices', json={
+        'name': 'feed-0', 'ip_address': '10.50.0.1', 'mac_address': '00:11:22:33:99:00'
+    }, headers=headers)
+    device_id = response.get_json()['data']['id']
+    client.put(f'/api/devices/{device_id}', json={'description': 'rack 3'}, headers=headers)
+    client.post(f'/api/devices/{device_id}/authorize', json={'user_id': normal_user.id}, headers=headers)
+
+    # 同一设备的多次变更合并为一条，内容为当前状态
+    data = client.get(f'/api/devices/changes?since={cursor}', headers=headers).get_json()['data']
+    assert [(item['entity'], item['action']) for item in data['items']] == [('device', 'upsert'), ('association', 'upsert')]
+    assert data['items'][0]['data']['description'] == 'rack 3'
+    assert data['items'][1]['data'] == {'permission_type': 'read'}
+    assert data['has_more'] is False
+    cursor = data['cursor']
+
+    # 删除设备留下墓碑
+    client.delete(f'/api/devices/{device_id}', headers=headers)
+    data = client.get(f'/api/devices/changes?since={cursor}&limit=1', headers=headers).get_json()['data']
+    assert data['has_more'] is True
+    assert data['items'][0]['entity'] == 'association'
+    data = client.get(f"/api/devices/changes?since={data['cursor']}", headers=headers).get_json()['data']
+    assert data['items'] == [{
+        'seq': data['items'][0]['seq'], 'entity': 'device', 'action': 'delete',
+        'device_id': device_id, 'user_id': None, 'data': None
+    }]
+    cursor = data['cursor']
+    last_seq = data['items'][0]['seq']
+
+    # 序号较小的事务后提交时，仍能在下一次读取中拿到
+    with client.application.app_context():
+        db.session.add(DeviceChange(id=last_seq + 2, entity='device', action='delete', device_id=1001))
+        db.session.commit()
+    data = client.get(f'/api/devices/changes?since={cursor}', headers=headers).get_json()['data']
+    assert [item['device_id'] for item in data['items']] == [1001]
+    with client.application.app_context():
+        db.session.add(DeviceChange(id=last_seq + 1, entity='device', action='delete', device_id=1000))
+        db.session.commit()
+    data = client.get(f"/api/devices/changes?since={data['cursor']}", headers=headers).get_json()['data']
+    assert [item['device_id'] for item in data['items']] == [1000]
+    data = client.get(f"/api/devices/changes?since={data['cursor']}", headers=headers).get_json()['data']
+    assert data['items'] == []
+
+    # 空洞按区间保存，大事务留下的宽空洞在之后提交时仍能读到
+    with client.application.app_context():
+        db.session.add(DeviceChange(id=last_seq + 1000, entity='device', action='delete', device_id=1002))
+        db.session.commit()
+    data = client.get(f"/api/devices/changes?since={data['cursor']}", headers=headers).get_json()['data']
+    assert [item['device_id'] for item in data['items']] == [1002]
+    assert decode_cursor(data['cursor'])[1][0][:2] == [last_seq + 3, last_seq + 999]
+    with client.application.app_context():
+        db.session.add(DeviceChange(id=last_seq + 500, entity='device', action='delete', device_id=1003))
+        db.session.commit()
+    data = client.get(f"/api/devices/changes?since={data['cursor']}", headers=headers).get_json()['data']
+    assert [item['device_id'] for item in data['items']] == [1003]
+    assert [gap[:2] for gap in decode_cursor(data['cursor'])[1]] == [
+        [last_seq + 3, last_seq + 499], [last_seq + 501, last_seq + 999]
+    ]
+    assert len(data['cursor']) < 2048
+
+    # 空洞区间过多时不丢弃空洞，按游标过期处理
+    with client.application.app_context():
+        for i in range(MAX_CURSOR_GAPS):
+            db.session.add(DeviceChange(id=last_seq + 1002 + 2 * i, entity='device', action='delete', device_id=1004))
+        db.session.commit()
+    response = client.get(f"/api/devices/changes?since={data['cursor']}", headers=headers)
+    assert response.status_code == 410
+
+    response = client.get('/api/devices/changes?since=not-a-cursor', headers=headers)
+    assert response.status_code == 422
+
+def test_binary_wire_formats(client, admin_token):
+    """测试 MessagePack / CBOR 内容协商"""
+    msgpack = pytest.importorskip('msgpack')
+    cbor2 = pytest.importorskip('cbor2')
+    with client.application.app_context():
+        Device.query.delete()
+        DeviceUserAssociation.query.delete()
+        db.session.commit()
+
+    headers = {'Authorization': f'Bearer {admin_token}'}
+    response = client.post('/api/devices', json={
+        'name': 'wire_device',
+        'ip_address': '10.0.0.1',
+        'mac_address': 'aa:bb:cc:dd:ee:01',
+        'tags': ['rack1', 'dp']
+    }, headers=headers)
+    device_id = response.get_json()['data']['id']
+
+    # 默认和 */* 仍返回 JSON
+    response = client.get('/api/devices', headers=dict(headers, Accept='*/*'))
+    assert response.mimetype == 'application/json'
+    assert isinstance(response.get_json()['data']['items'][0]['created_at'], str)
+
+    response = client.get('/api/devices', headers=dict(headers, Accept='application/msgpack'))
+    assert response.mimetype == 'application/msgpack'
+    assert 'Accept' in response.headers['Vary']
+    item = msgpack.unpackb(response.data, timestamp=3)['data']['items'][0]
+    assert item['id'] == device_id
+    assert item['tags'] == ['rack1', 'dp']
+    assert isinstance(item['created_at'], datetime)
+
+    response = client.get('/api/devices', headers=dict(headers, Accept='application/cbor'))
+    assert response.mimetype == 'application/cbor'
+    item = cbor2.loads(response.data)['data']['items'][0]
+    assert isinstance(item['created_at'], datetime)
+
+    # 批量接口接受二进制请求体，错误响应同样按 Accept 编码
+    response = client.post('/api/devices/by-mac', data=msgpack.packb({'macs': ['aa:bb:cc:dd:ee:01']}),
+                           content_type='application/x-msgpack',
+                           headers=dict(headers, Accept='application/msgpack'))
+    assert msgpack.unpackb(response.data)['data']['items'] == {'aa:bb:cc:dd:ee:01': device_id}
+    response = client.post('/api/devices/by-mac', data=b'\xc1', content_type='application/msgpack',
+                           headers=dict(headers, Accept='application/cbor'))
+    assert response.status_code == 422
+    assert cbor2.loads(response.data)['code'] == 422
+
+def test_response_compression(client, admin_token):
+    """测试响应压缩协商与流式压缩"""
+    with client.application.app_context():
+        Device.query.delete()
+        DeviceUserAssociation.query.delete()
+        for i in range(30):
+            db.session.add(Device(name=f'zip_device_{i}', ip_address=f'10.1.0.{i}', tags='rack1,dp'))
+        db.session.commit()
+
+    headers = {'Authorization': f'Bearer {admin_token}'}
+    plain = client.get('/api/devices', headers=headers)
+    assert 'Content-Encoding' not in plain.headers
+    assert 'Accept-Encoding' in plain.headers['Vary']
+
+    response = client.get('/api/devices', headers=dict(headers, **{'Accept-Encoding': 'gzip, deflate'}))
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert int(response.headers['Content-Length']) < len(plain.data)
+    assert zlib.decompress(response.data, 31) == plain.data
+    responses = compression.compression_stats.collect()[0]
+    assert any(labels == {'encoding': 'gzip'} and count > 0 for labels, count in responses.samples)
+
+    zstandard = pytest.importorskip('zstandard')
+    response = client.get('/api/devices', headers=dict(headers, **{'Accept-Encoding': 'gzip, br, zstd'}))
+    assert response.headers['Content-Encoding'] == 'zstd'
+    assert zstandard.ZstdDecompressor().decompressobj().decompress(response.data) == plain.data
+    # 客户端权重优先于服务端顺序
+    response = client.get('/api/devices', headers=dict(headers, **{'Accept-Encoding': 'zstd;q=0.5, gzip'}))
+    assert response.headers['Content-Encoding'] == 'gzip'
+
+    # 小响应不压缩
+    response = client.get('/api/devices/by-mac/aa:bb:cc:dd:ee:99', headers=dict(headers, **{'Accept-Encoding': 'gzip'}))
+    assert 'Content-Encoding' not in response.headers
+
+    # 流式响应逐块输出
+    chunks = compression._compress_stream(iter([b'{"id": 1}\n' * 50, b'{"id": 2}\n' * 50]), 'gzip', 6)
+    first = next(chunks)
+    decompressor = zlib.decompressobj(31)
+    assert decompressor.decompress(first) == b'{"id": 1}\n' * 50
+    assert decompressor.decompress(b''.join(chunks)) == b'{"id": 2}\n' * 50
+
+def test_device_fragment_cache(client, admin_token):
+    """测试设备列表 JSON 片段缓存"""
+    with client.application.app_context():
+        Device.query.delete()
+        DeviceUserAssociation.query.delete()
+        db.session.add_all([Device(name='frag_a', tags='x'), Device(name='frag_b')])
+        db.session.commit()
+    device_fragments.clear()
+
+    headers = {'Authorization': f'Bearer {admin_token}'}
+    first = client.get('/api/devices', headers=headers).get_json()['data']
+    stats = device_fragments.stats()
+    assert stats['misses'] >= 2 and stats['entries'] == 2 and stats['bytes'] > 0
+    hits = stats['hits']
+    second = client.get('/api/devices', headers=headers).get_json()['data']
+    assert second == first
+    assert [item['tags'] for item in second['items']] == [['x'], []]
+    assert device_fragments.stats()['hits'] == hits + 2
+
+    # 本进程通过 ORM 修改立即生效
+    device_id = first['items'][0]['id']
+    client.put(f'/api/devices/{device_id}', json={'description': 'changed'}, headers=headers)
+    items = client.get('/api/devices', headers=headers).get_json()['data']['items']
+    assert items[0]['description'] == 'changed'
+
+    # 绕过 ORM 事件的修改依靠 updated_at 失效
+    with client.application.app_context():
+        db.session.execute(db.update(Device).where(Device.id == device_id).values(description='bulk'))
+        db.session.commit()
+    items = client.get('/api/devices', headers=headers).get_json()['data']['items']
+    assert items[0]['description'] == 'bulk'
+
+    # MySQL 上 updated_at 必须保留微秒，否则其他进程同一秒内的修改无法使片段失效
+    assert str(Device.__table__.c.updated_at.type.compile(dialect=mysql.dialect())) == 'DATETIME(6)'
+
+    # 数据中与旧版占位字符串相同的内容不会被替换为片段
+    with client.application.test_request_context():
+        body = Response._render_json({'detail': '\x00fragments:0', 'items': JsonFragments(['{"id":1}'])})
+    assert json.loads(body.get_data()) == {'detail': '\x00fragments:0', 'items': [{'id': 1}]}
+
+
+def test_device_entity_cache(client, admin_token):
+    """测试设备详情的实体缓存与失效"""
+    with client.application.app_context():
+        Device.query.filter(Device.name.like('entity_%')).delete()
+        device = Device(name='entity_a')
+        db.session.add(device)
+        db.session.commit()
+        device_id = device.id
+        missing_id = device_id + 1000
+    headers = {'Authorization': f'Bearer {admin_token}'}
+
+    assert client.get(f'/api/devices/{device_id}', headers=headers).get_json()['data']['name'] == 'entity_a'
+    misses = entity_cache.misses
+    assert client.get(f'/api/devices/{device_id}', headers=headers).get_json()['data']['name'] == 'entity_a'
+    assert entity_cache.misses == misses
+
+    # 通过 ORM 修改后立即失效；本地层清空后由共享层命中
+    client.put(f'/api/devices/{device_id}', json={'name': 'entity_b'}, headers=headers)
+    assert client.get(f'/api/devices/{device_id}', headers=headers).get_json()['data']['name'] == 'entity_b'
+    entity_cache.clear_local()
+    shared_hits = entity_cache.shared_hits
+    assert client.get(f'/api/devices/{device_id}', headers=headers).get_json()['data']['name'] == 'entity_b'
+    assert entity_cache.shared_hits > shared_hits
+
+    # 不存在的 ID 也缓存，创建后失效
+    assert client.get(f'/api/devices/{missing_id}', headers=headers).status_code == 404
+    misses = entity_cache.misses
+    assert client.get(f'/api/devices/{missing_id}', headers=headers).status_code == 404
+    assert entity_cache.misses == misses
+    with client.application.app_context():
+        db.session.add(Device(id=missing_id, name='entity_c'))
+        db.session.commit()
+    assert client.get(f'/api/devices/{missing_id}', headers=headers).status_code == 200
+
+    # 批量 UPDATE 使整个模型失效
+    with client.application.app_context():
+        db.session.execute(db.update(Device).where(Device.id == device_id).values(name='entity_bulk'))
+        db.session.commit()
+    assert client.get(f'/api/devices/{device_id}', headers=headers).get_json()['data']['name'] == 'entity_bulk'
+
+    # 事务开始后失效的实体，读到的数据不写入缓存
+    with client.application.app_context():
+        db.session.execute(db.select(1))
+        entity_cache.clear_local()
+        entity_cache.invalidate('devices', device_id)
+        rejected = entity_cache.rejected_fills
+        assert entity_cache.get(Device, device_id).name == 'entity_bulk'
+        assert entity_cache.rejected_fills == rejected + 1
+
+
+def test_entity_cache_shared_tier(client, app, admin_user, tmp_path):
+    """测试共享层不保存密码哈希、校验行 ID，并拒绝不安全的共享内存文件"""
+    with app.app_context():
+        entity_cache.clear_local()
+        entity_cache.invalidate('users', admin_user.id)
+        entity_cache.get(User, admin_user.id)
+        db.session.remove()
+        shared = entity_cache._get_shared()
+        generation = shared.read('gen:users')[0]
+        _, _, payload, _ = shared.read(f'users:{generation}:{admin_user.id}')
+        assert b'password_hash' not in payload and b'admin' in payload
+
+        # 缓存的用户在校验密码时从数据库加载密码哈希
+        entity_cache.clear_local()
+        user = entity_cache.get(User, admin_user.id)
+        assert 'password_hash' not in user.to_dict()
+        assert user.check_password('admin123')
+        db.session.remove()
+
+        # 槽中的数据属于其他行时按未命中处理
+        shared.fill(f'users:{generation}:999999', CACHE_VALUE, payload, 60, 0.0)
+        entity_cache.clear_local()
+        assert entity_cache.get(User, 999999) is None
+
+    path = tmp_path / 'entities'
+    path.write_bytes(b'')
+    path.chmod(0o666)
+    with pytest.raises(PermissionError):
+        SharedCacheTable(str(path), 16, 128)
+
+
+def test_single_flight_statistics(client, app, admin_token, monkeypatch, tmp_path):
+    """测试并发的相同统计请求共享一次计算"""
+    calls = []
+    started = threading.Event()
+    release = threading.Event()
+    scoped_query = DeviceService.scoped_query
+
+    def slow_scoped_query(user_id, is_admin):
+        calls.append(user_id)
+        started.set()
+        release.wait(5)
+        return scoped_query(user_id, is_admin)
+
+    monkeypatch.setattr(DeviceService, 'scoped_query', staticmethod(slow_scoped_query))
+    headers = {'Authorization': f'Bearer {admin_token}'}
+    results = []
+
+    def fetch():
+        results.append(app.test_client().get('/api/dashboard/statistics', headers=headers).get_json())
+
+    leader = threading.Thread(target=fetch)
+    leader.start()
+    assert started.wait(5)
+    followers = [threading.Thread(target=fetch) for _ in range(4)]
+    for thread in followers:
+        thread.start()
+    time.sleep(0.2)
+    release.set()
+    for thread in [leader] + followers:
+        thread.join()
+    assert len(calls) == 1
+    assert len(results) == 5 and all(result == results[0] for result in results)
+    assert results[0]['code'] == 200
+
+    # 跨 worker 模式下结果写入共享目录；计算完成后到达的请求重新计算
+    app.config.update(SINGLE_FLIGHT_SHARED=True, SINGLE_FLIGHT_SHM_PATH=str(tmp_path))
+    try:
+        assert client.get('/api/dashboard/statistics', headers=headers).get_json() == results[0]
+        assert client.get('/api/dashboard/statistics', headers=headers).status_code == 200
+        assert len(calls) == 3
+        results_files = [path for path in tmp_path.iterdir() if not path.name.startswith('.')]
+        assert results_files and json.loads(results_files[0].read_bytes())['r'] == results[0]['data']
+    finally:
+        app.config.update(SINGLE_FLIGHT_SHARED=False, SINGLE_FLIGHT_SHM_PATH=None)
+
+    # 结果以 JSON 保存，日期时间和 JSON 片段原样还原
+    value = {'at': datetime(2024, 1, 1, 12, 0, 0, 5), 'items': JsonFragments(['{"id":1}'])}
+    decoded = json.loads(singleflight._encode(value), object_hook=singleflight._decode_value)
+    assert decoded['at'] == value['at'] and decoded['items'].to_json() == '[{"id":1}]'
+
+    # 拒绝其他用户可写的共享目录
+    unsafe = tmp_path / 'unsafe'
+    unsafe.mkdir()
+    unsafe.chmod(0o777)
+    with pytest.raises(PermissionError):
+        singleflight.SingleFlight()._get_lock_fd(str(unsafe))
+
+
+def test_bulkhead_rejects_when_saturated(client, admin_token, monkeypatch):
+    """测试批量接口占满配额后快速返回 503，交互接口不受影响"""
+    compartment = bulkhead.Bulkhead('bulk', concurrency=1, queue=0, timeout=0.1)
+    monkeypatch.setitem(bulkhead._bulkheads, 'bulk', compartment)
+    headers = {'Authorization': f'Bearer {admin_token}'}
+    body = {'macs': ['00:11:22:33:44:55']}
+
+    assert compartment.acquire()
+    try:
+        response = client.post('/api/devices/by-mac', json=body, headers=headers)
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == '1'
+        assert client.get('/api/auth/profile', headers=headers).status_code == 200
+
+        # 允许排队时等待超时后返回 503
+        compartment.queue = 1
+        assert client.post('/api/devices/by-mac', json=body, headers=headers).status_code == 503
+        assert compartment.rejected == 1 and compartment.timeouts == 1
+    finally:
+        compartment.release()
+
+    assert client.post('/api/devices/by-mac', json=body, headers=headers).status_code == 200
+    assert compartment.active == 0 and compartment.admitted == 2
+    metrics = client.get('/api/_debug/metrics', headers=headers).get_data(as_text=True)
+    assert 'box_bulkhead_rejected_total{class="bulk",reason="queue_full"} 1' in metrics
+
+
+def test_batch_requests(client, admin_token):
+    """测试批量请求接口"""
+    with client.application.app_context():
+        Device.query.filter(Device.name.like('batch_%')).delete()
+        device = Device(name='batch_a')
+        db.session.add(device)
+        db.session.commit()
+        device_id = device.id
+    headers = {'Authorization': f'Bearer {admin_token}'}
+
+    response = client.post('/api/batch', json={'requests': [
+        {'id': 'profile', 'path': '/auth/profile'},
+        {'path': '/dashboard/statistics'},
+        {'path': '/devices?name=batch_a'},
+        {'method': 'PUT', 'path': f'/devices/{device_id}', 'body': {'name': 'batch_b'}},
+        {'path': f'/devices/{device_id}'},
+        {'path': '/devices/0'},
+    ]}, headers=headers)
+    assert response.status_code == 200
+    results = response.get_json()['data']['responses']
+    assert [result['status'] for result in results] == [200, 200, 200, 200, 200, 404]
+    assert results[0]['id'] == 'profile' and results[0]['body']['data']['username'] == 'admin'
+    assert results[1]['body']['data']['deviceCount'] >= 1
+    assert [item['name'] for item in results[2]['body']['data']['items']] == ['batch_a']
+    # 写子请求提交后，之后的读子请求能看到修改
+    assert results[4]['body']['data']['name'] == 'batch_b'
+    assert response.headers['X-Request-ID']
+
+    assert client.post('/api/batch', json={'requests': [{'path': '/batch'}]},
+                       headers=headers).status_code == 422
+    # 编码后的路径同样不能嵌套批量请求
+    nested = {'path': '/%62atch', 'method': 'POST', 'body': {'requests': [{'path': '/auth/profile'}]}}
+    response = client.post('/api/batch', json={'requests': [nested]}, headers=headers)
+    assert response.status_code == 200
+    assert response.get_json()['data']['responses'][0]['status'] == 422
+    assert client.post('/api/batch', json={'requests': [{'method': 'PATCH', 'path': '/auth/profile'}]},
+                       headers=headers).status_code == 422
+    too_many = [{'path': '/auth/profile'}] * (client.application.config['BATCH_MAX_REQUESTS'] + 1)
+    assert client.post('/api/batch', json={'requests': too_many}, headers=headers).status_code == 422
+    assert client.post('/api/batch', json={'requests': [{'path': '/auth/profile'}]}).status_code == 401
@@ -0,0 +1,81 @@
+"""分组授权 API 测试模块"""
+from flask_jwt_extended import create_access_token
+from app.models.device import Device, DeviceUserAssociation
+from app.models.group import DeviceGroup, DeviceGroupMember, GroupGrant, UserGroup, UserGroupMember
+from app.models.base import db
+
+def clean_group_data(app):
+    """清理分组与设备数据"""
+    with app.app_context():
+        GroupGrant.query.delete()
+        DeviceGroupMember.query.delete()
+        UserGroupMember.query.delete()
+        DeviceGroup.query.delete()
+        UserGroup.query.delete()
+        DeviceUserAssociation.query.delete()
+        Device.query.delete()
+        db.session.commit()
+
+def test_group_grant_visibility(client, admin_token, normal_user):
+    """测试分组授权后的设备可见性"""
+    clean_group_data(client.application)
+    with client.application.app_context():
+        for i in range(3):
+            db.session.add(Device(
+                name=f'web-{i}',
+                ip_address=f'10.1.0.{i + 1}',
+                mac_address=f'00:11:22:33:55:{i:02x}',
+                status='online' if i else 'offline'
+            ))
+        db.session.add(Device(name='db-0', ip_address='10.2.0.1', mac_address='00:11:22:33:55:10'))
+        db.session.commit()
+        user_token = create_access_token(identity=str(normal_user.id))
+
+    headers = {'Authorization': f'Bearer {admin_token}'}
+    user_headers = {'Authorization': f'Bearer {user_token}'}
+
+    response = client.post('/api/groups/devices', json={'name': 'web'}, headers=headers)
+    assert response.status_code == 200
+    device_group_id = response.get_json()['data']['id']
+
+    response = client.post(f'/api/groups/devices/{device_group_id}/members',
+                           json={'filter': 'name:web-*'}, headers=headers)
+    assert response.get_json()['data']['count'] == 3
+
+    response = client.post('/api/groups/users', json={'name': 'engineers'}, headers=headers)
+    user_group_id = response.get_json()['data']['id']
+    response = client.post(f'/api/groups/users/{user_group_id}/members',
+                           json={'user_ids': [normal_user.id]}, headers=headers)
+    assert response.get_json()['data']['count'] == 1
+
+    response = client.post('/api/groups/grants', json={
+        'user_group_id': user_group_id,
+        'device_group_id': device_group_id
+    }, headers=headers)
+    assert response.status_code == 200
+    grant_id = response.get_json()['data']['id']
+
+    # 分组授权与直接授权同时生效
+    with client.application.app_context():
+        device = Device.query.filter_by(name='db-0').first()
+        db.session.add(DeviceUserAssociation(device_id=device.id, user_id=normal_user.id, permission_type='read'))
+        db.session.commit()
+
+    response = client.get('/api/devices', headers=user_headers)
+    names = sorted(d['name'] for d in response.get_json()['data']['items'])
+    assert names == ['db-0', 'web-0', 'web-1', 'web-2']
+
+    response = client.get('/api/dashboard/statistics', headers=user_headers)
+    data = response.get_json()['data']
+    assert data['deviceCount'] == 4
+    assert data['statusStats'] == {'online': 2, 'offline': 2}
+
+    # 撤销分组授权后只剩直接授权的设备
+    response = client.delete(f'/api/groups/grants/{grant_id}', headers=headers)
+    assert response.status_code == 200
+    response = client.get('/api/devices', headers=user_headers)
+    assert [d['name'] for d in response.get_json()['data']['items']] == ['db-0']
+
+    # 普通用户不能管理分组
+    response = client.post('/api/groups/devices', json={'name': 'x'}, headers=user_headers)
+    assert response.status_code == 403
@@ -0,0 +1,100 @@
+"""后台任务 API 测试模块"""
+from datetime import datetime, timedelta
+from app.models.device import Device, DeviceUserAssociation
+from app.models.job import Job
+from app.models.base import db
+from app.services.job_service import JOB_HANDLERS, JobService, job_handler
+
+# 测试用任务：前两次执行失败
+flaky_calls = []
+
+@job_handler('test_flaky', max_attempts=3)
+def flaky_job(payload, context):
+    flaky_calls.append(payload['value'])
+    if len(flaky_calls) < 3:
+        raise RuntimeError('temporary failure')
+    context.progress(1, 1)
+    return {'value': payload['value'] * 2}
+
+def test_async_batch_authorize(client, admin_token, normal_user, normal_user_token):
+    """测试批量授权转为后台任务并查询结果"""
+    with client.application.app_context():
+        DeviceUserAssociation.query.delete()
+        Device.query.delete()
+        Job.query.delete()
+        for i in range(3):
+            db.session.add(Device(name=f'job-{i}', ip_address=f'10.40.0.{i + 1}',
+                                  mac_address=f'00:11:22:33:88:{i:02x}', tags='jobs'))
+        db.session.commit()
+
+    headers = {'Authorization': f'Bearer {admin_token}'}
+    response = client.post('/api/devices/batch_authorize', json={
+        'tags': ['jobs'],
+        'user_id': normal_user.id
+    }, headers={**headers, 'Prefer': 'respond-async'})
+    assert response.status_code == 202
+    assert response.get_json()['code'] == 202
+    job = response.get_json()['data']
+    assert job['status'] == 'queued'
+    assert job['total'] == 3
+
+    # 分块执行，每块之后上报进度
+    app = client.application
+    app.config['BATCH_AUTHORIZE_CHUNK_SIZE'] = 2
+    try:
+        with app.app_context():
+            assert JobService.run_pending() == 1
+    finally:
+        app.config['BATCH_AUTHORIZE_CHUNK_SIZE'] = 500
+
+    response = client.get(f"/api/jobs/{job['id']}", headers=headers)
+    assert response.status_code == 200
+    job = response.get_json()['data']
+    assert job['status'] == 'succeeded'
+    assert job['result'] == {'count': 3}
+    assert job['progress'] == 3
+    assert 'worker_id' not in job
+
+    # 非创建人的普通用户无权查看
+    response = client.get(f"/api/jobs/{job['id']}", headers={'Authorization': f'Bearer {normal_user_token}'})
+    assert response.status_code == 403
+
+    response = client.get('/api/jobs?type=batch_authorize', headers=headers)
+    assert response.get_json()['data']['total'] == 1
+
+def test_job_retry_and_concurrency(app):
+    """测试任务失败重试、租约过期接管与并发上限"""
+    with app.app_context():
+        Job.query.delete()
+        db.session.commit()
+        flaky_calls.clear()
+        app.config['JOB_RETRY_BACKOFF_SECONDS'] = 0
+        try:
+            job = JobService.enqueue('test_flaky', {'value': 21})
+            assert JobService.run_pending() == 3
+            job = db.session.get(Job, job.id, populate_existing=True)
+            assert job.status == 'succeeded'
+            assert job.attempts == 3
+            assert job.result == {'value': 42}
+            assert flaky_calls == [21, 21, 21]
+        finally:
+            app.config['JOB_RETRY_BACKOFF_SECONDS'] = 10
+
+        # 同类型已有任务持有租约时达到并发上限，不会再被抢占
+        running = JobService.enqueue('test_flaky', {'value': 1})
+        queued = JobService.enqueue('test_flaky', {'value': 2})
+        assert JobService.claim('worker-a').id == running.id
+        assert JobService.claim('worker-b') is None
+
+        # 租约过期后任务可以被其他 worker 接管，原 worker 的结果不会写回
+        Job.query.filter_by(id=running.id).update({'lease_expires_at': datetime.utcnow() - timedelta(seconds=1)})
+        db.session.commit()
+        assert JobService.claim('worker-b').id == running.id
+        JobService.execute(db.session.get(Job, running.id), 'worker-a')
+        job = db.session.get(Job, running.id, populate_existing=True)
+        assert job.status == 'running'
+        assert job.attempts == 2
+
+        Job.query.delete()
+        db.session.commit()
+    assert 'test_flaky' in JOB_HANDLERS